@@ -1,22 +1,34 @@
 from django.contrib import admin
-from django.db.models import Count, F, IntegerField, ExpressionWrapper
+from django.db.models import F, IntegerField, ExpressionWrapper
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import path
+from import_export.admin import ImportExportModelAdmin
 
-from .models import TestDate, Booking
+from . import assignment, jobs, services, stats
+from .models import TestDate, Booking, Job, SeatHold, Waitlist
+from .resources import BookingResource, TestDateResource
 
 
 @admin.register(TestDate)
-class TestDateAdmin(admin.ModelAdmin):
-    list_display = ("date", "time", "max_spots", "spots_left_display")
-    list_editable = ("max_spots", "time")
+class TestDateAdmin(jobs.ImportJobMixin, ImportExportModelAdmin):
+    resource_classes = [TestDateResource]
+    list_display = ("date", "time", "room", "proctor", "max_spots", "spots_left_display",
+                    "booked_display", "attended_display", "paid_display", "decisions_display")
+    list_editable = ("max_spots", "time", "room", "proctor")
     readonly_fields = ("spots_left_display",)
-    list_filter = ("date",)
-    ordering = ("date", "time")
-    search_fields = ("date", "time")
+    list_filter = ("date", "room", "proctor")
+    ordering = ("date", "time", "room")
+    search_fields = ("date", "time", "room", "proctor")
+
+    # ---- custom bulk action ----
+    actions = ['assign_candidates', 'publish_results']
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(booked=Count('bookings'))
-        qs = qs.annotate(spots_left_ann=ExpressionWrapper(F('max_spots') - F('booked'), output_field=IntegerField()))
+        # Counts come from the TestDateStats row (one join) rather than from Booking/User aggregates
+        qs = super().get_queryset(request).with_stats(stats.stats_relation())
+        qs = qs.annotate(spots_left_ann=ExpressionWrapper(F('max_spots') - F('booked') - F('held'),
+                                                          output_field=IntegerField()))
         return qs
 
     @admin.display(ordering='spots_left_ann', description="spots left")
@@ -26,11 +38,128 @@ class TestDateAdmin(admin.ModelAdmin):
             return obj.spots_left
         return max(int(val), 0)
 
+    def _stat(self, obj, field):
+        row = stats.stats_for(obj)
+        return getattr(row, field) if row is not None else None
+
+    @admin.display(ordering='booked', description="booked")
+    def booked_display(self, obj):
+        return self._stat(obj, 'booked')
+
+    @admin.display(description="attended")
+    def attended_display(self, obj):
+        return self._stat(obj, 'attended')
+
+    @admin.display(description="paid")
+    def paid_display(self, obj):
+        return self._stat(obj, 'paid')
+
+    @admin.display(description="decisions")
+    def decisions_display(self, obj):
+        decisions = self._stat(obj, 'decisions') or {}
+        return ", ".join(f"{decision}: {n}" for decision, n in sorted(decisions.items())) or "-"
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Extra seats go to the waitlist first; admin saves already run in a transaction
+        if change and 'max_spots' in form.changed_data:
+            services.promote_waitlist(obj.pk)
+
+    @admin.action(description="Assign candidates to rooms and proctors")
+    def assign_candidates(self, request, queryset):
+        """Preview, then apply, the assignment of candidates across parallel sessions (see app.assignment)."""
+        if 'apply' in request.POST:
+            jobs.submit_from_admin(self, request, 'assign-candidates', "Assignment queued.",
+                                   test_date_ids=list(queryset.values_list('pk', flat=True)))
+            return None
+
+        return render(
+            request,
+            'admin/assign_candidates.html',
+            {'plans': assignment.plan_assignment(list(queryset)), 'objects': queryset},
+        )
+
+    @admin.action(description="Publish results of the selected sessions")
+    def publish_results(self, request, queryset):
+        """Make the candidates' results visible and load them into the results cache in one batch."""
+        jobs.submit_from_admin(self, request, 'publish-results', "Publishing queued.",
+                               test_date_ids=list(queryset.values_list('pk', flat=True)))
+
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(jobs.ImportJobMixin, ImportExportModelAdmin):
+    resource_classes = [BookingResource]
     list_display = ("user", "test_date", "created_at")
     search_fields = ("user__username",)
     list_filter = ("test_date",)
 
+    def delete_model(self, request, obj):
+        services.cancel_booking(obj)
+
+    def delete_queryset(self, request, queryset):
+        for booking in queryset:
+            services.cancel_booking(booking)
+
+
+@admin.register(Waitlist)
+class WaitlistAdmin(admin.ModelAdmin):
+    list_display = ("user", "test_date", "created_at")
+    list_filter = ("test_date",)
+    ordering = ("test_date", "created_at")
+
+
+
+
+@admin.register(SeatHold)
+class SeatHoldAdmin(admin.ModelAdmin):
+    list_display = ("user", "test_date", "created_at", "expires_at")
+    list_filter = ("test_date",)
+    readonly_fields = ("token",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "progress_display", "message", "created_by", "created_at", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("name", "params", "status", "progress_display", "message", "result", "error",
+                       "created_by", "worker", "created_at", "started_at", "heartbeat_at", "finished_at")
+    exclude = ("progress", "total")
+    actions = ['cancel_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_cancel_permission(self, request):
+        return request.user.has_perm('app.change_job')
+
+    @admin.action(description="Cancel selected jobs", permissions=['cancel'])
+    def cancel_jobs(self, request, queryset):
+        cancelled = jobs.cancel(queryset, request.user)
+        self.message_user(request, f"{cancelled} jobs cancelled; running ones stop at their next progress report.")
+
+    @admin.display(description="progress")
+    def progress_display(self, obj):
+        if obj.total is None:
+            return "-"
+        return f"{obj.progress}/{obj.total} ({obj.percent}%)"
+
+    def get_urls(self):
+        status = self.admin_site.admin_view(self.status_view)
+        return [path('<int:pk>/status/', status, name='app_job_status')] + super().get_urls()
 
+    def status_view(self, request, pk):
+        """What the job page polls while the job runs."""
+        if not self.has_view_permission(request):
+            return JsonResponse({'detail': 'Forbidden'}, status=403)
+        job = get_object_or_404(Job, pk=pk)
+        return JsonResponse({
+            'status': job.status,
+            'progress': job.progress,
+            'total': job.total,
+            'percent': job.percent,
+            'message': job.message,
+            'error': job.error,
+        })
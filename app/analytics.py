@@ -0,0 +1,294 @@
+"""Result analytics: score histograms, decision counts and CEFR shares per cohort.
+
+Aggregates are precomputed with pandas into ResultSummary rows (one per
+session, proctor and `is_bachelor`), so a dashboard query sums a handful of
+rows instead of scanning the user table. Saving results or changing bookings
+marks the affected sessions dirty, and only those are recomputed by a
+`refresh-result-summaries` job queued when the transaction commits; the
+`refresh_result_summaries` command rebuilds everything. Both take the same
+lock, so two refreshes never write the same cohort rows at once.
+"""
+import logging
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from root.database import collect_on_commit
+from users.models import User
+from . import jobs
+from .models import Booking, Job, ResultSummary
+
+logger = logging.getLogger(__name__)
+
+SCORE_FIELDS = ('listening_score', 'gvr_score', 'writing_score', 'total_score')
+# Histogram bin width per score
+BIN_WIDTH = {'listening_score': 5, 'gvr_score': 5, 'writing_score': 5, 'total_score': 10}
+# User fields the summaries depend on; saves touching none of them skip the refresh
+RESULT_FIELDS = frozenset(SCORE_FIELDS + ('decision', 'cefr_level', 'proctor', 'is_bachelor'))
+_RESULT_FIELDS = tuple(sorted(RESULT_FIELDS))
+PASSING_DECISIONS = ('Pass', 'Conditional Pass')
+# The app.jobs task that refreshes marked sessions
+REFRESH_JOB = 'refresh-result-summaries'
+GROUP_BY = ('test_date', 'proctor', 'is_bachelor')
+
+_CANDIDATE_FIELDS = ('proctor', 'is_bachelor', 'decision', 'cefr_level') + SCORE_FIELDS
+_COLUMNS = ('user_id', 'test_date_id') + _CANDIDATE_FIELDS
+
+
+def _with_results(prefix=''):
+    fields = SCORE_FIELDS + ('decision', 'cefr_level')
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{prefix}{field}__isnull': False})
+    return condition
+
+
+def has_results(user):
+    return any(getattr(user, field) is not None for field in SCORE_FIELDS + ('decision', 'cefr_level'))
+
+
+# -------------------- SUMMARIES --------------------
+def candidate_frame(test_date_ids=None):
+    """One row per candidate with results, counted in their latest booked session.
+
+    Limited to the sessions in `test_date_ids` when given; a None in it
+    stands for candidates with results but no booking.
+    """
+    bookings = Booking.objects.filter(_with_results('user__'))
+    if test_date_ids is not None:
+        ids = [test_date_id for test_date_id in test_date_ids if test_date_id is not None]
+        # All bookings of the affected users, so a later session elsewhere still wins
+        bookings = bookings.filter(user__in=Booking.objects.filter(test_date__in=ids).values('user'))
+    rows = bookings.order_by(
+        'test_date__date', F('test_date__time').asc(nulls_first=True), 'test_date_id',
+    ).values_list('user_id', 'test_date_id', *(f'user__{field}' for field in _CANDIDATE_FIELDS))
+    booked = pd.DataFrame.from_records(list(rows), columns=_COLUMNS).drop_duplicates('user_id', keep='last')
+    if test_date_ids is not None:
+        booked = booked[booked['test_date_id'].isin(ids)]
+
+    if test_date_ids is not None and None not in test_date_ids:
+        return booked
+    unbooked = (User.objects.filter(_with_results()).filter(~Exists(Booking.objects.filter(user=OuterRef('pk'))))
+                .values_list('pk', *_CANDIDATE_FIELDS))
+    unbooked = pd.DataFrame.from_records([(pk, None, *values) for pk, *values in unbooked], columns=_COLUMNS)
+    if booked.empty:
+        return unbooked
+    if unbooked.empty:
+        return booked
+    return pd.concat([booked, unbooked], ignore_index=True)
+
+
+def _counts(series):
+    return {key: int(n) for key, n in series.value_counts().items()}
+
+
+def summarize(frame):
+    """Group a candidate frame into unsaved ResultSummary rows."""
+    frame = frame.assign(proctor=frame['proctor'].fillna(''), is_bachelor=frame['is_bachelor'].astype(bool))
+    summaries = []
+    for (test_date_id, proctor, is_bachelor), group in frame.groupby(
+            ['test_date_id', 'proctor', 'is_bachelor'], dropna=False, sort=False):
+        scores = {}
+        for field in SCORE_FIELDS:
+            values = group[field].dropna().to_numpy(dtype=np.int64)
+            scores[field] = {
+                'count': int(values.size),
+                'sum': int(values.sum()),
+                'histogram': np.bincount(values // BIN_WIDTH[field]).tolist(),
+            }
+        summaries.append(ResultSummary(
+            test_date_id=None if pd.isna(test_date_id) else int(test_date_id),
+            proctor=proctor,
+            is_bachelor=bool(is_bachelor),
+            candidates=len(group),
+            scores=scores,
+            decisions=_counts(group['decision']),
+            cefr_levels=_counts(group['cefr_level']),
+        ))
+    return summaries
+
+
+def refresh_summaries(test_date_ids=None):
+    """Recompute the summary rows of `test_date_ids` (all of them when omitted); returns the row count."""
+    with transaction.atomic():
+        summaries = summarize(candidate_frame(test_date_ids))
+        stale = ResultSummary.objects.all()
+        if test_date_ids is not None:
+            condition = Q(test_date__in=[test_date_id for test_date_id in test_date_ids if test_date_id is not None])
+            if None in test_date_ids:
+                condition |= Q(test_date__isnull=True)
+            stale = stale.filter(condition)
+        stale.delete()
+        ResultSummary.objects.bulk_create(summaries, batch_size=500)
+    return len(summaries)
+
+
+# -------------------- INCREMENTAL REFRESH --------------------
+def mark_dirty(test_date_ids=(), user_ids=()):
+    """Recompute these sessions (and the sessions of these users) in a job once the current transaction commits.
+
+    Marks made in one transaction are queued together (see
+    root.database.collect_on_commit); marks of a rolled back transaction or
+    savepoint are dropped with it.
+    """
+    items = [('test_date', test_date_id) for test_date_id in test_date_ids]
+    items += [('user', user_id) for user_id in user_ids]
+    if items:
+        collect_on_commit('result-summaries', flush, *items)
+
+
+def flush(items):
+    """Queue a `refresh-result-summaries` job for the marked items.
+
+    A refresh still waiting for a worker takes the new marks instead, so a
+    burst of bookings is refreshed in one pass rather than one per request.
+    """
+    params = {
+        'test_date_ids': {value for kind, value in items if kind == 'test_date'},
+        'user_ids': {value for kind, value in items if kind == 'user'},
+    }
+    try:
+        with transaction.atomic():
+            job = Job.objects.queued().select_for_update(skip_locked=True).filter(name=REFRESH_JOB).first()
+            if job is None:
+                jobs.submit(REFRESH_JOB, **{key: sorted(ids) for key, ids in params.items()})
+                return
+            job.params = {key: sorted(ids.union(job.params.get(key, ()))) for key, ids in params.items()}
+            job.save(update_fields=['params'])
+    except Exception as e:
+        # The summaries lag until the next change or rebuild; the results themselves are saved
+        logger.warning("Failed to queue a result summaries refresh for %s: %s", params, e)
+
+
+def refresh_dirty(test_date_ids=(), user_ids=()):
+    """Recompute the given sessions and the current sessions of the given users; returns the row count."""
+    test_date_ids, user_ids = set(test_date_ids), set(user_ids)
+    booked_users = set()
+    for user_id, test_date_id in Booking.objects.filter(user_id__in=user_ids).values_list('user_id', 'test_date_id'):
+        booked_users.add(user_id)
+        test_date_ids.add(test_date_id)
+    if user_ids - booked_users:
+        test_date_ids.add(None)
+    return refresh_summaries(test_date_ids)
+
+
+def _results(values):
+    return dict(zip(_RESULT_FIELDS, values))
+
+
+@receiver(pre_save, sender=User)
+def remember_results(sender, instance, update_fields=None, **kwargs):
+    instance._results_before = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not RESULT_FIELDS.intersection(update_fields):
+        return
+    before = User.objects.filter(pk=instance.pk).values_list(*_RESULT_FIELDS).first()
+    if before is not None:
+        instance._results_before = _results(before)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Password resets, profile edits and activations save the whole row without touching results
+    if created:
+        changed = has_results(instance)
+    else:
+        before = instance.__dict__.pop('_results_before', None)
+        changed = before is not None and before != _results(getattr(instance, f) for f in _RESULT_FIELDS)
+    if changed:
+        mark_dirty(user_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if has_results(instance):
+        mark_dirty(user_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    # Bookings of candidates without results don't move any summary
+    if Booking.user.is_cached(instance) and not has_results(instance.user):
+        return
+    # A save that moved the booking leaves its old session (see stats.remember_booking)
+    before = getattr(instance, '_booking_before', None) or ()
+    mark_dirty([instance.test_date_id, *before[:1]], [instance.user_id, *before[1:]])
+
+
+# -------------------- REPORTS --------------------
+def _histogram(bins, width):
+    return [{'from': i * width, 'to': (i + 1) * width - 1, 'count': int(n)} for i, n in enumerate(bins) if n]
+
+
+def combine(summaries):
+    """Add up summary rows into one report."""
+    candidates = 0
+    decisions, cefr_levels = Counter(), Counter()
+    totals = {field: [0, 0, np.zeros(0, dtype=np.int64)] for field in SCORE_FIELDS}
+    for summary in summaries:
+        candidates += summary.candidates
+        decisions.update(summary.decisions)
+        cefr_levels.update(summary.cefr_levels)
+        for field in SCORE_FIELDS:
+            score = summary.scores.get(field)
+            if not score:
+                continue
+            total = totals[field]
+            total[0] += score['count']
+            total[1] += score['sum']
+            histogram = np.asarray(score['histogram'], dtype=np.int64)
+            if histogram.size > total[2].size:
+                total[2] = np.pad(total[2], (0, histogram.size - total[2].size))
+            total[2][:histogram.size] += histogram
+
+    decided = sum(decisions.values())
+    graded = sum(cefr_levels.values())
+    return {
+        'candidates': candidates,
+        'scores': {
+            field: {
+                'count': count,
+                'mean': round(total / count, 2) if count else None,
+                'histogram': _histogram(bins, BIN_WIDTH[field]),
+            }
+            for field, (count, total, bins) in totals.items()
+        },
+        'decisions': dict(decisions.most_common()),
+        'pass_rate': round(sum(decisions[d] for d in PASSING_DECISIONS) / decided, 4) if decided else None,
+        'cefr_levels': {level: round(n / graded, 4) for level, n in sorted(cefr_levels.items())},
+    }
+
+
+def report(date_from=None, date_to=None, proctor=None, is_bachelor=None, group_by=None):
+    """Results report over the summary rows matching the filters, optionally broken down by `group_by`."""
+    summaries = ResultSummary.objects.select_related('test_date')
+    if date_from:
+        summaries = summaries.filter(test_date__date__gte=date_from)
+    if date_to:
+        summaries = summaries.filter(test_date__date__lte=date_to)
+    if proctor:
+        summaries = summaries.filter(proctor=proctor)
+    if is_bachelor is not None:
+        summaries = summaries.filter(is_bachelor=is_bachelor)
+    summaries = list(summaries)
+
+    result = combine(summaries)
+    if group_by:
+        groups = {}
+        for summary in summaries:
+            groups.setdefault(_group_key(summary, group_by), []).append(summary)
+        result['groups'] = [{**dict(key), **combine(rows)} for key, rows in groups.items()]
+    return result
+
+
+def _group_key(summary, group_by):
+    if group_by == 'test_date':
+        return ('test_date', summary.test_date_id), ('session', str(summary.test_date) if summary.test_date else None)
+    return ((group_by, getattr(summary, group_by)),)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Connects the booking/TestDate signal receivers that publish seat changes
+        from . import events  # noqa: F401
+        # ...and the ones that keep the result summaries and TestDateStats current
+        from . import analytics, stats  # noqa: F401
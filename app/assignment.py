@@ -0,0 +1,213 @@
+"""Spread the candidates of parallel sessions over their rooms and proctors.
+
+Sessions on the same date and time (different rooms, each with a proctor and
+a capacity) are interchangeable for a candidate, so their bookings are pooled
+and re-assigned:
+
+- no session takes more than its free capacity (max_spots minus active holds);
+- bachelor and non-bachelor cohorts get separate rooms where capacity allows;
+- candidates already assigned to a proctor (User.proctor) stay with them
+  when possible;
+- everyone else stays in the room they booked unless it is needed for
+  the other cohort; candidates who do move fill rooms evenly, relative to their size.
+
+`plan_assignment()` builds a preview without writing anything;
+`assign_sessions()` re-plans under row locks and writes the bookings and
+User.proctor with bulk_update.
+"""
+from itertools import groupby
+from operator import attrgetter
+
+import numpy as np
+from django.db import transaction
+
+from users.models import User
+from . import analytics, stats
+from .events import publish_seat_change
+from .models import TestDate, Booking
+
+# Score terms, in units of a room's fill ratio (0..1): the cohort rule beats
+# keeping a proctor, which beats staying in the booked room, which beats any imbalance.
+COHORT_PENALTY = 4.0
+REPEAT_BONUS = 2.0
+STAY_BONUS = 1.0
+
+UNPLACED = -1
+
+
+def designate_cohorts(capacity, is_bachelor, current=None):
+    """Give each session to a cohort (0 non-bachelor, 1 bachelor), largest rooms first.
+
+    A session goes to the cohort with the most candidates already booked in
+    it, unless the other cohort would then no longer fit in the remaining
+    rooms; otherwise, and without `current`, to the one with the most unmet demand.
+    """
+    cohorts = is_bachelor.astype(np.intp)
+    demand = np.bincount(cohorts, minlength=2).astype(float)
+    present = np.zeros((len(capacity), 2))
+    if current is not None:
+        placed = current != UNPLACED
+        np.add.at(present, (current[placed], cohorts[placed]), 1)
+    designated = np.zeros(len(capacity), dtype=np.intp)
+    left = capacity.sum()
+    for s in np.argsort(-capacity, kind='stable'):
+        left -= capacity[s]
+        preferred = sorted((0, 1), key=lambda c: (-present[s, c], -demand[c]))
+        cohort = next((c for c in preferred if demand[c] > 0 and demand[1 - c] <= left), int(np.argmax(demand)))
+        designated[s] = cohort
+        demand[cohort] -= capacity[s]
+    return designated
+
+
+def assign(capacity, is_bachelor, prior, current=None):
+    """Greedy assignment; returns a session index per candidate (UNPLACED when every room is full).
+
+    capacity: (m,) free seats per session; is_bachelor: (n,) bool;
+    prior: (n, m) bool, True where the candidate's previous proctor runs session s;
+    current: (n,) the session each candidate is booked in now (UNPLACED for none).
+    Candidates with a previous proctor are placed first, then those who can
+    stay where they are, so their room is not already full by the time they come up.
+    """
+    capacity = np.asarray(capacity, dtype=float)
+    is_bachelor = np.asarray(is_bachelor, dtype=bool)
+    prior = np.asarray(prior, dtype=bool)
+    n, m = prior.shape
+    choice = np.full(n, UNPLACED, dtype=np.intp)
+    if not n or not m:
+        return choice
+    current = np.full(n, UNPLACED, dtype=np.intp) if current is None else np.asarray(current, dtype=np.intp)
+
+    designated = designate_cohorts(capacity, is_bachelor, current)
+    mismatch = designated[None, :] != is_bachelor[:, None].astype(np.intp)
+    here = np.arange(m)[None, :] == current[:, None]
+    # Static part of every candidate's score, computed for all of them at once
+    base = COHORT_PENALTY * mismatch - REPEAT_BONUS * prior - STAY_BONUS * here
+    stays = (here & ~mismatch).any(axis=1)
+    order = np.lexsort((is_bachelor, ~stays, ~prior.any(axis=1)))
+
+    load = np.zeros(m)
+    room = np.maximum(capacity, 1)
+    full = capacity <= 0
+    for i in order:
+        if full.all():
+            break
+        score = base[i] + load / room
+        score[full] = np.inf
+        s = int(np.argmin(score))
+        choice[i] = s
+        load[s] += 1
+        full[s] = load[s] >= capacity[s]
+    return choice
+
+
+class GroupPlan:
+    """Proposed assignment for one set of parallel sessions (same date and time)."""
+
+    def __init__(self, sessions, bookings):
+        self.sessions = sessions
+        self.bookings = bookings
+        capacity = np.array([max(session.max_spots - session.held, 0) for session in sessions])
+        proctors = {name: code for code, name in enumerate({s.proctor for s in sessions if s.proctor})}
+        session_codes = np.array([proctors.get(s.proctor, -1) for s in sessions])
+        candidate_codes = np.array([proctors.get(b.user.proctor, -2) for b in bookings]).reshape(-1, 1)
+        self.is_bachelor = np.array([b.user.is_bachelor for b in bookings], dtype=bool)
+        self.prior = candidate_codes == session_codes[None, :]
+        index = {session.pk: s for s, session in enumerate(sessions)}
+        self.current = np.array([index[b.test_date_id] for b in bookings], dtype=np.intp)
+        self.choice = assign(capacity, self.is_bachelor, self.prior, self.current)
+        self.capacity = capacity
+
+    @property
+    def label(self):
+        first = self.sessions[0]
+        return f"{first.date} {first.time:%H:%M}" if first.time else f"{first.date}"
+
+    def rows(self):
+        """Per-session preview: capacity, load, cohort split, kept proctors and moved candidates."""
+        rows = []
+        for s, session in enumerate(self.sessions):
+            mine = self.choice == s
+            rows.append({
+                'session': session,
+                'capacity': int(self.capacity[s]),
+                'assigned': int(mine.sum()),
+                'bachelor': int((mine & self.is_bachelor).sum()),
+                'non_bachelor': int((mine & ~self.is_bachelor).sum()),
+                'kept_proctor': int((mine & self.prior[:, s]).sum()),
+                'moved_in': int((mine & (self.current != s)).sum()),
+            })
+        return rows
+
+    @property
+    def unplaced(self):
+        """Candidates left where they are because every room is full (an overbooked group)."""
+        return int((self.choice == UNPLACED).sum())
+
+
+def plan_assignment(test_dates):
+    """Plan every (date, time) group touched by `test_dates`; nothing is written."""
+    keys = {(t.date, t.time) for t in test_dates}
+    sessions = [
+        session for session in TestDate.objects.with_seat_counts()
+        .filter(date__in={date for date, _ in keys}).order_by('date', 'time', 'room', 'pk')
+        if (session.date, session.time) in keys
+    ]
+    bookings = list(Booking.objects.filter(test_date__in=sessions).select_related('user', 'test_date').order_by('pk'))
+
+    plans = []
+    for _, group in groupby(sessions, key=attrgetter('date', 'time')):
+        group = list(group)
+        group_ids = {session.pk for session in group}
+        group_bookings = [b for b in bookings if b.test_date_id in group_ids]
+        # A user booked into two parallel rooms keeps both bookings where they are
+        per_user = {}
+        for booking in group_bookings:
+            per_user[booking.user_id] = per_user.get(booking.user_id, 0) + 1
+        group_bookings = [b for b in group_bookings if per_user[b.user_id] == 1]
+        plans.append(GroupPlan(group, group_bookings))
+    return plans
+
+
+def apply(plans):
+    """Write the planned sessions to the bookings and the sessions' proctors to the users.
+
+    Call inside the transaction that locked the sessions and built `plans`
+    (see `assign_sessions`), so the plan can't go stale before it is written.
+    """
+    moved, users, moves = [], [], []
+    deltas = {}
+    for plan in plans:
+        for booking, s in zip(plan.bookings, plan.choice):
+            if s == UNPLACED:
+                continue
+            session = plan.sessions[s]
+            if booking.test_date_id != session.pk:
+                deltas[booking.test_date_id] = deltas.get(booking.test_date_id, 0) + 1
+                deltas[session.pk] = deltas.get(session.pk, 0) - 1
+                moves.append((booking.user, booking.test_date_id, session.pk))
+                booking.test_date = session
+                moved.append(booking)
+            if session.proctor and booking.user.proctor != session.proctor:
+                booking.user.proctor = session.proctor
+                users.append(booking.user)
+
+    Booking.objects.bulk_update(moved, ['test_date'], batch_size=500)
+    User.objects.bulk_update(users, ['proctor'], batch_size=500)
+    for test_date_id, delta in deltas.items():
+        if delta:
+            publish_seat_change(test_date_id, delta)
+    # bulk_update sends no signals; candidates changed rooms and proctors
+    analytics.mark_dirty([session.pk for plan in plans for session in plan.sessions])
+    stats.apply_moves(moves)
+    return len(moved), len(users)
+
+
+def assign_sessions(test_dates):
+    """Lock the affected sessions, plan and write in one transaction; returns `(plans, moved, updated_users)`."""
+    with transaction.atomic():
+        # Same pk lock order as reschedules, so the two can't deadlock
+        dates = {t.date for t in test_dates}
+        list(TestDate.objects.select_for_update().filter(date__in=dates).order_by('pk').values_list('pk'))
+        plans = plan_assignment(test_dates)
+        moved, updated_users = apply(plans)
+    return plans, moved, updated_users
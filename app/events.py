@@ -0,0 +1,255 @@
+"""Live seat availability pushed to clients over server-sent events.
+
+Every booking created or deleted (and every TestDate save) publishes
+`{"test_date": id, "delta": n}` once its transaction commits: the seats the
+date gained (positive) or lost (negative), merged into one event per date
+and transaction. A delta of 0 means the capacity may have changed and
+clients should refetch the date. Each process holds one upstream
+subscription to the broadcaster and fans events out to its own SSE clients,
+so a node with thousands of open streams still has a single Redis connection
+listening. Redis publishes go out from a background thread, so a slow or
+missing Redis never holds up the request that booked the seat.
+
+The stream needs the ASGI entry point (root/asgi.py); under WSGI every open
+stream would pin a worker thread.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+from root.database import collect_on_commit
+from .models import TestDate, Booking
+
+logger = logging.getLogger(__name__)
+
+SEAT_EVENTS_CHANNEL = 'met:seat-events'
+# Events kept for a slow client before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+# Client reconnect delay sent in the stream's `retry:` field (ms)
+RECONNECT_MS = 3000
+# Events waiting for the Redis publisher thread before new ones are dropped
+PUBLISH_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """`async with broadcaster.listen() as queue:` receives every event published while open.
+
+    A plain class rather than an @asynccontextmanager: the stream generator is
+    finalized by the event loop when a client disconnects, and a second async
+    generator nested inside it could be finalized first.
+    """
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.subscriber = None
+
+    async def __aenter__(self):
+        self.subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        with self.broadcaster._lock:
+            self.broadcaster._subscribers.add(self.subscriber)
+        try:
+            await self.broadcaster._ensure_upstream()
+        except BaseException:
+            await self.__aexit__()
+            raise
+        return self.subscriber[1]
+
+    async def __aexit__(self, *exc_info):
+        with self.broadcaster._lock:
+            self.broadcaster._subscribers.discard(self.subscriber)
+
+
+class LocalBroadcaster:
+    """In-process fan-out: single-node deployments and tests."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def listen(self):
+        return Subscription(self)
+
+    async def _ensure_upstream(self):
+        pass
+
+    def publish(self, event):
+        self._fanout(event)
+
+    def _fanout(self, event):
+        # publish() runs on request/worker threads; queues belong to their event loop
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            loop, queue = subscriber
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # The subscriber's event loop is gone without it having unsubscribed
+                with self._lock:
+                    self._subscribers.discard(subscriber)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+class RedisBroadcaster(LocalBroadcaster):
+    """Publishes through Redis pub/sub so SSE clients on every node see every change."""
+
+    def __init__(self, url, channel=SEAT_EVENTS_CHANNEL):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self._publisher = None
+        self._upstream = None
+        self._outbox = queue.Queue(PUBLISH_QUEUE_SIZE)
+        self._sender = None
+
+    def publish(self, event):
+        # Handed to the sender thread; the caller (a request's on_commit) never waits on Redis
+        if self._sender is None:
+            with self._lock:
+                if self._sender is None:
+                    self._sender = threading.Thread(target=self._send_loop, name='seat-events-publisher', daemon=True)
+                    self._sender.start()
+        try:
+            self._outbox.put_nowait(event)
+        except queue.Full:
+            logger.warning("Seat events publish queue is full, dropping %s", event)
+
+    def _send_loop(self):
+        while True:
+            event = self._outbox.get()
+            try:
+                self._send(event)
+            except Exception as e:
+                # Live updates are best effort; drop the client so the next event reconnects
+                self._publisher = None
+                logger.warning("Failed to publish seat change %s: %s", event, e)
+
+    def _send(self, event):
+        import redis
+
+        if self._publisher is None:
+            self._publisher = redis.Redis.from_url(self.url, socket_connect_timeout=2, socket_timeout=2)
+        self._publisher.publish(self.channel, json.dumps(event))
+
+    async def _ensure_upstream(self):
+        if self._upstream is None or self._upstream.done():
+            self._upstream = asyncio.get_running_loop().create_task(self._subscribe())
+
+    async def _subscribe(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._fanout(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Seat events subscription lost, reconnecting: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster():
+    backend = settings.SEAT_EVENTS_BACKEND
+    key = (backend, settings.SEAT_EVENTS_REDIS_URL)
+    broadcaster = _broadcasters.get(key)
+    if broadcaster is None:
+        with _broadcasters_lock:
+            broadcaster = _broadcasters.get(key)
+            if broadcaster is None:
+                if backend == 'redis':
+                    broadcaster = RedisBroadcaster(settings.SEAT_EVENTS_REDIS_URL)
+                elif backend == 'local':
+                    broadcaster = LocalBroadcaster()
+                else:
+                    raise ValueError(f"Unknown SEAT_EVENTS_BACKEND {backend!r}; use 'redis' or 'local'")
+                _broadcasters[key] = broadcaster
+    return broadcaster
+
+
+# -------------------- PUBLISHING --------------------
+def _publish(changes):
+    deltas = Counter()
+    for test_date_id, delta in changes:
+        deltas[test_date_id] += delta
+    try:
+        broadcaster = get_broadcaster()
+        for test_date_id, delta in deltas.items():
+            broadcaster.publish({'test_date': test_date_id, 'delta': delta})
+    except Exception as e:
+        # Live updates are best effort; the booking itself already committed
+        logger.warning("Failed to publish seat changes %s: %s", dict(deltas), e)
+
+
+def publish_seat_change(test_date_id, delta):
+    """Publish that the date gained `delta` seats once the current transaction commits.
+
+    Changes of one transaction are merged into one event per date.
+    """
+    collect_on_commit('seat-events', _publish, (test_date_id, delta))
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    if created:
+        publish_seat_change(instance.test_date_id, -1)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    publish_seat_change(instance.test_date_id, 1)
+
+
+@receiver(post_save, sender=TestDate)
+def test_date_saved(sender, instance, created, **kwargs):
+    # max_spots may have changed
+    publish_seat_change(instance.pk, 0)
+
+
+# -------------------- STREAM --------------------
+async def seat_events(request):
+    """SSE stream of seat changes; `?test_date=<id>` limits it to one date."""
+    only = request.GET.get('test_date')
+    heartbeat = settings.SEAT_EVENTS_HEARTBEAT
+
+    async def stream():
+        async with get_broadcaster().listen() as queue:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if only and str(event['test_date']) != only:
+                    continue
+                yield f"event: seats\ndata: {json.dumps(event)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
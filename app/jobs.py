@@ -0,0 +1,342 @@
+"""Background jobs for admin operations that outgrow one request.
+
+An admin action calls `submit()` and returns at once; the `run_jobs` worker
+claims queued Job rows and runs them in a process pool. Tasks are plain
+functions registered with `@task(name)`: they get the Job plus its JSON
+params, call `report()` as they go, and return a JSON-able result. The Job
+admin page polls the progress while the job runs.
+
+Tasks take the users.locks lock of their operation, so a second run of the
+same job fails instead of double-writing. Admin file imports run as
+`import` jobs too (ImportJobMixin). Tasks registered with `shared=True` work
+on their own data (e.g. one enrollment's invitations), so their jobs may
+queue up side by side.
+
+The worker stamps `heartbeat_at` on its running jobs every
+JOBS_HEARTBEAT_SECONDS. A job whose worker was killed (deploy restart, OOM)
+stops beating and `fail_stale()` fails it after JOBS_STALE_SECONDS, so it no
+longer blocks new jobs of its name. Staff can also cancel a job from the
+admin; a running task notices at its next `report()` and stops.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.module_loading import import_string
+
+from users.locks import lock
+from users.models import User
+from . import analytics, assignment, services
+from .models import Job, TestDate
+
+logger = logging.getLogger(__name__)
+
+# Registered tasks: name -> function(job, **params)
+TASKS = {}
+# Tasks whose jobs don't exclude each other
+SHARED = set()
+# Rows per UPDATE in tasks that report progress batch by batch
+BATCH_SIZE = 1000
+
+
+class JobPending(Exception):
+    """A job of the same name is already queued or running."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled (or failed as stale) while its task ran."""
+
+
+def task(name, shared=False):
+    """Register the decorated function as the task run for jobs named `name`."""
+    def register(func):
+        TASKS[name] = func
+        if shared:
+            SHARED.add(name)
+        return func
+    return register
+
+
+def submit(name, user=None, **params):
+    """Queue a `name` job with JSON `params` for the worker; raises JobPending if one is in flight.
+
+    Called inside a transaction, the job is only seen by the worker once it commits.
+    """
+    if name not in TASKS:
+        raise KeyError(f"Unknown job {name!r}")
+    # Even with no worker left to notice, a dead run must not block its name forever
+    fail_stale()
+    if name not in SHARED and Job.objects.filter(name=name, status__in=(Job.QUEUED, Job.RUNNING)).exists():
+        raise JobPending(f"A {name!r} job is already queued or running")
+    job = Job.objects.create(name=name, params=params,
+                             created_by=user if user is not None and user.is_authenticated else None)
+    logger.info("📥 Job #%s %s queued", job.pk, name)
+    return job
+
+
+def submit_from_admin(model_admin, request, name, text, **params):
+    """Queue a job from an admin action and tell the user, linking to the job's progress page."""
+    try:
+        job = submit(name, request.user, **params)
+    except JobPending as e:
+        model_admin.message_user(request, f"{e}; try again once it finishes.", messages.ERROR)
+        return None
+    url = reverse('admin:app_job_change', args=[job.pk])
+    model_admin.message_user(request, format_html('{} <a href="{}">Follow job #{}</a>.', text, url, job.pk))
+    return job
+
+
+def _path(cls):
+    return f'{cls.__module__}.{cls.__qualname__}'
+
+
+class ImportJobMixin:
+    """For ImportExportModelAdmin: an uploaded file is queued as an `import` job instead of imported in the request.
+
+    import-export would first dry-run the whole file in the request to show
+    a preview, which times out on large files. The job checks every row
+    before writing and rolls the whole file back on any error, listing the
+    errors on its page. The uploaded file stays in the admin's tmp storage
+    until the job reads it; with workers on other hosts, use a shared one
+    (IMPORT_EXPORT_TMP_STORAGE_CLASS).
+    """
+
+    def import_action(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().import_action(request, *args, **kwargs)
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        import_form = self.create_import_form(request)
+        if not import_form.is_valid():
+            # Shows the form errors
+            return super().import_action(request, *args, **kwargs)
+        data = import_form.cleaned_data
+        input_format = self.get_import_formats()[int(data['input_format'])]
+        tmp_storage = self.write_to_tmp_storage(data['import_file'], input_format())
+        return self.queue_import(request, import_form, input_format, tmp_storage.name, data['import_file'].name)
+
+    def process_import(self, request, *args, **kwargs):
+        # A confirm form rendered before imports were queued from the upload step
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        confirm_form = self.create_confirm_form(request)
+        if confirm_form.is_valid():
+            data = confirm_form.cleaned_data
+            input_format = self.get_import_formats()[int(data['input_format'])]
+            return self.queue_import(request, confirm_form, input_format, data['import_file_name'],
+                                     data.get('original_file_name'))
+        return HttpResponseRedirect(reverse(
+            'admin:%s_%s_changelist' % self.get_model_info(), current_app=self.admin_site.name))
+
+    def queue_import(self, request, form, input_format, file_name, original_file_name):
+        submit_from_admin(
+            self, request, 'import', "Import queued.",
+            resource=_path(self.choose_import_resource_class(form)),
+            input_format=_path(input_format),
+            encoding=None if input_format().is_binary() else self.from_encoding,
+            storage=_path(self.get_tmp_storage_class()),
+            file_name=file_name,
+            original_file_name=original_file_name,
+        )
+        return HttpResponseRedirect(reverse(
+            'admin:%s_%s_changelist' % self.get_model_info(), current_app=self.admin_site.name))
+
+
+def report(job, progress, total=None, message=None):
+    """Record how far `job` got; the admin polls these fields.
+
+    Raises JobCancelled if the job is no longer running, so a cancelled
+    task stops at its next report. Work the task already committed stays:
+    tasks that write in batches commit each batch with everything it
+    implies, so a cancel never leaves one half done.
+    """
+    fields = {'progress': progress}
+    if total is not None:
+        fields['total'] = total
+    if message is not None:
+        fields['message'] = message[:255]
+    for field, value in fields.items():
+        setattr(job, field, value)
+    if not Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(heartbeat_at=timezone.now(), **fields):
+        raise JobCancelled(f"Job #{job.pk} was cancelled")
+
+
+def cancel(queryset, user=None):
+    """Cancel the queued or running jobs in `queryset`; returns how many were cancelled."""
+    by = f" by {user}" if user is not None else ""
+    return queryset.filter(status__in=(Job.QUEUED, Job.RUNNING)).update(
+        status=Job.CANCELLED, error=f"Cancelled{by}", finished_at=timezone.now())
+
+
+# -------------------- WORKER --------------------
+def claim(limit, worker):
+    """Mark up to `limit` queued jobs as running on `worker`; returns their ids, oldest first.
+
+    SKIP LOCKED lets workers on several hosts claim from the same queue (on
+    PostgreSQL; SQLite serializes writers anyway).
+    """
+    if limit <= 0:
+        return []
+    with transaction.atomic():
+        ids = list(Job.objects.queued().select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+        now = timezone.now()
+        Job.objects.filter(pk__in=ids).update(status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now)
+    return ids
+
+
+def heartbeat(job_ids):
+    """Show that the worker running these jobs is alive."""
+    if job_ids:
+        Job.objects.filter(pk__in=job_ids, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def fail_stale(now=None):
+    """Fail running jobs without a heartbeat for JOBS_STALE_SECONDS; returns how many were failed.
+
+    They are failed rather than re-queued: a task killed halfway may
+    have sent emails or committed some batches, so staff decide whether to run it again.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.JOBS_STALE_SECONDS)
+    stale = Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff))
+    failed = stale.update(status=Job.FAILED, error="The worker stopped responding", finished_at=timezone.now())
+    if failed:
+        logger.warning("⚠️ Failed %s stale jobs", failed)
+    return failed
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_dead(worker):
+    """At worker startup: fail running jobs of earlier workers on this host whose process is gone.
+
+    `worker` is `<host>:<pid>`; a previous worker with our own pid (common in
+    containers) is necessarily dead. Returns how many jobs were failed.
+    """
+    host, pid = worker.rsplit(':', 1)
+    dead = []
+    for job_id, job_worker in Job.objects.filter(status=Job.RUNNING, worker__startswith=f'{host}:') \
+            .values_list('pk', 'worker'):
+        job_pid = job_worker.rsplit(':', 1)[1]
+        if job_pid == pid or (job_pid.isdigit() and not _alive(int(job_pid))):
+            dead.append(job_id)
+    failed = Job.objects.filter(pk__in=dead, status=Job.RUNNING).update(
+        status=Job.FAILED, error="The worker was restarted", finished_at=timezone.now())
+    if failed:
+        logger.warning("⚠️ Failed %s jobs of a stopped worker on %s", failed, host)
+    return failed
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def finish(job_id, status, result=None, error=''):
+    # A cancelled or stale-failed job keeps that status
+    Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+        status=status, result=result, error=error, finished_at=timezone.now())
+
+
+def run(job_id):
+    """Run a claimed job and record its outcome; returns the final status."""
+    job = Job.objects.get(pk=job_id)
+    try:
+        func = TASKS[job.name]
+        result = func(job, **job.params)
+    except JobCancelled:
+        logger.warning("🛑 Job #%s %s stopped: it was cancelled", job.pk, job.name)
+        return Job.CANCELLED
+    except Exception:
+        logger.exception("❌ Job #%s %s failed", job.pk, job.name)
+        finish(job.pk, Job.FAILED, error=traceback.format_exc())
+        return Job.FAILED
+    finish(job.pk, Job.DONE, result=result)
+    logger.info("✅ Job #%s %s done", job.pk, job.name)
+    return Job.DONE
+
+
+# -------------------- TASKS --------------------
+@task('assign-proctor')
+def assign_proctor(job, user_ids, proctor):
+    with lock('assign-proctor'):
+        updated = 0
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            with transaction.atomic():
+                updated += User.objects.filter(pk__in=batch).update(proctor=proctor)
+                # update() sends no signals; the results analytics group candidates by proctor
+                analytics.mark_dirty(user_ids=batch)
+            report(job, start + len(batch), len(user_ids))
+    report(job, len(user_ids), message=f"{updated} users updated with proctor '{proctor}'.")
+    return {'updated': updated}
+
+
+@task('refresh-result-summaries', shared=True)
+def refresh_result_summaries(job, test_date_ids=(), user_ids=()):
+    # Refreshes queued meanwhile may run side by side; the lock (shared with
+    # the refresh_result_summaries command) makes them take turns on the rows
+    with lock('refresh-result-summaries', blocking=True, timeout=settings.JOBS_STALE_SECONDS):
+        report(job, 0, 1, message="Refreshing result summaries")
+        rows = analytics.refresh_dirty(test_date_ids, user_ids)
+    report(job, 1, message=f"Wrote {rows} result summary rows.")
+    return {'rows': rows}
+
+
+@task('assign-candidates')
+def assign_candidates(job, test_date_ids):
+    with lock('assign-candidates'):
+        report(job, 0, 1, message="Assigning candidates")
+        plans, moved, updated = assignment.assign_sessions(list(TestDate.objects.filter(pk__in=test_date_ids)))
+    report(job, 1, message=f"{moved} bookings moved between rooms, {updated} candidates got a new proctor.")
+    return {'moved': moved, 'updated': updated}
+
+
+@task('publish-results')
+def publish_results(job, test_date_ids):
+    with lock('publish-results'):
+        report(job, 0, 1, message="Publishing results")
+        published = services.publish_results(TestDate.objects.filter(pk__in=test_date_ids))
+    report(job, 1, message=f"Results published for {published} candidates.")
+    return {'published': published}
+
+
+@task('import')
+def import_file(job, resource, input_format, encoding, storage, file_name, original_file_name=None):
+    input_format = import_string(input_format)(encoding=encoding)
+    storage = import_string(storage)(name=file_name, encoding=encoding, read_mode=input_format.get_read_mode())
+    try:
+        dataset = input_format.create_dataset(storage.read())
+    finally:
+        storage.remove()
+    resource = import_string(resource)
+    with lock(f'import-{resource._meta.model._meta.label_lower}'):
+        report(job, 0, len(dataset), message=f"Importing {len(dataset)} rows")
+        result = resource().import_data(dataset, dry_run=False, file_name=original_file_name,
+                                        user=job.created_by, rollback_on_validation_errors=True)
+    totals = dict(result.totals)
+    if result.has_errors() or result.has_validation_errors():
+        errors = [str(error.error) for error in result.base_errors]
+        errors += [str(error.error) for _, row in result.row_errors() for error in row]
+        errors += [f"row {row.number}: {row.error_dict}" for row in result.invalid_rows]
+        raise ValueError(f"Import rolled back: {'; '.join(errors[:10])}")
+    report(job, len(dataset), message="{new} new, {update} updated, {skip} unchanged".format(**totals))
+    return totals
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from root.swagger import generate_schema_documents, schema_path
+
+
+class Command(BaseCommand):
+    help = "Pre-generate the OpenAPI schema (JSON and YAML) for the current CODE_VERSION."
+
+    def handle(self, *args, **options):
+        documents = generate_schema_documents()
+        for fmt, body in documents.items():
+            path = schema_path(fmt)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path} ({len(body)} bytes)"))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import stats
+from users.locks import LockNotAcquired, lock
+
+
+class Command(BaseCommand):
+    help = ("Recount the per-session booking stats (TestDateStats), or refresh the PostgreSQL "
+            "materialized view when TEST_DATE_STATS_SOURCE='materialized_view'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test-date', type=int, nargs='*', dest='test_date_ids',
+                            help="only these sessions (ids); default recounts every session")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="seconds between runs; 0 runs once and exits")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            try:
+                with lock('rebuild-test-date-stats'):
+                    message = self.run(options['test_date_ids'])
+            except LockNotAcquired as e:
+                if not interval:
+                    raise CommandError(str(e))
+                message = None
+            if not interval:
+                self.stdout.write(self.style.SUCCESS(message))
+                return
+            time.sleep(interval)
+
+    def run(self, test_date_ids):
+        if stats.uses_materialized_view():
+            try:
+                stats.refresh_materialized_view()
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            return f"Refreshed {stats.MATERIALIZED_VIEW}"
+        return f"Recounted stats for {stats.rebuild(test_date_ids)} sessions"
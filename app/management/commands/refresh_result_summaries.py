@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.analytics import refresh_summaries
+from users.locks import LockNotAcquired, lock
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed result summaries behind the results analytics endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test-date', type=int, nargs='*', dest='test_date_ids',
+                            help="only these sessions (ids); default rebuilds everything")
+
+    def handle(self, *args, **options):
+        try:
+            with lock('refresh-result-summaries'):
+                rows = refresh_summaries(options['test_date_ids'])
+        except LockNotAcquired as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} result summary rows"))
@@ -0,0 +1,66 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import jobs
+from app.models import Job
+
+
+class Command(BaseCommand):
+    help = ("Run queued background jobs (app.jobs) in a process pool. Keep it running, "
+            "or pass --once to drain the queue and exit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOBS_PROCESSES,
+                            help="pool size; 0 runs jobs one by one in this process")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="seconds between polls of an empty queue")
+        parser.add_argument('--once', action='store_true',
+                            help="exit once the queue is empty and every job has finished")
+
+    def handle(self, *args, **options):
+        processes, interval = options['processes'], options['interval']
+        worker = jobs.worker_name()
+        jobs.fail_dead(worker)
+        # Spawned rather than forked, so no process inherits this one's DB connections; each
+        # sets Django up before it unpickles its first job (importing app.jobs needs the app registry)
+        pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=django.setup) if processes else None
+        running = {}
+        ran = 0
+        beat_at = None
+        try:
+            while True:
+                if beat_at is None or time.monotonic() - beat_at >= settings.JOBS_HEARTBEAT_SECONDS:
+                    # Jobs run inline (--processes 0) beat only when they report progress
+                    jobs.heartbeat(list(running.values()))
+                    jobs.fail_stale()
+                    beat_at = time.monotonic()
+                claimed = jobs.claim((processes or 1) - len(running), worker)
+                for job_id in claimed:
+                    if pool is None:
+                        jobs.run(job_id)
+                        ran += 1
+                    else:
+                        running[pool.submit(jobs.run, job_id)] = job_id
+
+                if running:
+                    done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = running.pop(future)
+                        ran += 1
+                        if future.exception() is not None:
+                            # The pool process died; jobs.run records ordinary task errors itself
+                            jobs.finish(job_id, Job.FAILED, error=repr(future.exception()))
+                elif not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(interval)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs"))
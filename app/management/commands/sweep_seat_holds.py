@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import sweep_expired_holds
+from users.locks import LockNotAcquired, lock
+
+
+class Command(BaseCommand):
+    help = "Release expired seat holds in bulk. Run from cron, or keep it running with --interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="seconds between sweeps; 0 sweeps once and exits")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            try:
+                # Sweepers on several hosts take turns; a busy round is skipped
+                with lock('sweep-seat-holds'):
+                    released = sweep_expired_holds()
+            except LockNotAcquired as e:
+                if not interval:
+                    raise CommandError(str(e))
+                released = 0
+            if released or not interval:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat holds"))
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 23:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_testdate_timezone'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='testdate',
+            name='timezone',
+        ),
+    ]
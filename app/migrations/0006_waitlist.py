@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 23:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_remove_testdate_timezone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Waitlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test_date', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='app.testdate')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('created_at', 'id'),
+                'indexes': [models.Index(fields=['test_date', 'created_at'], name='app_waitlis_test_da_f13edb_idx')],
+                'unique_together': {('user', 'test_date')},
+            },
+        ),
+    ]
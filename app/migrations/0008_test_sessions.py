@@ -0,0 +1,59 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def copy_proctors_from_bookings(apps, schema_editor):
+    """Existing dates become sessions; give each the proctor most of its booked users were assigned."""
+    TestDate = apps.get_model('app', 'TestDate')
+    Booking = apps.get_model('app', 'Booking')
+
+    rows = (
+        Booking.objects.exclude(user__proctor__isnull=True).exclude(user__proctor='')
+        .values('test_date', 'user__proctor').annotate(n=Count('pk')).order_by('test_date', '-n')
+    )
+    proctors = {}
+    for row in rows:
+        proctors.setdefault(row['test_date'], row['user__proctor'])
+
+    sessions = list(TestDate.objects.filter(pk__in=proctors))
+    for session in sessions:
+        session.proctor = proctors[session.pk]
+    TestDate.objects.bulk_update(sessions, ['proctor'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_seathold'),
+        # User.proctor, read by copy_proctors_from_bookings
+        ('users', '0003_alter_user_managers_remove_user_username_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testdate',
+            name='proctor',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='testdate',
+            name='room',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.RunPython(copy_proctors_from_bookings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='testdate',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='testdate',
+            index=models.Index(fields=['date', 'time'], name='app_testdat_date_a63cba_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='testdate',
+            constraint=models.UniqueConstraint(fields=('date', 'time', 'room'), name='unique_test_session'),
+        ),
+    ]
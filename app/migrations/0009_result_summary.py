@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_test_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proctor', models.CharField(blank=True, default='', max_length=100)),
+                ('is_bachelor', models.BooleanField(default=False)),
+                ('candidates', models.PositiveIntegerField(default=0)),
+                ('scores', models.JSONField(default=dict)),
+                ('decisions', models.JSONField(default=dict)),
+                ('cefr_levels', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('test_date', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='result_summaries', to='app.testdate')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resultsummary',
+            constraint=models.UniqueConstraint(fields=('test_date', 'proctor', 'is_bachelor'), name='unique_result_cohort'),
+        ),
+    ]
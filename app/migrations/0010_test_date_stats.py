@@ -0,0 +1,104 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+# Same rules as app.stats: attendance values that count as attended, and what counts as paid
+ATTENDED_VALUES = ('present', 'attended', 'yes')
+
+MATERIALIZED_VIEW_SQL = """
+CREATE MATERIALIZED VIEW app_testdatestats_mv AS
+SELECT t.id AS test_date_id,
+       COUNT(b.id) AS booked,
+       COUNT(b.id) FILTER (WHERE lower(u.attendance) IN ('present', 'attended', 'yes')) AS attended,
+       COUNT(b.id) FILTER (WHERE u.payment_status_auto = 'Paid' OR lower(u.payment_status) = 'paid') AS paid,
+       COALESCE((
+           SELECT jsonb_object_agg(d.decision, d.n)
+           FROM (SELECT u2.decision, COUNT(*) AS n
+                 FROM app_booking b2 JOIN users_user u2 ON u2.id = b2.user_id
+                 WHERE b2.test_date_id = t.id AND u2.decision IS NOT NULL
+                 GROUP BY u2.decision) d
+       ), '{}'::jsonb) AS decisions
+FROM app_testdate t
+LEFT JOIN app_booking b ON b.test_date_id = t.id
+LEFT JOIN users_user u ON u.id = b.user_id
+GROUP BY t.id;
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX app_testdatestats_mv_test_date ON app_testdatestats_mv (test_date_id);
+"""
+
+
+def populate_stats(apps, schema_editor):
+    """Count the existing bookings once; signal deltas keep the rows current from here on."""
+    TestDate = apps.get_model('app', 'TestDate')
+    Booking = apps.get_model('app', 'Booking')
+    TestDateStats = apps.get_model('app', 'TestDateStats')
+
+    attended = Q()
+    for value in ATTENDED_VALUES:
+        attended |= Q(user__attendance__iexact=value)
+    paid = Q(user__payment_status_auto='Paid') | Q(user__payment_status__iexact='paid')
+
+    rows = {pk: TestDateStats(test_date_id=pk, decisions={}) for pk in TestDate.objects.values_list('pk', flat=True)}
+    counts = Booking.objects.order_by().values_list('test_date').annotate(
+        booked=Count('pk'), attended=Count('pk', filter=attended), paid=Count('pk', filter=paid))
+    for test_date_id, booked, attended_count, paid_count in counts:
+        row = rows[test_date_id]
+        row.booked, row.attended, row.paid = booked, attended_count, paid_count
+    decided = (Booking.objects.order_by().filter(user__decision__isnull=False)
+               .values_list('test_date', 'user__decision').annotate(n=Count('pk')))
+    for test_date_id, decision, n in decided:
+        rows[test_date_id].decisions[decision] = n
+    TestDateStats.objects.bulk_create(rows.values(), batch_size=500)
+
+
+def create_materialized_view(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(MATERIALIZED_VIEW_SQL)
+
+
+def drop_materialized_view(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP MATERIALIZED VIEW IF EXISTS app_testdatestats_mv")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_result_summary'),
+        # User.attendance, payment and decision fields, read by populate_stats
+        ('users', '0003_alter_user_managers_remove_user_username_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestDateStatsView',
+            fields=[
+                ('booked', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('paid', models.IntegerField(default=0)),
+                ('decisions', models.JSONField(default=dict)),
+                ('test_date', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='stats_view', serialize=False, to='app.testdate')),
+            ],
+            options={
+                'db_table': 'app_testdatestats_mv',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TestDateStats',
+            fields=[
+                ('booked', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('paid', models.IntegerField(default=0)),
+                ('decisions', models.JSONField(default=dict)),
+                ('test_date', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.testdate')),
+            ],
+            options={
+                'verbose_name_plural': 'test date stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+        migrations.RunPython(create_materialized_view, drop_materialized_view),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-19 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='testdate',
+            constraint=models.UniqueConstraint(condition=models.Q(('time__isnull', True)), fields=('date', 'room'), name='unique_untimed_test_session'),
+        ),
+    ]
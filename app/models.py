@@ -1,23 +1,77 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from users.models import User
 
 
+def _count_per_test_date(queryset):
+    counts = queryset.filter(test_date=models.OuterRef('pk')).order_by().values('test_date')
+    return Coalesce(models.Subquery(counts.annotate(n=models.Count('pk')).values('n')), 0)
+
+
+class TestDateQuerySet(models.QuerySet):
+    def with_seat_counts(self):
+        """Annotate `booked` and `held` (active seat holds) for `spots_left`.
+
+        Correlated subqueries rather than two Counts over joins, which would
+        multiply bookings by holds.
+        """
+        return self.annotate(
+            booked=_count_per_test_date(Booking.objects.all()),
+            held=_count_per_test_date(SeatHold.objects.active()),
+        )
+
+    def with_stats(self, relation='stats'):
+        """Join the precomputed per-session stats (see app.stats) instead of counting bookings.
+
+        `booked` comes from the stats row; only the short-lived holds are still counted.
+        """
+        return self.select_related(relation).annotate(
+            booked=Coalesce(models.F(f'{relation}__booked'), 0),
+            held=_count_per_test_date(SeatHold.objects.active()),
+        )
+
+
 class TestDate(models.Model):
-    date = models.DateField(unique=True)
+    """One test session: a sitting on `date` at `time` in `room`; a day can have several."""
+    date = models.DateField()
     max_spots = models.PositiveIntegerField(default=40)
     time = models.TimeField(null=True, blank=True)
+    room = models.CharField(max_length=50, blank=True, default='')
+    # Proctor name, as on User.proctor
+    proctor = models.CharField(max_length=100, blank=True, null=True)
+
+    objects = TestDateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['date', 'time'])]
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'time', 'room'], name='unique_test_session'),
+            # NULLs are distinct in the one above, so sessions without a time need their own
+            models.UniqueConstraint(fields=['date', 'room'], condition=models.Q(time__isnull=True),
+                                    name='unique_untimed_test_session'),
+        ]
 
     def __str__(self):
-        # include time for clarity
-        if self.time:
-            return f"{self.date} {self.time}"
-        return f"{self.date}"
+        # include time and room for clarity
+        label = f"{self.date} {self.time}" if self.time else f"{self.date}"
+        if self.room:
+            label = f"{label} ({self.room})"
+        return label
 
     @property
     def spots_left(self):
-        booked = self.bookings.count()
-        return max(self.max_spots - booked, 0)
+        # Querysets from TestDateQuerySet.with_seat_counts avoid two COUNTs per row
+        booked = getattr(self, 'booked', None)
+        if booked is None:
+            booked = self.bookings.count()
+        held = getattr(self, 'held', None)
+        if held is None:
+            held = self.holds.active().count()
+        return max(self.max_spots - booked - held, 0)
 
     @property
     def is_full(self):
@@ -33,3 +87,174 @@ class Booking(models.Model):
 
     # def __str__(self):
     #     return f"{self.user.username} → {self.test_date.date}"
+
+
+class WaitlistQuerySet(models.QuerySet):
+    def with_position(self):
+        """Annotate `position`, the 1-based place in the date's queue in `(created_at, id)` order.
+
+        A correlated COUNT rather than a window, which would only rank the
+        rows left after filtering (e.g. one user's entries).
+        """
+        ahead = Waitlist.objects.filter(test_date=models.OuterRef('test_date')).filter(
+            models.Q(created_at__lt=models.OuterRef('created_at'))
+            | models.Q(created_at=models.OuterRef('created_at'), pk__lt=models.OuterRef('pk'))
+        ).order_by().values('test_date').annotate(n=models.Count('pk')).values('n')
+        return self.annotate(position=Coalesce(models.Subquery(ahead), 0) + 1)
+
+
+class Waitlist(models.Model):
+    """A user waiting for a seat on a full TestDate, served first come, first served."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    test_date = models.ForeignKey(TestDate, on_delete=models.CASCADE, related_name='waitlist')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WaitlistQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'test_date')
+        ordering = ('created_at', 'id')
+        indexes = [models.Index(fields=['test_date', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.user} → {self.test_date}"
+
+
+class SeatHoldQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self, now=None):
+        return self.filter(expires_at__lte=now or timezone.now())
+
+
+class SeatHold(models.Model):
+    """A seat reserved for SEAT_HOLD_SECONDS while the user pays; confirmed into a Booking or swept."""
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    test_date = models.ForeignKey(TestDate, on_delete=models.CASCADE, related_name='holds')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = SeatHoldQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['test_date', 'expires_at'])]
+
+    def __str__(self):
+        return f"{self.user} → {self.test_date} until {self.expires_at}"
+
+    @property
+    def is_active(self):
+        return self.expires_at > timezone.now()
+
+
+class ResultSummary(models.Model):
+    """Precomputed result aggregates for one cohort: a session's candidates sharing a proctor and `is_bachelor`.
+
+    Built by app.analytics from the users' result fields; every stored figure
+    is additive (counts, sums, histogram bins), so any filter over these rows
+    is answered by summing them. `test_date` is null for candidates with
+    results but no booking.
+    """
+    test_date = models.ForeignKey(TestDate, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='result_summaries')
+    proctor = models.CharField(max_length=100, blank=True, default='')
+    is_bachelor = models.BooleanField(default=False)
+    candidates = models.PositiveIntegerField(default=0)
+    # {score field: {'count': n, 'sum': s, 'histogram': [n per bin]}}
+    scores = models.JSONField(default=dict)
+    decisions = models.JSONField(default=dict)
+    cefr_levels = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test_date', 'proctor', 'is_bachelor'], name='unique_result_cohort'),
+        ]
+
+    def __str__(self):
+        return f"{self.test_date or 'No session'} / {self.proctor or '-'} / {'bachelor' if self.is_bachelor else 'other'}"
+
+
+class TestDateStatsBase(models.Model):
+    booked = models.IntegerField(default=0)
+    attended = models.IntegerField(default=0)
+    paid = models.IntegerField(default=0)
+    # {decision: count} over the booked candidates
+    decisions = models.JSONField(default=dict)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.test_date}: {self.booked} booked, {self.attended} attended, {self.paid} paid"
+
+
+class TestDateStats(TestDateStatsBase):
+    """Per-session booking, attendance, payment and decision counts, kept current by app.stats."""
+    test_date = models.OneToOneField(TestDate, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+
+    class Meta:
+        verbose_name_plural = 'test date stats'
+
+
+class TestDateStatsView(TestDateStatsBase):
+    """The same counts read from the PostgreSQL materialized view (TEST_DATE_STATS_SOURCE='materialized_view')."""
+    test_date = models.OneToOneField(TestDate, on_delete=models.DO_NOTHING, primary_key=True,
+                                     related_name='stats_view', db_constraint=False)
+
+    class Meta:
+        managed = False
+        db_table = 'app_testdatestats_mv'
+
+
+
+class JobQuerySet(models.QuerySet):
+    def queued(self):
+        return self.filter(status=Job.QUEUED).order_by('created_at', 'id')
+
+
+class Job(models.Model):
+    """A long admin operation queued for the `run_jobs` worker (see app.jobs)."""
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    name = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='jobs')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed by the worker while the job runs; a stale one means the worker died (see jobs.fail_stale)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-created_at', '-id')
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"#{self.pk} {self.name} ({self.status})"
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, round(100 * self.progress / self.total))
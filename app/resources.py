@@ -0,0 +1,58 @@
+"""Admin import/export of sessions and bookings (bulk; see root.resources)."""
+from import_export.fields import Field
+
+from root.resources import BulkModelResource, PrefetchedForeignKeyWidget
+from users.models import User
+from . import analytics, services, stats
+from .events import publish_seat_change
+from .models import TestDate, Booking
+
+
+class TestDateResource(BulkModelResource):
+    """Sessions matched on date, time and room."""
+
+    class Meta:
+        model = TestDate
+        import_id_fields = ('date', 'time', 'room')
+        fields = ('date', 'time', 'room', 'proctor', 'max_spots')
+        export_order = fields
+
+    def after_bulk_import(self, instances):
+        for test_date in instances:
+            snapshot = getattr(test_date, '_import_snapshot', None)
+            if snapshot is not None and test_date.max_spots > snapshot['max_spots']:
+                # New seats go to the waitlist first, as after a cancellation
+                services.promote_waitlist(test_date.pk)
+            # max_spots may have changed
+            publish_seat_change(test_date.pk, 0)
+
+
+class BookingResource(BulkModelResource):
+    """Bookings by candidate email and session id; date, time and room are exported for reading only.
+
+    Imports are staff corrections and skip the seat limit that bookings
+    through the API respect.
+    """
+    user = Field(attribute='user', column_name='email', widget=PrefetchedForeignKeyWidget(User, 'email'))
+    test_date = Field(attribute='test_date', column_name='test_date', widget=PrefetchedForeignKeyWidget(TestDate))
+    date = Field(attribute='test_date__date', column_name='date', readonly=True)
+    time = Field(attribute='test_date__time', column_name='time', readonly=True)
+    room = Field(attribute='test_date__room', column_name='room', readonly=True)
+
+    class Meta:
+        model = Booking
+        import_id_fields = ('user', 'test_date')
+        fields = ('user', 'test_date', 'date', 'time', 'room')
+        export_order = fields
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('user', 'test_date')
+
+    def after_bulk_import(self, instances):
+        test_date_ids = {booking.test_date_id for booking in instances}
+        # What the Booking save receivers do, once per session
+        if not stats.uses_materialized_view():
+            stats.rebuild(test_date_ids)
+        analytics.mark_dirty(test_date_ids=test_date_ids)
+        for test_date_id in test_date_ids:
+            publish_seat_change(test_date_id, 0)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import TestDate, Booking
+from . import analytics, services
+from .models import TestDate, Booking, SeatHold, Waitlist
 from zoneinfo import ZoneInfo
 
 class TestDateSerializer(serializers.ModelSerializer):
@@ -10,7 +11,7 @@ class TestDateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TestDate
-        fields = ['id', 'date', 'max_spots', 'spots_left', 'is_full', 'time']
+        fields = ['id', 'date', 'max_spots', 'spots_left', 'is_full', 'time', 'room']
 
     def get_time(self, obj):
         if obj.time:
@@ -18,11 +19,26 @@ class TestDateSerializer(serializers.ModelSerializer):
         return "Test time will be displayed after payment confirmation"
 
 
+class TestDateDaySerializer(serializers.Serializer):
+    """A day with all of its sessions; built from `{'date', 'sessions'}` dicts."""
+    date = serializers.DateField(format="%Y-%m-%d")
+    spots_left = serializers.SerializerMethodField()
+    is_full = serializers.SerializerMethodField()
+    sessions = TestDateSerializer(many=True)
+
+    def get_spots_left(self, obj):
+        return sum(session.spots_left for session in obj['sessions'])
+
+    def get_is_full(self, obj):
+        return all(session.is_full for session in obj['sessions'])
+
+
 
 class BookingListSerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     date = serializers.DateField(source='test_date.date', read_only=True, format="%Y-%m-%d")
     time = serializers.TimeField(source='test_date.time', read_only=True, format="%H:%M", allow_null=True)
+    room = serializers.CharField(source='test_date.room', read_only=True)
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -44,13 +60,88 @@ class BookingSerializer(serializers.ModelSerializer):
         test_date = data['test_date']
         user = self.context['request'].user
 
-        if test_date.is_full:
-            raise serializers.ValidationError({"test_date": "No spots left for this date."})
+        # A seat the user holds on this date is booked instead of a new one
+        if test_date.is_full and not SeatHold.objects.active().filter(user=user, test_date=test_date).exists():
+            raise serializers.ValidationError(
+                {"test_date": "No spots left for this date. Join the waitlist to get the next free seat."})
+
+        if Booking.objects.filter(user=user, test_date=test_date).exists():
+            raise serializers.ValidationError("You have already booked this test date.")
+
+        return data
+
+    def create(self, validated_data):
+        # Capacity is checked again under the date's row lock; validate() only rejects the obvious cases
+        return services.create_booking(validated_data['user'], validated_data['test_date'])
+
+
+class BookingRescheduleSerializer(serializers.Serializer):
+    test_date = serializers.PrimaryKeyRelatedField(queryset=TestDate.objects.all())
+
+
+class WaitlistSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    test_date = serializers.PrimaryKeyRelatedField(
+        queryset=TestDate.objects.all(),
+        write_only=True
+    )
+    test_date_info = TestDateSerializer(source='test_date', read_only=True)
+    position = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M", read_only=True)
+
+    class Meta:
+        model = Waitlist
+        fields = ['id', 'user', 'test_date', 'test_date_info', 'position', 'created_at']
+        read_only_fields = ['id', 'created_at', 'test_date_info']
+
+    def get_position(self, obj):
+        # Annotated by Waitlist.objects.with_position(); a just created entry is looked up
+        position = getattr(obj, 'position', None)
+        if position is None:
+            position = Waitlist.objects.with_position().values_list('position', flat=True).get(pk=obj.pk)
+        return position
+
+    def validate(self, data):
+        test_date = data['test_date']
+        user = self.context['request'].user
+
+        if not test_date.is_full:
+            raise serializers.ValidationError({"test_date": "This date still has free spots, book it directly."})
 
         if Booking.objects.filter(user=user, test_date=test_date).exists():
             raise serializers.ValidationError("You have already booked this test date.")
 
+        if Waitlist.objects.filter(user=user, test_date=test_date).exists():
+            raise serializers.ValidationError("You are already on the waitlist for this test date.")
+
         return data
 
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    test_date = serializers.PrimaryKeyRelatedField(
+        queryset=TestDate.objects.all(),
+        write_only=True
+    )
+    test_date_info = TestDateSerializer(source='test_date', read_only=True)
+    expires_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
+
+    class Meta:
+        model = SeatHold
+        fields = ['token', 'user', 'test_date', 'test_date_info', 'expires_at']
+        read_only_fields = ['token', 'test_date_info', 'expires_at']
+
     def create(self, validated_data):
-        return Booking.objects.create(**validated_data)
+        hold, self.created = services.hold_seat(validated_data['user'], validated_data['test_date'])
+        return hold
+
+
+class ResultAnalyticsFilterSerializer(serializers.Serializer):
+    """Query parameters of the results analytics endpoint."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    proctor = serializers.CharField(required=False)
+    # A missing checkbox would read as False; missing means both cohorts here
+    is_bachelor = serializers.BooleanField(required=False, allow_null=True, default=None)
+    group_by = serializers.ChoiceField(choices=analytics.GROUP_BY, required=False)
+
@@ -0,0 +1,254 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from rest_framework.exceptions import NotFound, ValidationError
+
+from users.models import User
+from users.results import RESULT_FIELDS, warm_results
+from users.serializers import send_email_sync
+from .events import publish_seat_change
+from .models import TestDate, Booking, SeatHold, Waitlist
+
+logger = logging.getLogger(__name__)
+
+
+def lock_test_date(test_date_id):
+    """Lock the date row so seat counts can't change under the caller until commit.
+
+    Must run inside `transaction.atomic()`. SQLite ignores FOR UPDATE, but its
+    transactions already start with BEGIN IMMEDIATE (see root.db_backends).
+    Not annotated with `booked`: Postgres refuses FOR UPDATE with GROUP BY.
+    """
+    return TestDate.objects.select_for_update().get(pk=test_date_id)
+
+
+def lock_test_dates(*test_date_ids):
+    """Lock several date rows, always in primary key order.
+
+    Two transactions locking the same pair in opposite orders (A→B and B→A
+    reschedules) would otherwise deadlock each other.
+    """
+    return {
+        test_date.pk: test_date
+        for test_date in TestDate.objects.select_for_update().filter(pk__in=test_date_ids).order_by('pk')
+    }
+
+
+# -------------------- BOOKINGS --------------------
+def create_booking(user, test_date):
+    """Book a seat, re-checking capacity with the date row locked.
+
+    A seat the user holds on the date becomes the booking instead of a second seat.
+    """
+    with transaction.atomic():
+        test_date = lock_test_date(test_date.pk)
+        if Booking.objects.filter(user=user, test_date=test_date).exists():
+            raise ValidationError("You have already booked this test date.")
+        # An active hold already took this seat out of spots_left, so no capacity check
+        if not take_held_seat(user, test_date) and test_date.is_full:
+            raise ValidationError({"test_date": "No spots left for this date."})
+        # A booked user is no longer waiting for this date
+        Waitlist.objects.filter(user=user, test_date=test_date).delete()
+        try:
+            with transaction.atomic():
+                return Booking.objects.create(user=user, test_date=test_date)
+        except IntegrityError:
+            raise ValidationError("You have already booked this test date.")
+
+
+def reschedule_booking(booking, test_date_id):
+    """Move `booking` to another date in one transaction.
+
+    Both dates are locked (in pk order) before the target's capacity is
+    checked, so concurrent moves in either direction can neither overfill a
+    date nor deadlock. The seat left behind goes to the old date's waitlist.
+    """
+    old_test_date_id = booking.test_date_id
+    with transaction.atomic():
+        dates = lock_test_dates(old_test_date_id, test_date_id)
+        new_test_date = dates.get(test_date_id)
+        if new_test_date is None:
+            raise NotFound("Test date not found.")
+
+        booking = Booking.objects.select_for_update().get(pk=booking.pk)
+        if booking.test_date_id != old_test_date_id:
+            raise ValidationError("This booking was changed meanwhile, please try again.")
+        if test_date_id == old_test_date_id:
+            raise ValidationError({"test_date": "The booking is already on this date."})
+        if Booking.objects.filter(user_id=booking.user_id, test_date=new_test_date).exists():
+            raise ValidationError({"test_date": "You have already booked this test date."})
+        if new_test_date.is_full:
+            raise ValidationError({"test_date": "No spots left for this date."})
+
+        booking.test_date = new_test_date
+        booking.save(update_fields=['test_date'])
+        Waitlist.objects.filter(user_id=booking.user_id, test_date=new_test_date).delete()
+
+        publish_seat_change(old_test_date_id, 1)
+        publish_seat_change(test_date_id, -1)
+        # The Booking save receivers move the stats and result summaries
+        promote_waitlist(old_test_date_id)
+    return booking
+
+
+# -------------------- WAITLIST --------------------
+def send_promotion_email(booking):
+    user, test_date = booking.user, booking.test_date
+    html_content = render_to_string('booking_promoted.html', {'user': user, 'test_date': test_date})
+    from_email = f"WUT Team <{settings.EMAIL_HOST_USER}>"
+    send_email_sync("Your test seat is confirmed", strip_tags(html_content), html_content, from_email, user.email)
+
+
+def promote_waitlist(test_date_id):
+    """Turn the oldest waitlist entries into bookings while the date has free seats.
+
+    Runs in the caller's transaction (or its own) with the date row locked,
+    so a seat freed by a cancellation or a `max_spots` increase is handed to
+    the waitlist before anyone else can book it. Emails go out after commit.
+    """
+    with transaction.atomic():
+        test_date = lock_test_date(test_date_id)
+        free = test_date.spots_left
+        if not free:
+            return []
+
+        # Entries of users who got a seat on this date some other way are spent
+        Waitlist.objects.filter(test_date=test_date).filter(
+            Q(user__in=Booking.objects.filter(test_date=test_date).values('user'))
+            | Q(user__in=SeatHold.objects.active().filter(test_date=test_date).values('user'))
+        ).delete()
+        entries = list(Waitlist.objects.filter(test_date=test_date).select_related('user')[:free])
+        if not entries:
+            return []
+
+        bookings = [Booking.objects.create(user=entry.user, test_date=test_date) for entry in entries]
+        Waitlist.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+
+        for booking in bookings:
+            logger.info("🎟️ Promoted %s from the waitlist for %s", booking.user.email, test_date)
+            transaction.on_commit(lambda booking=booking: send_promotion_email(booking))
+    return bookings
+
+
+def cancel_booking(booking):
+    """Delete `booking` and give its seat to the next user on the waitlist."""
+    with transaction.atomic():
+        lock_test_date(booking.test_date_id)
+        booking.delete()
+        return promote_waitlist(booking.test_date_id)
+
+
+
+# -------------------- SEAT HOLDS --------------------
+def hold_seat(user, test_date):
+    """Reserve a seat for SEAT_HOLD_SECONDS while `user` pays.
+
+    The hold counts against `spots_left` straight away. Asking again for the
+    same date renews the user's existing hold instead of taking a second seat.
+    A user holds at most SEAT_HOLD_MAX_PER_USER seats at a time, so one
+    account can't hold a whole session. Returns `(hold, created)`.
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.SEAT_HOLD_SECONDS)
+    with transaction.atomic():
+        # The user row first: holds on different dates lock different date rows
+        User.objects.select_for_update().filter(pk=user.pk).first()
+        test_date = lock_test_date(test_date.pk)
+        if Booking.objects.filter(user=user, test_date=test_date).exists():
+            raise ValidationError("You have already booked this test date.")
+
+        holds = list(SeatHold.objects.active().filter(user=user))
+        hold = next((hold for hold in holds if hold.test_date_id == test_date.pk), None)
+        if hold is not None:
+            hold.expires_at = expires_at
+            hold.save(update_fields=['expires_at'])
+            return hold, False
+
+        if len(holds) >= settings.SEAT_HOLD_MAX_PER_USER:
+            raise ValidationError("You are already holding a seat on another date. Confirm or release it first.")
+        if test_date.is_full:
+            raise ValidationError({"test_date": "No spots left for this date."})
+        hold = SeatHold.objects.create(user=user, test_date=test_date, expires_at=expires_at)
+        publish_seat_change(test_date.pk, -1)
+    return hold, True
+
+
+def take_held_seat(user, test_date):
+    """Delete the user's hold on the locked date; returns whether it still reserved a seat.
+
+    `hold_seat` published -1 for the hold and the booking that replaces it
+    publishes its own, so the hold's seat is given back to the stream here.
+    """
+    hold = SeatHold.objects.filter(user=user, test_date=test_date).first()
+    if hold is None:
+        return False
+    hold.delete()
+    publish_seat_change(hold.test_date_id, 1)
+    return hold.is_active
+
+
+def confirm_hold(hold):
+    """Turn a hold into a booking, e.g. once payment went through.
+
+    An expired but not yet swept hold still confirms if the date has room.
+    """
+    with transaction.atomic():
+        lock_test_date(hold.test_date_id)
+        hold = SeatHold.objects.filter(pk=hold.pk).select_related('user', 'test_date').first()
+        if hold is None:
+            raise ValidationError("This seat hold has expired.")
+        return create_booking(hold.user, hold.test_date)
+
+
+def release_hold(hold):
+    """Give a held seat back before it expires."""
+    with transaction.atomic():
+        lock_test_date(hold.test_date_id)
+        deleted, _ = SeatHold.objects.filter(pk=hold.pk).delete()
+        # An expired hold left spots_left already, but the stream only learns so when it's gone
+        if deleted:
+            publish_seat_change(hold.test_date_id, 1)
+            promote_waitlist(hold.test_date_id)
+
+
+def sweep_expired_holds(now=None):
+    """Delete every expired hold in one statement and hand the seats on.
+
+    Returns the number of holds removed. Run periodically (see the
+    `sweep_seat_holds` command) instead of scheduling one timer per hold.
+    """
+    now = now or timezone.now()
+    expired = SeatHold.objects.expired(now)
+    with transaction.atomic():
+        released = dict(expired.order_by().values_list('test_date').annotate(n=Count('pk')))
+        if not released:
+            return 0
+        # No signal receivers on SeatHold, so this is a single DELETE
+        expired.delete()
+        for test_date_id, count in released.items():
+            publish_seat_change(test_date_id, count)
+            promote_waitlist(test_date_id)
+    return sum(released.values())
+
+
+# -------------------- RESULTS --------------------
+def publish_results(test_dates):
+    """Show the results of everyone booked on `test_dates` and warm their cache entries in one write.
+
+    Inactive users are published too, for when they're reactivated, but get
+    no cache entry: a cached payload would be served without the DB's
+    is_active check. Returns the number of candidates published.
+    """
+    users = User.objects.filter(pk__in=Booking.objects.filter(test_date__in=test_dates).values('user'))
+    with transaction.atomic():
+        published = users.update(results_published=True)
+        values = list(users.filter(is_active=True).values('id', 'results_published', *RESULT_FIELDS))
+        transaction.on_commit(lambda: warm_results(values))
+    logger.info("📣 Published results for %s candidates", published)
+    return published
+
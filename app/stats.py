@@ -0,0 +1,241 @@
+"""Per-session booking, attendance, payment and decision counts (TestDateStats).
+
+Instead of joining Booking to User with Count annotations on every admin or
+report page, the counts live in one TestDateStats row per session. Signal
+receivers apply deltas as bookings come and go and as a booked candidate's
+attendance, payment or decision changes; `rebuild_test_date_stats`
+recomputes them from scratch after bulk writes that bypass signals.
+
+On PostgreSQL the counts can instead come from the `app_testdatestats_mv`
+materialized view (TEST_DATE_STATS_SOURCE='materialized_view'), refreshed
+concurrently on a schedule; the delta receivers are idle then.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import User
+from .models import TestDate, Booking, TestDateStats, TestDateStatsView
+
+# User.attendance values that count as attended (case-insensitive); the
+# materialized view in migration 0010 uses the same list
+ATTENDED_VALUES = ('present', 'attended', 'yes')
+# User fields a session's stats depend on
+STATS_FIELDS = ('attendance', 'payment_status', 'payment_status_auto', 'decision')
+# Booking fields (and attnames) whose change moves a candidate between sessions' counts
+BOOKING_FIELDS = frozenset(('test_date', 'test_date_id', 'user', 'user_id'))
+MATERIALIZED_VIEW = TestDateStatsView._meta.db_table
+
+
+def uses_materialized_view():
+    return settings.TEST_DATE_STATS_SOURCE == 'materialized_view'
+
+
+def stats_relation():
+    """The TestDate relation to `select_related` for the configured source."""
+    return 'stats_view' if uses_materialized_view() else 'stats'
+
+
+def stats_for(test_date):
+    """The session's stats from the configured source, or None if it has no row yet."""
+    try:
+        return getattr(test_date, stats_relation())
+    except (TestDateStats.DoesNotExist, TestDateStatsView.DoesNotExist):
+        return None
+
+
+# -------------------- DELTAS --------------------
+def contribution(attendance, payment_status, payment_status_auto, decision):
+    """What one booked candidate adds to their session: (attended, paid, decision)."""
+    attended = (attendance or '').lower() in ATTENDED_VALUES
+    paid = payment_status_auto == 'Paid' or (payment_status or '').lower() == 'paid'
+    return int(attended), int(paid), decision or None
+
+
+def user_contribution(user):
+    return contribution(*(getattr(user, field) for field in STATS_FIELDS))
+
+
+def apply_delta(test_date_id, booked=0, attended=0, paid=0, decisions=None):
+    """Add the deltas to one session's row.
+
+    Count-only deltas are a single `UPDATE ... SET booked = booked + 1`; a
+    decision change locks the row to merge its JSON counts. A missing row is
+    only created for additions: deleting a session fast-deletes its row before
+    the cascaded bookings' post_delete arrive, and a new row would point at
+    the session being deleted.
+    """
+    decisions = {decision: n for decision, n in (decisions or {}).items() if decision and n}
+    if not (booked or attended or paid or decisions):
+        return
+    with transaction.atomic():
+        rows = TestDateStats.objects.filter(test_date_id=test_date_id)
+        if not decisions and rows.update(booked=F('booked') + booked, attended=F('attended') + attended,
+                                         paid=F('paid') + paid):
+            return
+        stats = rows.select_for_update().first()
+        if stats is None:
+            if min(booked, attended, paid, *decisions.values()) < 0:
+                return
+            stats = TestDateStats(test_date_id=test_date_id)
+        stats.booked += booked
+        stats.attended += attended
+        stats.paid += paid
+        merged = Counter(stats.decisions)
+        merged.update(decisions)
+        stats.decisions = {decision: n for decision, n in merged.items() if n}
+        stats.save()
+
+
+def apply_booking(test_date_id, user, sign):
+    attended, paid, decision = user_contribution(user)
+    apply_delta(test_date_id, booked=sign, attended=sign * attended, paid=sign * paid,
+                decisions={decision: sign})
+
+
+def apply_moves(moves):
+    """Move booked candidates between sessions; `moves` is `(user, old_test_date_id, new_test_date_id)` tuples.
+
+    For writes that change Booking.test_date without a post_save to go by
+    (bulk_update); deltas are merged so each session is updated once.
+    """
+    if uses_materialized_view():
+        return
+    deltas = {}
+    for user, old_test_date_id, new_test_date_id in moves:
+        attended, paid, decision = user_contribution(user)
+        for test_date_id, sign in ((old_test_date_id, -1), (new_test_date_id, 1)):
+            delta = deltas.setdefault(test_date_id, [0, 0, 0, Counter()])
+            delta[0] += sign
+            delta[1] += sign * attended
+            delta[2] += sign * paid
+            delta[3][decision] += sign
+    for test_date_id in sorted(deltas):
+        booked, attended, paid, decisions = deltas[test_date_id]
+        apply_delta(test_date_id, booked, attended, paid, decisions)
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking(sender, instance, update_fields=None, **kwargs):
+    """Record an existing booking's session and candidate, so a save that changes them moves the counts.
+
+    app.analytics reads `_booking_before` as well.
+    """
+    instance._booking_before = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not BOOKING_FIELDS.intersection(update_fields):
+        return
+    instance._booking_before = Booking.objects.filter(pk=instance.pk).values_list('test_date_id', 'user_id').first()
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    if uses_materialized_view():
+        return
+    if created:
+        apply_booking(instance.test_date_id, instance.user, 1)
+        return
+    before = getattr(instance, '_booking_before', None)
+    if before is None or before == (instance.test_date_id, instance.user_id):
+        return
+    old_test_date_id, old_user_id = before
+    if old_user_id == instance.user_id:
+        apply_moves([(instance.user, old_test_date_id, instance.test_date_id)])
+        return
+    old_user = User.objects.filter(pk=old_user_id).only(*STATS_FIELDS).first()
+    if old_user is not None:
+        apply_booking(old_test_date_id, old_user, -1)
+    apply_booking(instance.test_date_id, instance.user, 1)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    if uses_materialized_view():
+        return
+    if Booking.user.is_cached(instance):
+        user = instance.user
+    else:
+        # Deleting a user cascades to their bookings first, so the user row is still readable
+        user = User.objects.filter(pk=instance.user_id).only(*STATS_FIELDS).first()
+    if user is not None:
+        apply_booking(instance.test_date_id, user, -1)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_contribution(sender, instance, update_fields=None, **kwargs):
+    if uses_materialized_view() or instance.pk is None:
+        return
+    if update_fields is not None and not set(STATS_FIELDS).intersection(update_fields):
+        return
+    before = User.objects.filter(pk=instance.pk).values_list(*STATS_FIELDS).first()
+    if before is not None:
+        instance._stats_before = contribution(*before)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    before = instance.__dict__.pop('_stats_before', None)
+    if before is None:
+        return
+    after = user_contribution(instance)
+    if after == before:
+        return
+    for test_date_id in Booking.objects.filter(user=instance).values_list('test_date_id', flat=True):
+        apply_delta(test_date_id, attended=after[0] - before[0], paid=after[1] - before[1],
+                    decisions={after[2]: 1, before[2]: -1} if after[2] != before[2] else None)
+
+
+# -------------------- REBUILD --------------------
+def _attended(prefix=''):
+    condition = Q()
+    for value in ATTENDED_VALUES:
+        condition |= Q(**{f'{prefix}attendance__iexact': value})
+    return condition
+
+
+def _paid(prefix=''):
+    return Q(**{f'{prefix}payment_status_auto': 'Paid'}) | Q(**{f'{prefix}payment_status__iexact': 'paid'})
+
+
+def rebuild(test_date_ids=None):
+    """Recompute TestDateStats from the bookings; all sessions unless `test_date_ids` is given.
+
+    Locks the sessions (as bookings do) so no delta lands between the
+    recount and the write. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        sessions = TestDate.objects.select_for_update().order_by('pk')
+        bookings = Booking.objects.order_by()
+        if test_date_ids is not None:
+            sessions = sessions.filter(pk__in=test_date_ids)
+            bookings = bookings.filter(test_date__in=test_date_ids)
+        rows = {pk: TestDateStats(test_date_id=pk) for pk in sessions.values_list('pk', flat=True)}
+
+        counts = bookings.values_list('test_date').annotate(
+            booked=Count('pk'),
+            attended=Count('pk', filter=_attended('user__')),
+            paid=Count('pk', filter=_paid('user__')),
+        )
+        for test_date_id, booked, attended, paid in counts:
+            row = rows[test_date_id]
+            row.booked, row.attended, row.paid = booked, attended, paid
+        decided = bookings.filter(user__decision__isnull=False).values_list('test_date', 'user__decision')
+        for test_date_id, decision, n in decided.annotate(n=Count('pk')):
+            rows[test_date_id].decisions[decision] = n
+
+        TestDateStats.objects.filter(test_date__in=rows).delete()
+        TestDateStats.objects.bulk_create(rows.values(), batch_size=500)
+    return len(rows)
+
+
+def refresh_materialized_view(concurrently=True):
+    """REFRESH the PostgreSQL view; CONCURRENTLY keeps it readable meanwhile (uses its unique index)."""
+    if connection.vendor != 'postgresql':
+        raise RuntimeError("The test date stats materialized view needs PostgreSQL")
+    with connection.cursor() as cursor:
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{MATERIALIZED_VIEW}")
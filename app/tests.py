@@ -1,3 +1,962 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import os
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import AccessToken
+from tablib import Dataset
+
+from root.database import retry_on_db_lock
+from users.models import User
+from . import analytics, assignment, events, jobs, services, stats
+from .resources import BookingResource, TestDateResource
+from .models import TestDate, Booking, Job, ResultSummary, SeatHold, TestDateStats, Waitlist
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        cls.dates = [
+            TestDate.objects.create(date=datetime.date(2030, 1, day), max_spots=2, time=datetime.time(9, 0))
+            for day in (1, 2, 3)
+        ]
+        Booking.objects.create(user=cls.user, test_date=cls.dates[0])
+
+    def setUp(self):
+        cache.clear()
+        self.token = str(AccessToken.for_user(self.user))
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+
+    def test_dates_match_sync_endpoint(self):
+        sync = self.client.get('/api/v1/dates')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/async/dates')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response.json()[0]['spots_left'], 1)
+
+    def test_sync_dates_do_not_count_bookings_per_row(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/v1/dates')
+
+    def test_dates_are_served_from_cache(self):
+        self.client.get('/api/v1/async/dates')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/async/dates')
+        self.assertEqual(len(response.json()), 3)
+
+    def test_bookings_match_sync_endpoint(self):
+        sync = self.client.get('/api/v1/bookings', **self.auth)
+        response = self.client.get('/api/v1/async/bookings', **self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync.json())
+
+    def test_bookings_require_authentication(self):
+        self.assertEqual(self.client.get('/api/v1/async/bookings').status_code, 401)
+        invalid = self.client.get('/api/v1/async/bookings', HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(invalid.status_code, 401)
+        self.assertEqual(invalid.json()['code'], 'token_not_valid')
+
+    async def test_async_client(self):
+        response = await self.async_client.get(
+            '/api/v1/async/bookings', headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', SEAT_EVENTS_BACKEND='local')
+class WaitlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f'student{i}@example.com', 'Student', str(i), password='pass12345')
+            for i in range(4)
+        ]
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 2, 1), max_spots=1)
+        cls.booking = Booking.objects.create(user=cls.users[0], test_date=cls.test_date)
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def join(self, user):
+        return self.client.post('/api/v1/waitlist', {'test_date': self.test_date.pk}, **self.auth(user))
+
+    def test_waitlist_is_only_for_full_dates(self):
+        self.assertEqual(self.join(self.users[1]).status_code, 201)
+        self.assertEqual(self.join(self.users[1]).status_code, 400)
+        self.assertEqual(self.join(self.users[0]).status_code, 400)
+
+        self.test_date.max_spots = 5
+        self.test_date.save()
+        self.assertEqual(self.join(self.users[2]).status_code, 400)
+
+    def test_waitlist_reports_queue_position(self):
+        self.join(self.users[1])
+        self.join(self.users[2])
+
+        response = self.client.get('/api/v1/waitlist', **self.auth(self.users[2]))
+
+        self.assertEqual(response.json()[0]['position'], 2)
+
+    def test_positions_are_read_in_one_query_and_ties_break_on_id(self):
+        self.join(self.users[1])
+        self.join(self.users[2])
+        Waitlist.objects.update(created_at=timezone.now())
+        other_date = TestDate.objects.create(date=datetime.date(2030, 6, 2), max_spots=0)
+        Waitlist.objects.create(user=self.users[2], test_date=other_date)
+        auth = self.auth(self.users[2])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/waitlist', **auth)
+        self.assertEqual(len([q for q in queries if 'app_waitlist' in q['sql']]), 1)
+        self.assertEqual(sorted(entry['position'] for entry in response.json()), [1, 2])
+
+    def test_cancellation_promotes_first_in_line(self):
+        self.join(self.users[1])
+        self.join(self.users[2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/v1/bookings/{self.booking.pk}', **self.auth(self.users[0]))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(self.test_date.bookings.values_list('user', flat=True)), [self.users[1].pk])
+        self.assertEqual(list(Waitlist.objects.values_list('user', flat=True)), [self.users[2].pk])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.users[1].email])
+
+    def test_promotion_skips_users_who_booked_meanwhile(self):
+        self.join(self.users[1])
+        self.join(self.users[2])
+        # A seat freed without promotion (e.g. a queryset update), taken directly by the second in line
+        TestDate.objects.filter(pk=self.test_date.pk).update(max_spots=2)
+        services.create_booking(self.users[2], self.test_date)
+        self.assertEqual(list(Waitlist.objects.values_list('user', flat=True)), [self.users[1].pk])
+        # A stale entry, as left by bookings made before create_booking cleaned up
+        Waitlist.objects.create(user=self.users[2], test_date=self.test_date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cancel_booking(self.booking)
+
+        self.assertEqual(sorted(self.test_date.bookings.values_list('user', flat=True)),
+                         [self.users[1].pk, self.users[2].pk])
+        self.assertFalse(Waitlist.objects.exists())
+        self.assertEqual([m.to for m in mail.outbox], [[self.users[1].email]])
+
+    def test_users_cannot_cancel_other_bookings(self):
+        response = self.client.delete(f'/api/v1/bookings/{self.booking.pk}', **self.auth(self.users[1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_max_spots_increase_promotes_waitlist(self):
+        for user in self.users[1:]:
+            self.join(user)
+        admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', password='pass12345')
+        self.client.force_login(admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/app/testdate/{self.test_date.pk}/change/',
+                             {'date': '2030-02-01', 'max_spots': 3, 'time': ''})
+
+        self.assertEqual(self.test_date.bookings.count(), 3)
+        self.assertEqual(list(Waitlist.objects.values_list('user', flat=True)), [self.users[3].pk])
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local', SEAT_EVENTS_HEARTBEAT=0.05)
+class SeatEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 3, 1), max_spots=10)
+
+    def setUp(self):
+        events._broadcasters.clear()
+
+    def test_booking_changes_are_published_after_commit(self):
+        with mock.patch.object(events.LocalBroadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                booking = Booking.objects.create(user=self.user, test_date=self.test_date)
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.delete()
+
+        self.assertEqual([call.args[0] for call in publish.call_args_list], [
+            {'test_date': self.test_date.pk, 'delta': -1},
+            {'test_date': self.test_date.pk, 'delta': 1},
+        ])
+
+    def test_changes_are_merged_per_date_and_dropped_on_rollback(self):
+        other = TestDate.objects.create(date=datetime.date(2030, 3, 2), max_spots=10)
+        booking = Booking.objects.create(user=self.user, test_date=self.test_date)
+        with mock.patch.object(events.LocalBroadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                services.reschedule_booking(booking, other.pk)
+                Booking.objects.create(user=User.objects.create_user('a@example.com', 'A', 'B'), test_date=other)
+                with self.assertRaises(ValueError), transaction.atomic():
+                    Booking.objects.create(user=User.objects.create_user('x@example.com', 'X', 'Y'), test_date=other)
+                    raise ValueError
+
+        # One event per date, nothing from the rolled back savepoint
+        self.assertEqual(sorted((call.args[0] for call in publish.call_args_list), key=lambda e: e['test_date']), [
+            {'test_date': self.test_date.pk, 'delta': 1},
+            {'test_date': other.pk, 'delta': -2},
+        ])
+
+    def test_held_seat_is_counted_once(self):
+        expired = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        other = User.objects.create_user('other@example.com', 'Vali', 'Aliyev')
+        with mock.patch.object(events.LocalBroadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                hold, _ = services.hold_seat(self.user, self.test_date)
+            with self.captureOnCommitCallbacks(execute=True):
+                services.confirm_hold(hold)
+            # Holds that expired without being swept yet
+            with self.captureOnCommitCallbacks(execute=True):
+                hold, _ = services.hold_seat(other, self.test_date)
+            SeatHold.objects.update(expires_at=expired)
+            with self.captureOnCommitCallbacks(execute=True):
+                services.release_hold(hold)
+
+        # The confirmed hold gives its seat back as the booking takes it: one seat, one -1 in total
+        deltas = [call.args[0]['delta'] for call in publish.call_args_list]
+        self.assertEqual(deltas, [-1, 1, -1, -1, 1])
+        self.assertEqual(sum(deltas), -self.test_date.bookings.count())
+
+    def test_redis_publishes_leave_the_caller_at_once(self):
+        broadcaster = events.RedisBroadcaster('redis://127.0.0.1:1/0')
+        sent = threading.Event()
+        with mock.patch.object(broadcaster, '_send', side_effect=lambda event: (time.sleep(0.2), sent.set())):
+            started = time.monotonic()
+            broadcaster.publish({'test_date': self.test_date.pk, 'delta': -1})
+            self.assertLess(time.monotonic() - started, 0.1)
+            self.assertTrue(sent.wait(2))
+
+    async def test_stream_pushes_events_for_the_requested_date(self):
+        response = await self.async_client.get(f'/api/v1/events/seats?test_date={self.test_date.pk}')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+            broadcaster = events.get_broadcaster()
+            broadcaster.publish({'test_date': self.test_date.pk + 1, 'delta': -1})
+            broadcaster.publish({'test_date': self.test_date.pk, 'delta': -1})
+
+            chunk = await asyncio.wait_for(anext(stream), 1)
+            while chunk.startswith(b':'):  # keep-alive
+                chunk = await asyncio.wait_for(anext(stream), 1)
+            self.assertEqual(chunk.decode(), 'event: seats\ndata: {"test_date": %d, "delta": -1}\n\n'
+                             % self.test_date.pk)
+        finally:
+            await stream.aclose()
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local')
+class RescheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        cls.other = User.objects.create_user('other@example.com', 'Vali', 'Aliyev', password='pass12345')
+        cls.first = TestDate.objects.create(date=datetime.date(2030, 4, 1), max_spots=1)
+        cls.second = TestDate.objects.create(date=datetime.date(2030, 4, 2), max_spots=1)
+        cls.booking = Booking.objects.create(user=cls.user, test_date=cls.first)
+
+    def reschedule(self, test_date, user=None):
+        return self.client.post(
+            f'/api/v1/bookings/{self.booking.pk}/reschedule', {'test_date': test_date.pk},
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user or self.user)}',
+        )
+
+    def test_booking_moves_and_old_seat_goes_to_waitlist(self):
+        Waitlist.objects.create(user=self.other, test_date=self.first)
+
+        response = self.reschedule(self.second)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['test_date_info']['id'], self.second.pk)
+        self.assertEqual(list(self.first.bookings.values_list('user', flat=True)), [self.other.pk])
+        self.assertFalse(Waitlist.objects.exists())
+
+    def test_full_target_is_rejected(self):
+        Booking.objects.create(user=self.other, test_date=self.second)
+
+        response = self.reschedule(self.second)
+
+        self.assertEqual(response.status_code, 400)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.test_date, self.first)
+
+    def test_other_users_bookings_are_not_found(self):
+        self.assertEqual(self.reschedule(self.second, user=self.other).status_code, 404)
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local')
+class RescheduleConcurrencyTests(TransactionTestCase):
+    SEATS = 12
+    MOVERS = 10
+
+    def setUp(self):
+        self.first = TestDate.objects.create(date=datetime.date(2030, 5, 1), max_spots=self.SEATS)
+        self.second = TestDate.objects.create(date=datetime.date(2030, 5, 2), max_spots=self.SEATS)
+        users = User.objects.bulk_create(
+            User(email=f'mover{i}@example.com', first_name='Mover', last_name=str(i)) for i in range(2 * self.MOVERS)
+        )
+        self.bookings = Booking.objects.bulk_create(
+            Booking(user=user, test_date=self.first if i < self.MOVERS else self.second) for i, user in enumerate(users)
+        )
+
+    def test_concurrent_swaps_in_both_directions_respect_capacity(self):
+        # The in-memory test database uses a shared cache, whose table locks fail fast instead of waiting
+        reschedule = retry_on_db_lock(services.reschedule_booking, attempts=100, base_delay=0.01, max_delay=0.1)
+        moved, rejected, errors = [], [], []
+        barrier = threading.Barrier(len(self.bookings))
+
+        def move(booking):
+            target = self.second if booking.test_date_id == self.first.pk else self.first
+            try:
+                barrier.wait()
+                reschedule(booking, target.pk)
+                moved.append(booking.pk)
+            except ValidationError:
+                rejected.append(booking.pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=move, args=(booking,)) for booking in self.bookings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(moved) + len(rejected), len(self.bookings))
+        self.assertEqual(Booking.objects.count(), len(self.bookings))
+        for test_date in (self.first, self.second):
+            self.assertLessEqual(test_date.bookings.count(), self.SEATS)
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local', SEAT_HOLD_SECONDS=600, LOCK_BACKEND='file',
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SeatHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        cls.other = User.objects.create_user('other@example.com', 'Vali', 'Aliyev', password='pass12345')
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 6, 1), max_spots=1)
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def hold(self, user, test_date=None):
+        return self.client.post('/api/v1/holds', {'test_date': (test_date or self.test_date).pk}, **self.auth(user))
+
+    def test_hold_takes_the_seat_until_it_expires(self):
+        response = self.hold(self.user)
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+
+        with self.assertNumQueries(1):
+            dates = self.client.get('/api/v1/dates').json()
+        self.assertEqual(dates[0]['spots_left'], 0)
+        self.assertEqual(self.hold(self.other).status_code, 400)
+        # Holding again renews the same hold
+        response = self.hold(self.user)
+        self.assertEqual((response.status_code, response.json()['token']), (200, token))
+
+        SeatHold.objects.update(expires_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(self.client.get('/api/v1/dates').json()[0]['spots_left'], 1)
+
+    def test_one_hold_per_user(self):
+        self.hold(self.user)
+        other_date = TestDate.objects.create(date=datetime.date(2030, 6, 2), max_spots=5)
+
+        response = self.hold(self.user, other_date)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('another date', response.json()[0])
+        with self.settings(SEAT_HOLD_MAX_PER_USER=2):
+            self.assertEqual(self.hold(self.user, other_date).status_code, 201)
+
+    def test_confirm_turns_hold_into_booking(self):
+        token = self.hold(self.user).json()['token']
+
+        response = self.client.post(f'/api/v1/holds/{token}/confirm', **self.auth(self.user))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(list(self.test_date.bookings.values_list('user', flat=True)), [self.user.pk])
+
+    def test_booking_a_held_date_uses_the_held_seat(self):
+        token = self.hold(self.user).json()['token']
+
+        response = self.client.post('/api/v1/bookings', {'test_date': self.test_date.pk}, **self.auth(self.user))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(self.test_date.spots_left, 0)
+        response = self.client.post(f'/api/v1/holds/{token}/confirm', **self.auth(self.user))
+        self.assertEqual(response.status_code, 404)
+
+    def test_confirm_rejects_an_already_booked_date(self):
+        hold, _ = services.hold_seat(self.user, self.test_date)
+        Booking.objects.create(user=self.user, test_date=self.test_date)
+
+        with self.assertRaisesMessage(ValidationError, 'already booked'):
+            services.confirm_hold(hold)
+        self.assertEqual(self.test_date.bookings.count(), 1)
+
+    def test_release_returns_the_seat(self):
+        token = self.hold(self.user).json()['token']
+        self.assertEqual(self.client.delete(f'/api/v1/holds/{token}', **self.auth(self.other)).status_code, 404)
+
+        self.assertEqual(self.client.delete(f'/api/v1/holds/{token}', **self.auth(self.user)).status_code, 204)
+
+        self.assertEqual(self.hold(self.other).status_code, 201)
+
+    def test_sweep_releases_expired_holds_to_the_waitlist(self):
+        expired = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        SeatHold.objects.create(user=self.user, test_date=self.test_date, expires_at=expired)
+        Waitlist.objects.create(user=self.other, test_date=self.test_date)
+        out = io.StringIO()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sweep_seat_holds', stdout=out)
+
+        self.assertIn('Released 1 expired seat holds', out.getvalue())
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(list(self.test_date.bookings.values_list('user', flat=True)), [self.other.pk])
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class TestSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        day = datetime.date(2030, 7, 1)
+        cls.morning = TestDate.objects.create(date=day, time=datetime.time(9, 0), room='A101', max_spots=2)
+        cls.afternoon_a = TestDate.objects.create(date=day, time=datetime.time(14, 0), room='A101', max_spots=2)
+        cls.afternoon_b = TestDate.objects.create(date=day, time=datetime.time(14, 0), room='B202', max_spots=3)
+        cls.next_day = TestDate.objects.create(date=datetime.date(2030, 7, 2), time=datetime.time(9, 0), max_spots=1)
+        Booking.objects.create(user=cls.user, test_date=cls.morning)
+        Booking.objects.create(user=cls.user, test_date=cls.next_day)
+
+    def test_sessions_are_grouped_per_day_in_one_query(self):
+        with self.assertNumQueries(1):
+            days = self.client.get('/api/v1/dates/by-day').json()
+
+        self.assertEqual([day['date'] for day in days], ['2030-07-01', '2030-07-02'])
+        first = days[0]
+        self.assertEqual([(s['time'], s['room']) for s in first['sessions']],
+                         [('09:00', 'A101'), ('14:00', 'A101'), ('14:00', 'B202')])
+        self.assertEqual(first['spots_left'], 1 + 2 + 3)
+        self.assertFalse(first['is_full'])
+        self.assertTrue(days[1]['is_full'])
+
+    def test_same_session_cannot_be_created_twice(self):
+        with self.assertRaises(IntegrityError):
+            TestDate.objects.create(date=self.morning.date, time=self.morning.time, room='A101')
+
+    def test_same_untimed_session_cannot_be_created_twice(self):
+        TestDate.objects.create(date=self.morning.date, room='A101')
+        TestDate.objects.create(date=self.morning.date, room='B202')
+        with self.assertRaises(IntegrityError):
+            TestDate.objects.create(date=self.morning.date, room='A101')
+
+
+@override_settings(LOCK_BACKEND='file')
+class AssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', password='pass12345')
+        day, at = datetime.date(2030, 8, 1), datetime.time(9, 0)
+        cls.room_a = TestDate.objects.create(date=day, time=at, room='A101', max_spots=4, proctor='Karimova')
+        cls.room_b = TestDate.objects.create(date=day, time=at, room='B202', max_spots=4, proctor='Tashkentov')
+        cls.users = []
+        for i in range(6):
+            user = User.objects.create_user(f'candidate{i}@example.com', 'Ali', 'Valiyev', password='pass12345',
+                                            is_bachelor=i < 3)
+            cls.users.append(user)
+            # Cohorts start mixed across both rooms
+            Booking.objects.create(user=user, test_date=cls.room_a if i < 4 else cls.room_b)
+        # A non-bachelor who sat with the room A proctor before
+        User.objects.filter(pk=cls.users[5].pk).update(proctor='Karimova')
+
+    def test_assign_respects_capacity_and_cohorts_at_scale(self):
+        rng = np.random.default_rng(0)
+        capacity = rng.integers(300, 600, size=12)
+        is_bachelor = rng.random(5000) < 0.4
+        prior = np.zeros((5000, 12), dtype=bool)
+        prior[np.arange(1000), rng.integers(0, 12, size=1000)] = True
+
+        started = time.perf_counter()
+        choice = assignment.assign(capacity, is_bachelor, prior)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+        self.assertFalse((choice == assignment.UNPLACED).any())
+        self.assertTrue((np.bincount(choice, minlength=12) <= capacity).all())
+        # Enough room for both cohorts, so no session mixes them
+        bachelor_rooms = set(choice[is_bachelor])
+        self.assertFalse(bachelor_rooms & set(choice[~is_bachelor]))
+
+    def test_candidates_stay_where_they_are_unless_needed_elsewhere(self):
+        # Rooms already split by cohort, one of them fuller than the other
+        current = np.array([0, 0, 0, 1])
+        choice = assignment.assign([4, 4], [True, True, True, False], np.zeros((4, 2), dtype=bool), current)
+        self.assertEqual(list(choice), list(current))
+        # A candidate with a previous proctor still joins them
+        prior = np.zeros((4, 2), dtype=bool)
+        prior[3] = [False, True]
+        choice = assignment.assign([4, 4], [False, False, False, False], prior, np.array([0, 0, 1, 0]))
+        self.assertEqual(list(choice), [0, 0, 1, 1])
+
+    def test_overbooked_group_leaves_candidates_unplaced(self):
+        choice = assignment.assign([1, 1], [False, False, True], np.zeros((3, 2), dtype=bool))
+        self.assertEqual(list(np.sort(choice)), [assignment.UNPLACED, 0, 1])
+
+    def test_plan_separates_cohorts_with_the_fewest_moves(self):
+        plans, moved, updated = assignment.assign_sessions([self.room_a])
+
+        self.assertEqual(len(plans), 1)
+        rooms = {
+            user.pk: booking.test_date_id
+            for user in self.users
+            for booking in Booking.objects.filter(user=user)
+        }
+        self.assertEqual(len({rooms[u.pk] for u in self.users[:3]}), 1)
+        self.assertEqual(len({rooms[u.pk] for u in self.users[3:]}), 1)
+        # Room A keeps its bachelors; only the non-bachelor among them moves
+        self.assertEqual(rooms[self.users[0].pk], self.room_a.pk)
+        self.assertEqual(rooms[self.users[3].pk], self.room_b.pk)
+        # The cohort rule beats keeping a proctor
+        self.assertEqual(rooms[self.users[5].pk], self.room_b.pk)
+        self.assertEqual(moved, 1)
+        self.assertEqual(updated, 6)
+        self.assertEqual(User.objects.get(pk=self.users[0].pk).proctor, 'Karimova')
+        for room in (self.room_a, self.room_b):
+            self.assertLessEqual(Booking.objects.filter(test_date=room).count(), room.max_spots)
+
+    def test_admin_action_previews_before_applying(self):
+        self.client.force_login(self.admin)
+        data = {'action': 'assign_candidates', '_selected_action': [self.room_a.pk]}
+
+        response = self.client.post('/admin/app/testdate/', data)
+        self.assertContains(response, 'B202')
+        self.assertEqual(Booking.objects.filter(test_date=self.room_a).count(), 4)
+
+        response = self.client.post('/admin/app/testdate/', {**data, 'apply': '1'}, follow=True)
+        self.assertContains(response, 'Assignment queued.')
+        self.assertEqual(Booking.objects.filter(test_date=self.room_a).count(), 4)
+
+        call_command('run_jobs', '--once', '--processes', '0', stdout=io.StringIO())
+        self.assertEqual(Job.objects.get().message, '1 bookings moved between rooms, 6 candidates got a new proctor.')
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local', LOCK_BACKEND='file')
+class ResultAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff@example.com', 'Staff', 'User', password='pass12345', is_staff=True)
+        cls.march = TestDate.objects.create(date=datetime.date(2030, 3, 1), time=datetime.time(9, 0))
+        cls.may = TestDate.objects.create(date=datetime.date(2030, 5, 1), time=datetime.time(9, 0))
+        results = [
+            # session, proctor, bachelor, listening, total, decision, cefr
+            (cls.march, 'Karimova', True, 62, 180, 'Pass', 'B2'),
+            (cls.march, 'Karimova', True, 48, 140, 'ESL Bridge', 'B1'),
+            (cls.march, 'Karimova', False, 71, 205, 'Pass', 'C1'),
+            (cls.may, 'Tashkentov', False, 55, 150, 'Conditional Pass', 'B1'),
+        ]
+        cls.candidates = []
+        for i, (session, proctor, bachelor, listening, total, decision, cefr) in enumerate(results):
+            user = User.objects.create_user(
+                f'candidate{i}@example.com', 'Ali', 'Valiyev', password='pass12345', proctor=proctor,
+                is_bachelor=bachelor, listening_score=listening, total_score=total, decision=decision, cefr_level=cefr)
+            Booking.objects.create(user=user, test_date=session)
+            cls.candidates.append(user)
+        # Results but no booking
+        User.objects.create_user('walkin@example.com', 'Ali', 'Valiyev', password='pass12345', total_score=100,
+                                 decision='Fail', cefr_level='A2')
+        # Booked without results: not a candidate for analytics
+        Booking.objects.create(user=cls.staff, test_date=cls.may)
+
+    def setUp(self):
+        analytics.refresh_summaries()
+
+    def run_worker(self):
+        call_command('run_jobs', '--once', '--processes', '0', stdout=io.StringIO())
+
+    def test_rebuild_writes_one_row_per_cohort(self):
+        cohorts = set(ResultSummary.objects.values_list('test_date', 'proctor', 'is_bachelor'))
+        self.assertEqual(cohorts, {
+            (self.march.pk, 'Karimova', True), (self.march.pk, 'Karimova', False),
+            (self.may.pk, 'Tashkentov', False), (None, '', False),
+        })
+
+    def test_report_sums_the_summary_rows(self):
+        result = analytics.report()
+        self.assertEqual(result['candidates'], 5)
+        self.assertEqual(result['decisions'], {'Pass': 2, 'ESL Bridge': 1, 'Conditional Pass': 1, 'Fail': 1})
+        self.assertEqual(result['pass_rate'], 0.6)
+        self.assertEqual(result['cefr_levels']['B1'], 0.4)
+        listening = result['scores']['listening_score']
+        self.assertEqual(listening['count'], 4)
+        self.assertEqual(listening['mean'], 59.0)
+        self.assertEqual(listening['histogram'], [
+            {'from': 45, 'to': 49, 'count': 1}, {'from': 55, 'to': 59, 'count': 1},
+            {'from': 60, 'to': 64, 'count': 1}, {'from': 70, 'to': 74, 'count': 1},
+        ])
+
+    def test_filters_and_grouping(self):
+        march = analytics.report(date_to=datetime.date(2030, 4, 1), is_bachelor=True)
+        self.assertEqual(march['candidates'], 2)
+        self.assertEqual(analytics.report(proctor='Tashkentov')['decisions'], {'Conditional Pass': 1})
+
+        groups = analytics.report(date_from=datetime.date(2030, 1, 1), group_by='proctor')['groups']
+        self.assertEqual({g['proctor']: g['candidates'] for g in groups}, {'Karimova': 3, 'Tashkentov': 1})
+
+    def test_saving_results_refreshes_only_that_session(self):
+        may_row = ResultSummary.objects.get(test_date=self.may)
+        user = self.candidates[0]
+        user.decision = 'Fail'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(ResultSummary.objects.get(test_date=self.march, is_bachelor=True).decisions,
+                         {'Pass': 1, 'ESL Bridge': 1})
+
+        self.run_worker()
+        self.assertEqual(ResultSummary.objects.get(test_date=self.march, is_bachelor=True).decisions,
+                         {'Fail': 1, 'ESL Bridge': 1})
+        self.assertEqual(ResultSummary.objects.get(test_date=self.may).updated_at, may_row.updated_at)
+
+    def test_saves_without_result_changes_refresh_nothing(self):
+        user = self.candidates[0]
+        user.first_name = 'Vali'
+        user.set_password('new-pass-123')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+            # Marks of a rolled back savepoint are dropped with it
+            with self.assertRaises(ValueError), transaction.atomic():
+                analytics.mark_dirty(user_ids=[user.pk])
+                raise ValueError
+        self.assertFalse(Job.objects.exists())
+
+    def test_marks_join_the_refresh_waiting_for_a_worker(self):
+        for user, decision in zip(self.candidates, ('Fail', 'Pass')):
+            user.decision = decision
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+
+        job = Job.objects.get()
+        self.assertEqual(job.name, analytics.REFRESH_JOB)
+        self.assertEqual(job.params['user_ids'], [user.pk for user in self.candidates[:2]])
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(ResultSummary.objects.get(test_date=self.march, is_bachelor=True).decisions,
+                         {'Fail': 1, 'Pass': 1})
+
+    def test_moving_a_candidate_refreshes_both_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            services.reschedule_booking(Booking.objects.get(user=self.candidates[2]), self.may.pk)
+        self.run_worker()
+
+        self.assertFalse(ResultSummary.objects.filter(test_date=self.march, is_bachelor=False).exists())
+        self.assertEqual(ResultSummary.objects.get(test_date=self.may, proctor='Karimova').candidates, 1)
+
+    def test_endpoint_is_staff_only_and_reads_summaries(self):
+        url = '/api/v1/results/analytics'
+        self.client.force_login(self.candidates[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(3):  # session, user, summary rows
+            response = self.client.get(url, {'is_bachelor': 'false', 'group_by': 'test_date'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['candidates'], 3)
+        self.assertEqual(len(body['groups']), 3)
+
+
+@override_settings(SEAT_EVENTS_BACKEND='local', EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   LOCK_BACKEND='file')
+class TestDateStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', password='pass12345')
+        cls.first = TestDate.objects.create(date=datetime.date(2030, 9, 1), time=datetime.time(9, 0), max_spots=5)
+        cls.second = TestDate.objects.create(date=datetime.date(2030, 9, 2), time=datetime.time(9, 0), max_spots=5)
+        cls.users = [
+            User.objects.create_user(f'candidate{i}@example.com', 'Ali', 'Valiyev', password='pass12345',
+                                     attendance='Present' if i % 2 else None, payment_status_auto='Paid',
+                                     decision='Pass' if i == 0 else None)
+            for i in range(3)
+        ]
+        for user in cls.users:
+            Booking.objects.create(user=user, test_date=cls.first)
+
+    def counts(self, test_date):
+        row = TestDateStats.objects.get(test_date=test_date)
+        return row.booked, row.attended, row.paid, row.decisions
+
+    def test_bookings_apply_deltas(self):
+        self.assertEqual(self.counts(self.first), (3, 1, 3, {'Pass': 1}))
+
+        services.cancel_booking(Booking.objects.get(user=self.users[0]))
+        self.assertEqual(self.counts(self.first), (2, 1, 2, {}))
+
+    def test_result_changes_apply_deltas(self):
+        user = self.users[0]
+        user.attendance, user.decision = 'present', 'Fail'
+        user.save()
+        self.assertEqual(self.counts(self.first), (3, 2, 3, {'Fail': 1}))
+
+        # Saves that don't touch these fields cost no extra query
+        with self.assertNumQueries(1):
+            user.save(update_fields=['first_name'])
+
+    def test_deleting_a_session_with_bookings(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete()
+        self.assertFalse(TestDateStats.objects.filter(test_date_id=self.first.pk).exists())
+        # The cascaded bookings' deltas must not re-create a row for the deleted session
+        connection.check_constraints()
+
+    def test_reschedule_moves_the_counts(self):
+        services.reschedule_booking(Booking.objects.get(user=self.users[0]), self.second.pk)
+        self.assertEqual(self.counts(self.first), (2, 1, 2, {}))
+        self.assertEqual(self.counts(self.second), (1, 0, 1, {'Pass': 1}))
+
+    def test_saves_that_change_session_or_candidate_move_the_counts(self):
+        booking = Booking.objects.get(user=self.users[0])
+        booking.test_date = self.second
+        booking.save()
+        self.assertEqual(self.counts(self.first), (2, 1, 2, {}))
+        self.assertEqual(self.counts(self.second), (1, 0, 1, {'Pass': 1}))
+
+        # Changing the candidate (e.g. in the admin) swaps their contributions
+        booking.user = User.objects.create_user('other@example.com', 'Vali', 'Aliyev', attendance='Present')
+        booking.save()
+        self.assertEqual(self.counts(self.second), (1, 1, 0, {}))
+
+    def test_rebuild_matches_the_deltas(self):
+        services.reschedule_booking(Booking.objects.get(user=self.users[1]), self.second.pk)
+        User.objects.filter(pk=self.users[2].pk).update(decision='Pass')  # no signal
+        expected = {test_date: self.counts(test_date) for test_date in (self.first, self.second)}
+        expected[self.first] = (2, 0, 2, {'Pass': 2})
+
+        out = io.StringIO()
+        call_command('rebuild_test_date_stats', stdout=out)
+        self.assertIn('2 sessions', out.getvalue())
+        self.assertEqual({test_date: self.counts(test_date) for test_date in expected}, expected)
+
+    def test_admin_changelist_reads_the_stats(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/app/testdate/')
+        self.assertContains(response, 'Pass: 1')
+        self.assertContains(response, '<td class="field-attended_display">1</td>', html=True)
+
+
+@jobs.task('test-count')
+def count_task(job, items, fail_at=None):
+    for i in range(items):
+        if i == fail_at:
+            raise ValueError(f"bad item {i}")
+        jobs.report(job, i + 1, items)
+    return {'counted': items}
+
+
+@jobs.task('test-cancel-midway')
+def cancel_midway_task(job):
+    jobs.cancel(Job.objects.filter(pk=job.pk))
+    jobs.report(job, 1, 2)
+    return {'unreachable': True}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEAT_EVENTS_BACKEND='local', LOCK_BACKEND='file')
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', password='pass12345')
+
+    def run_worker(self):
+        out = io.StringIO()
+        call_command('run_jobs', '--once', '--processes', '0', stdout=out)
+        return out.getvalue()
+
+    def test_worker_runs_jobs_and_records_progress(self):
+        job = jobs.submit('test-count', self.admin, items=3)
+        self.assertEqual(job.status, Job.QUEUED)
+        with self.assertRaises(jobs.JobPending):
+            jobs.submit('test-count', items=1)
+
+        self.assertIn('Ran 1 jobs', self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total, job.percent), (Job.DONE, 3, 3, 100))
+        self.assertEqual(job.result, {'counted': 3})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failures_are_recorded_on_the_job(self):
+        job = jobs.submit('test-count', items=3, fail_at=2)
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.FAILED, 2))
+        self.assertIn('ValueError: bad item 2', job.error)
+        # A finished job no longer blocks a new one
+        jobs.submit('test-count', items=1)
+
+    def test_admin_action_submits_a_job_and_the_page_polls_it(self):
+        user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        self.client.force_login(self.admin)
+        data = {'action': 'assign_proctor', '_selected_action': [user.pk], 'apply': '1', 'proctor_name': 'Karimov'}
+
+        response = self.client.post('/admin/users/user/', data, follow=True)
+        self.assertContains(response, 'Proctor assignment queued.')
+        self.assertIsNone(User.objects.get(pk=user.pk).proctor)
+        job = Job.objects.get()
+
+        status_url = f'/admin/app/job/{job.pk}/status/'
+        self.assertEqual(self.client.get(status_url).json()['status'], Job.QUEUED)
+        self.assertContains(self.client.get(f'/admin/app/job/{job.pk}/change/'), status_url)
+
+        self.run_worker()
+        self.assertEqual(User.objects.get(pk=user.pk).proctor, 'Karimov')
+        body = self.client.get(status_url).json()
+        self.assertEqual((body['status'], body['percent']), (Job.DONE, 100))
+        self.assertEqual(body['message'], "1 users updated with proctor 'Karimov'.")
+
+    def test_cancelled_proctor_assignment_keeps_whole_batches(self):
+        users = [User.objects.create_user(f'student{i}@example.com', 'Student', str(i)) for i in range(2)]
+        job = jobs.submit('assign-proctor', user_ids=[user.pk for user in users], proctor='Karimov')
+        jobs.claim(1, 'test')
+
+        with mock.patch.object(jobs, 'BATCH_SIZE', 1), \
+                mock.patch.object(jobs, 'report', side_effect=jobs.JobCancelled), \
+                mock.patch.object(analytics, 'mark_dirty') as mark_dirty:
+            self.assertEqual(jobs.run(job.pk), Job.CANCELLED)
+
+        self.assertEqual([User.objects.get(pk=user.pk).proctor for user in users], ['Karimov', None])
+        mark_dirty.assert_called_once_with(user_ids=[users[0].pk])
+
+    def test_stale_running_jobs_stop_blocking_their_name(self):
+        job = jobs.submit('test-count', items=1)
+        jobs.claim(1, 'gone-host:123')
+        with self.assertRaises(jobs.JobPending):
+            jobs.submit('test-count', items=1)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(hours=1))
+        jobs.submit('test-count', items=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.FAILED, "The worker stopped responding"))
+
+    def test_worker_fails_jobs_of_its_dead_predecessor_at_startup(self):
+        host = jobs.worker_name().rsplit(':', 1)[0]
+        # Same pid as this process (a restarted container), and the live parent process
+        dead = Job.objects.create(name='test-count', status=Job.RUNNING, worker=jobs.worker_name())
+        alive = Job.objects.create(name='test-count', status=Job.RUNNING, worker=f'{host}:{os.getppid()}')
+
+        self.run_worker()
+        self.assertEqual(Job.objects.get(pk=dead.pk).status, Job.FAILED)
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, Job.RUNNING)
+
+    def test_admin_cancels_jobs_and_running_tasks_stop(self):
+        queued = jobs.submit('test-count', items=1)
+        self.client.force_login(self.admin)
+        self.client.post('/admin/app/job/', {'action': 'cancel_jobs', '_selected_action': [queued.pk]})
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.error), (Job.CANCELLED, f"Cancelled by {self.admin}"))
+
+        job = jobs.submit('test-cancel-midway')
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.CANCELLED, None))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEAT_EVENTS_BACKEND='local', LOCK_BACKEND='file')
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'User', password='pass12345')
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 9, 1), time=datetime.time(9, 0), room='A101')
+        cls.users = [
+            User.objects.create_user(f'candidate{i}@example.com', 'Ali', 'Valiyev', password='pass12345',
+                                     payment_status_auto='Paid')
+            for i in range(3)
+        ]
+
+    def bookings(self, emails):
+        return Dataset(*[(email, self.test_date.pk) for email in emails], headers=('email', 'test_date'))
+
+    def test_bookings_import_and_refresh_the_stats(self):
+        emails = [user.email for user in self.users]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = BookingResource().import_data(self.bookings(emails))
+        self.assertEqual(result.totals['new'], 3)
+        stats_row = TestDateStats.objects.get(test_date=self.test_date)
+        self.assertEqual((stats_row.booked, stats_row.paid), (3, 3))
+
+        # Existing bookings are skipped; an unknown email fails only its own row
+        result = BookingResource().import_data(self.bookings(emails + ['nobody@example.com']))
+        self.assertEqual([row.number for row in result.invalid_rows], [4])
+        result = BookingResource().import_data(self.bookings(emails))
+        self.assertEqual((result.totals['new'], result.totals['skip']), (0, 3))
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_sessions_match_on_date_time_and_room(self):
+        rows = Dataset(('2030-09-01', '09:00', 'A101', 'Karimova', 30), ('2030-09-01', '09:00', 'B202', '', 20),
+                       headers=('date', 'time', 'room', 'proctor', 'max_spots'))
+        result = TestDateResource().import_data(rows)
+        self.assertEqual((result.totals['new'], result.totals['update']), (1, 1))
+        self.assertEqual(TestDate.objects.get(pk=self.test_date.pk).max_spots, 30)
+        self.assertIsNone(TestDate.objects.get(room='B202').proctor)
+
+    def test_more_seats_go_to_the_waitlist(self):
+        TestDate.objects.filter(pk=self.test_date.pk).update(max_spots=1)
+        Booking.objects.create(user=self.users[0], test_date=self.test_date)
+        for user in self.users[1:]:
+            Waitlist.objects.create(user=user, test_date=self.test_date)
+        rows = Dataset(('2030-09-01', '09:00', 'A101', 2), headers=('date', 'time', 'room', 'max_spots'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestDateResource().import_data(rows)
+        self.assertTrue(Booking.objects.filter(user=self.users[1], test_date=self.test_date).exists())
+        self.assertEqual(list(Waitlist.objects.values_list('user', flat=True)), [self.users[2].pk])
+        self.assertEqual([m.to for m in mail.outbox], [[self.users[1].email]])
+
+    def test_admin_import_runs_as_a_job(self):
+        self.client.force_login(self.admin)
+        csv = "email,test_date\n" + "".join(f"{user.email},{self.test_date.pk}\n" for user in self.users)
+        upload = SimpleUploadedFile('bookings.csv', csv.encode(), content_type='text/csv')
+
+        # The upload is queued as it is, without a dry run in the request
+        with mock.patch.object(BookingResource, 'import_data') as import_data:
+            response = self.client.post('/admin/app/booking/import/', {'import_file': upload, 'input_format': 0},
+                                        follow=True)
+        import_data.assert_not_called()
+        self.assertContains(response, 'Import queued.')
+        self.assertFalse(Booking.objects.exists())
+
+        call_command('run_jobs', '--once', '--processes', '0', stdout=io.StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.message), (Job.DONE, '3 new, 0 updated, 0 unchanged'))
+        self.assertEqual(Booking.objects.filter(test_date=self.test_date).count(), 3)
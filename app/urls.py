@@ -1,8 +1,21 @@
 from django.urls import path
 
+from .events import seat_events
 from .views import *
 
 urlpatterns = [
     path('dates', TestDateListAPIView.as_view(), name='test-dates'),
+    path('dates/by-day', TestDateDayListAPIView.as_view(), name='test-dates-by-day'),
     path('bookings', BookingListCreateAPIView.as_view(), name='bookings'),
+    path('bookings/<int:pk>', BookingDestroyAPIView.as_view(), name='booking-cancel'),
+    path('bookings/<int:pk>/reschedule', BookingRescheduleAPIView.as_view(), name='booking-reschedule'),
+    path('holds', SeatHoldCreateAPIView.as_view(), name='seat-hold'),
+    path('holds/<uuid:token>', SeatHoldDestroyAPIView.as_view(), name='seat-hold-release'),
+    path('holds/<uuid:token>/confirm', SeatHoldConfirmAPIView.as_view(), name='seat-hold-confirm'),
+    path('waitlist', WaitlistListCreateAPIView.as_view(), name='waitlist'),
+    path('waitlist/<int:pk>', WaitlistDestroyAPIView.as_view(), name='waitlist-leave'),
+    path('results/analytics', ResultAnalyticsAPIView.as_view(), name='result-analytics'),
+    path('async/dates', TestDateListAsyncView.as_view(), name='test-dates-async'),
+    path('async/bookings', BookingListAsyncView.as_view(), name='bookings-async'),
+    path('events/seats', seat_events, name='seat-events'),
 ]
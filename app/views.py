@@ -1,14 +1,66 @@
-from rest_framework import generics, permissions
+import logging
+from itertools import groupby
+from operator import attrgetter
 
-from .models import TestDate, Booking
-from .serializers import TestDateSerializer, BookingSerializer, BookingListSerializer
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views import View
+from drf_yasg.utils import no_body, swagger_auto_schema
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from root.database import retry_on_db_lock
+from users.models import User
+from . import analytics, services
+from .models import TestDate, Booking, SeatHold, Waitlist
+from .serializers import (
+    TestDateSerializer,
+    TestDateDaySerializer,
+    BookingSerializer,
+    BookingListSerializer,
+    BookingRescheduleSerializer,
+    SeatHoldSerializer,
+    WaitlistSerializer,
+    ResultAnalyticsFilterSerializer,
+)
+
+logger = logging.getLogger(__name__)
+
+DATES_CACHE_KEY = 'app:test-dates'
 
 
 class TestDateListAPIView(generics.ListAPIView):
-    queryset = TestDate.objects.all().order_by('date')
+    queryset = TestDate.objects.none()
     serializer_class = TestDateSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        # Built per request: the active-hold count compares against the current time
+        return TestDate.objects.with_seat_counts().order_by('date', 'time', 'room')
+
+
+class TestDateDayListAPIView(generics.GenericAPIView):
+    """Sessions grouped per day, with the day's total free seats.
+
+    One query for any number of sessions: seat counts come from the
+    `with_seat_counts` subqueries and the grouping is done on the ordered rows.
+    """
+    queryset = TestDate.objects.none()
+    serializer_class = TestDateDaySerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        sessions = TestDate.objects.with_seat_counts().order_by('date', 'time', 'room')
+        days = [
+            {'date': date, 'sessions': list(day_sessions)}
+            for date, day_sessions in groupby(sessions, key=attrgetter('date'))
+        ]
+        return Response(self.get_serializer(days, many=True).data)
+
 
 class BookingListCreateAPIView(generics.ListCreateAPIView):
     """List (only the booking dates for the requesting user) and create bookings.
@@ -33,4 +85,177 @@ class BookingListCreateAPIView(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         # Ensure the booking is created for the requesting user
-        serializer.save(user=self.request.user)
\ No newline at end of file
+        retry_on_db_lock(serializer.save)(user=self.request.user)
+
+
+class BookingDestroyAPIView(generics.DestroyAPIView):
+    """Cancel one of the requesting user's bookings; the seat goes to the next user on the waitlist."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Booking.objects.none()
+        return Booking.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        # The booking's receivers read its user; it's the requester, so skip the query
+        instance.user = self.request.user
+        retry_on_db_lock(services.cancel_booking)(instance)
+
+
+class BookingRescheduleAPIView(generics.GenericAPIView):
+    """Move one of the requesting user's bookings to another test date."""
+    serializer_class = BookingRescheduleSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Booking.objects.none()
+        return Booking.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        booking = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        booking = retry_on_db_lock(services.reschedule_booking)(booking, serializer.validated_data['test_date'].pk)
+        return Response(BookingSerializer(booking, context=self.get_serializer_context()).data)
+
+
+# -------------------- SEAT HOLDS --------------------
+class SeatHoldCreateAPIView(generics.CreateAPIView):
+    """Hold a seat on a date for SEAT_HOLD_SECONDS while the user pays; holding the same date again renews it."""
+    serializer_class = SeatHoldSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(responses={201: SeatHoldSerializer, 200: SeatHoldSerializer})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK)
+
+    def perform_create(self, serializer):
+        retry_on_db_lock(serializer.save)(user=self.request.user)
+
+
+class SeatHoldDestroyAPIView(generics.DestroyAPIView):
+    """Release a held seat."""
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'token'
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return SeatHold.objects.none()
+        return SeatHold.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        retry_on_db_lock(services.release_hold)(instance)
+
+
+class SeatHoldConfirmAPIView(SeatHoldDestroyAPIView):
+    """Turn a held seat into a booking once payment is done."""
+    http_method_names = ['post', 'options']
+
+    @swagger_auto_schema(request_body=no_body, responses={201: BookingSerializer})
+    def post(self, request, *args, **kwargs):
+        booking = retry_on_db_lock(services.confirm_hold)(self.get_object())
+        return Response(BookingSerializer(booking, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+# -------------------- WAITLIST --------------------
+class WaitlistListCreateAPIView(generics.ListCreateAPIView):
+    """List the requesting user's waitlist entries (with queue position) and join the waitlist of a full date."""
+    serializer_class = WaitlistSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Waitlist.objects.none()
+        return Waitlist.objects.filter(user=self.request.user).select_related('test_date').with_position()
+
+    def perform_create(self, serializer):
+        retry_on_db_lock(serializer.save)(user=self.request.user)
+
+
+class WaitlistDestroyAPIView(generics.DestroyAPIView):
+    """Leave a waitlist."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Waitlist.objects.none()
+        return Waitlist.objects.filter(user=self.request.user)
+
+
+# -------------------- RESULTS ANALYTICS --------------------
+class ResultAnalyticsAPIView(generics.GenericAPIView):
+    """Score histograms, decision counts and CEFR shares for staff.
+
+    Read from the precomputed ResultSummary rows (see app.analytics), filtered
+    by session date range, proctor and `is_bachelor`; `group_by` adds a
+    breakdown per session, proctor or cohort.
+    """
+    serializer_class = ResultAnalyticsFilterSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(query_serializer=ResultAnalyticsFilterSerializer, responses={200: 'Aggregated results report'})
+    def get(self, request, *args, **kwargs):
+        filters = self.get_serializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        return Response(analytics.report(**filters.validated_data))
+
+
+# -------------------- ASYNC (ASGI-NATIVE) READ ENDPOINTS --------------------
+async def _aauthenticate(request):
+    """Resolve the user like DEFAULT_AUTHENTICATION_CLASSES (JWT, then session) without blocking the loop."""
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is not None:
+        validated_token = authenticator.get_validated_token(raw_token)
+        lookup = {jwt_settings.USER_ID_FIELD: validated_token.get(jwt_settings.USER_ID_CLAIM)}
+        return await User.objects.filter(is_active=True, **lookup).afirst()
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+class TestDateListAsyncView(View):
+    """Async variant of `TestDateListAPIView`, served from the cache for DATES_CACHE_TIMEOUT seconds."""
+
+    async def get(self, request):
+        try:
+            payload = await cache.aget(DATES_CACHE_KEY)
+        except Exception as e:
+            logger.warning("Cache get failed: %s", e)
+            payload = None
+
+        if payload is None:
+            sessions = TestDate.objects.with_seat_counts().order_by('date', 'time', 'room')
+            dates = [date async for date in sessions.aiterator()]
+            payload = TestDateSerializer(dates, many=True).data
+            try:
+                await cache.aset(DATES_CACHE_KEY, payload, settings.DATES_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning("Cache set failed: %s", e)
+
+        return JsonResponse(payload, safe=False)
+
+
+class BookingListAsyncView(View):
+    """Async variant of `BookingListCreateAPIView` GET."""
+
+    async def get(self, request):
+        try:
+            user = await _aauthenticate(request)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return JsonResponse(detail, status=e.status_code)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        bookings = Booking.objects.filter(user=user).select_related('test_date').order_by('-created_at')
+        payload = BookingListSerializer([booking async for booking in bookings.aiterator()], many=True).data
+        return JsonResponse(payload, safe=False)
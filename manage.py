@@ -7,6 +7,8 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'root.settings')
+    # Migrations, imports and jobs legitimately run longer than a web request (see root/database.py)
+    os.environ.setdefault('DB_TIMEOUT_PROFILE', 'web' if sys.argv[1:2] == ['runserver'] else 'command')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'root.settings')
+# Web requests get a statement timeout (see root/database.py)
+os.environ.setdefault('DB_TIMEOUT_PROFILE', 'web')
 
 application = get_asgi_application()
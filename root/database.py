@@ -0,0 +1,180 @@
+"""Build `settings.DATABASES` from the environment.
+
+    DB_ENGINE=sqlite (default) | postgres
+    SQLITE_PATH                 database file, default <BASE_DIR>/db.sqlite3
+    SQLITE_BUSY_TIMEOUT         ms a writer waits for the lock, default 5000
+    SQLITE_MMAP_SIZE            bytes of the file to memory-map, default 128 MiB
+    SQLITE_CACHE_SIZE           page cache in KiB, default 64 MiB
+    POSTGRES_DB/USER/PASSWORD/HOST/PORT
+    DB_CONN_MAX_AGE             seconds to keep a connection open, default 60
+    DB_POOLER                   set (e.g. `pgbouncer`) when connecting through a
+                                transaction-mode pooler
+    DB_STATEMENT_TIMEOUT        ms before Postgres cancels a statement in web
+                                processes, default 5000 (0 turns it off)
+    DB_COMMAND_STATEMENT_TIMEOUT  the same for management commands, default off, so
+                                migrations, imports and the job worker aren't cut short
+    DB_TIMEOUT_PROFILE          `web` or `command`; set by the entry points
+                                (root/wsgi.py, root/asgi.py, manage.py), not by hand.
+                                Without one no statement timeout applies unless
+                                DB_STATEMENT_TIMEOUT is set.
+    DB_CONNECT_TIMEOUT          seconds to wait for a Postgres connection, default 5
+"""
+import functools
+import logging
+import os
+import random
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+LOCK_ERROR_MESSAGES = ('database is locked', 'database table is locked', 'deadlock detected')
+# ms; a request stuck on a slow query gives up instead of holding its worker and connection
+WEB_STATEMENT_TIMEOUT = 5000
+
+
+def statement_timeout(env):
+    """The statement timeout (ms, 0 for none) for this process's DB_TIMEOUT_PROFILE."""
+    profile = env.get('DB_TIMEOUT_PROFILE')
+    if profile == 'command':
+        return int(env.get('DB_COMMAND_STATEMENT_TIMEOUT') or 0)
+    value = env.get('DB_STATEMENT_TIMEOUT')
+    if value is None or value == '':
+        return WEB_STATEMENT_TIMEOUT if profile == 'web' else 0
+    return int(value)
+
+
+def sqlite_config(base_dir, env):
+    return {
+        'ENGINE': 'root.db_backends.sqlite3',
+        'NAME': env.get('SQLITE_PATH') or base_dir / 'db.sqlite3',
+        'OPTIONS': {
+            'pragmas': {
+                # Readers no longer block the writer, and a writer waits for the lock instead of failing
+                'journal_mode': 'WAL',
+                'busy_timeout': int(env.get('SQLITE_BUSY_TIMEOUT', 5000)),
+                # Durable at checkpoints rather than every commit; safe with WAL
+                'synchronous': 'NORMAL',
+                'mmap_size': int(env.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+                # Negative means KiB instead of pages
+                'cache_size': -int(env.get('SQLITE_CACHE_SIZE', 64 * 1024)),
+            },
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgres_config(env):
+    pooler = env.get('DB_POOLER')
+    options = {'connect_timeout': int(env.get('DB_CONNECT_TIMEOUT', 5))}
+    timeout = statement_timeout(env)
+    if timeout and not pooler:
+        # Transaction-mode poolers reject startup options; set it on the role the web
+        # processes connect as (not the one commands use): ALTER ROLE <user> SET statement_timeout = '5s'
+        options['options'] = f"-c statement_timeout={timeout}"
+
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('POSTGRES_DB'),
+        'USER': env.get('POSTGRES_USER'),
+        'PASSWORD': env.get('POSTGRES_PASSWORD'),
+        'HOST': env.get('POSTGRES_HOST', 'localhost'),
+        'PORT': env.get('POSTGRES_PORT', '5432'),
+        # Reuse a connection across requests instead of a TCP + auth handshake each time
+        'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 60)),
+        # ...and ping it before reuse so a restarted server doesn't surface as a 500
+        'CONN_HEALTH_CHECKS': True,
+        # A pooler may hand each transaction a different server connection, which
+        # breaks the named cursors behind .iterator()
+        'DISABLE_SERVER_SIDE_CURSORS': bool(pooler),
+        'OPTIONS': options,
+    }
+
+
+def database_config(base_dir, env=None):
+    """Return the `default` database settings selected by DB_ENGINE."""
+    env = os.environ if env is None else env
+    engine = env.get('DB_ENGINE', 'sqlite').lower()
+    if 'postgres' in engine:
+        return postgres_config(env)
+    if 'sqlite' in engine:
+        return sqlite_config(base_dir, env)
+    raise ValueError(f"Unsupported DB_ENGINE {engine!r}; use 'sqlite' or 'postgres'")
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return any(text in message for text in LOCK_ERROR_MESSAGES)
+
+
+def retry_on_db_lock(func=None, *, attempts=5, base_delay=0.05, max_delay=1.0, using=DEFAULT_DB_ALIAS):
+    """Run `func` in its own `atomic()` block, retrying it when the database is locked.
+
+    Backs off exponentially with full jitter so colliding writers don't
+    retry in lockstep. Inside an outer transaction there is nothing that can
+    be safely retried, so `func` then runs once and errors propagate.
+    Usable as `@retry_on_db_lock` or `@retry_on_db_lock(attempts=3)`.
+    """
+    if func is None:
+        return functools.partial(retry_on_db_lock, attempts=attempts, base_delay=base_delay,
+                                 max_delay=max_delay, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if connections[using].in_atomic_block:
+            return func(*args, **kwargs)
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == attempts or not is_lock_error(e):
+                    raise
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                logger.warning("Database locked in %s (attempt %s/%s), retrying in %.3fs",
+                               func.__qualname__, attempt, attempts, delay)
+                time.sleep(delay)
+
+    return wrapper
+
+
+class _CommitBatch:
+    """An on_commit callback handing the items collected at one savepoint level to `flush` in one call."""
+
+    def __init__(self, key, flush):
+        self.key = key
+        self.flush = flush
+        self.items = []
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.flush(self.items)
+
+
+def collect_on_commit(key, flush, *items, using=DEFAULT_DB_ALIAS):
+    """Add `items` to the `key` batch of the current transaction; `flush(items)` runs once when it commits.
+
+    The batch is an ordinary on_commit callback, so a rollback (of the
+    transaction or of a savepoint) discards its items along with it; a
+    thread-local buffer would leak them into the next commit. Items join a
+    batch registered at the current savepoint level or in savepoints released
+    into it, never one of an enclosing level that an inner rollback would
+    not discard. Outside a transaction `flush` runs right away.
+    """
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        flush(list(items))
+        return
+    savepoint_ids = set(connection.savepoint_ids)
+    for callback_savepoint_ids, callback, _ in reversed(connection.run_on_commit):
+        # Savepoints in the callback's set but not on the current stack have been released
+        # A batch that already ran (tests run callbacks without committing) takes no more items
+        if (isinstance(callback, _CommitBatch) and callback.key == key and not callback.done
+                and savepoint_ids <= callback_savepoint_ids):
+            callback.items.extend(items)
+            return
+    batch = _CommitBatch(key, flush)
+    batch.items.extend(items)
+    connection.on_commit(batch)
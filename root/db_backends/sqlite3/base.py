@@ -0,0 +1,34 @@
+from django.db.backends.sqlite3 import base
+
+BACKEND_OPTIONS = ('pragmas', 'transaction_mode')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite backend tuned for concurrent writers.
+
+    Django 5.0's sqlite backend passes OPTIONS straight to sqlite3.connect(),
+    so two extra keys are popped from the connect kwargs and handled here:
+
+    - `pragmas`: executed on every new connection (WAL, busy_timeout, ...).
+    - `transaction_mode`: how `atomic()` opens a transaction. With the
+      default DEFERRED a transaction that reads before it writes can find
+      another writer ahead of it and fail with "database is locked" without
+      waiting; IMMEDIATE takes the write lock up front, so it queues on
+      busy_timeout instead.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in BACKEND_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED')
+        self.cursor().execute(f"BEGIN {mode}")
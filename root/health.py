@@ -0,0 +1,152 @@
+import math
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import JsonResponse
+from django.urls import path
+from django.utils.module_loading import import_string
+
+_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='readyz')
+
+# name -> (future, started) of each check's last run; a check still running
+# is not submitted again, so a hung dependency can't pile up pool threads
+_running = {}
+# Cache client with the probe's socket timeouts, built on first use
+_probe_cache = None
+
+# (expires_at, payload, status_code) of the last readiness probe
+_last_probe = None
+_probe_lock = threading.Lock()
+
+
+def check_database():
+    timeout = settings.HEALTH_CHECK_TIMEOUTS['database']
+    connection = connections['default']
+    postgres = connection.vendor == 'postgresql'
+    if postgres:
+        # This pool thread's own wrapper; the shared settings keep DB_CONNECT_TIMEOUT
+        options = {**connection.settings_dict['OPTIONS'], 'connect_timeout': max(math.ceil(timeout), 2)}
+        connection.settings_dict = {**connection.settings_dict, 'OPTIONS': options}
+    try:
+        # SQLite's atomic() would take the write lock (BEGIN IMMEDIATE) for nothing
+        with connection.cursor() as cursor, transaction.atomic() if postgres else nullcontext():
+            if postgres:
+                cursor.execute(f'SET LOCAL statement_timeout = {int(timeout * 1000)}')
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    finally:
+        # Probes run on a pool thread that never goes through request_finished
+        connection.close()
+
+
+def check_cache():
+    global _probe_cache
+    if _probe_cache is None:
+        timeout = settings.HEALTH_CHECK_TIMEOUTS['cache']
+        params = settings.CACHES['default']
+        options = {**params.get('OPTIONS', {}), 'SOCKET_CONNECT_TIMEOUT': timeout, 'SOCKET_TIMEOUT': timeout}
+        _probe_cache = import_string(params['BACKEND'])(params.get('LOCATION', ''), {**params, 'OPTIONS': options})
+    _probe_cache.get('readyz:probe')
+
+
+def check_smtp():
+    if not settings.EMAIL_BACKEND.endswith('smtp.EmailBackend'):
+        return 'skipped'
+    timeout = settings.HEALTH_CHECK_TIMEOUTS['smtp']
+    with socket.create_connection((settings.EMAIL_HOST, settings.EMAIL_PORT), timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        # A 220 greeting proves there is an SMTP server behind the port, not just a listener
+        greeting = sock.recv(512)
+    if not greeting.startswith(b'220'):
+        raise ConnectionError(f"unexpected SMTP greeting {greeting[:80]!r}")
+    return 'ok'
+
+
+READINESS_CHECKS = {
+    'database': check_database,
+    'cache': check_cache,
+    'smtp': check_smtp,
+}
+
+
+def _timed(check):
+    started = time.perf_counter()
+    try:
+        result = {'status': check() or 'ok'}
+    except Exception as e:
+        result = {'status': 'error', 'error': str(e) or e.__class__.__name__}
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def run_readiness_checks():
+    """Run every dependency check in parallel, each bounded by its own timeout.
+
+    Call under _probe_lock. The checks also bound themselves (connect and
+    statement timeouts, socket timeouts), so a pool thread is not held for
+    long after its result was given up on.
+    """
+    timeouts = settings.HEALTH_CHECK_TIMEOUTS
+    started = time.monotonic()
+    results, futures = {}, {}
+    for name, check in READINESS_CHECKS.items():
+        previous = _running.get(name)
+        if previous is not None and not previous[0].done():
+            results[name] = {
+                'status': 'timeout', 'error': 'previous check still running',
+                'latency_ms': round((started - previous[1]) * 1000, 2),
+            }
+            continue
+        futures[name] = _executor.submit(_timed, check)
+        _running[name] = (futures[name], started)
+
+    for name, future in futures.items():
+        remaining = max(timeouts[name] - (time.monotonic() - started), 0)
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            results[name] = {'status': 'timeout', 'latency_ms': timeouts[name] * 1000}
+    return {name: results[name] for name in READINESS_CHECKS}
+
+
+def get_readiness():
+    """Return `(payload, status_code)`, re-probing at most once per HEALTH_CHECK_CACHE_SECONDS."""
+    global _last_probe
+
+    probe = _last_probe
+    if probe is not None and probe[0] > time.monotonic():
+        return probe[1], probe[2]
+
+    with _probe_lock:
+        probe = _last_probe
+        if probe is not None and probe[0] > time.monotonic():
+            return probe[1], probe[2]
+
+        checks = run_readiness_checks()
+        ready = all(result['status'] in ('ok', 'skipped') for result in checks.values())
+        payload = {'status': 'ok' if ready else 'unavailable', 'checks': checks}
+        status_code = 200 if ready else 503
+        _last_probe = (time.monotonic() + settings.HEALTH_CHECK_CACHE_SECONDS, payload, status_code)
+        return payload, status_code
+
+
+def healthz(request):
+    """Liveness probe: answers without touching the database, cache or schema generator."""
+    return JsonResponse({"status": "ok"})
+
+
+def readyz(request):
+    """Readiness probe: database, cache and SMTP reachability with per-dependency latency."""
+    payload, status_code = get_readiness()
+    return JsonResponse(payload, status=status_code)
+
+
+health_urls = [
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
+]
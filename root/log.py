@@ -0,0 +1,159 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+request_id_var = ContextVar('request_id', default='-')
+view_var = ContextVar('view', default='-')
+
+access_logger = logging.getLogger('root.requests')
+
+
+class QueueListenerHandler(QueueHandler):
+    """QueueHandler that owns a QueueListener writing to the real handlers.
+
+    Request threads only enqueue records; a single background thread does
+    the formatting and the console/file I/O, so slow disks and log rotation
+    never add latency to API calls. Configure it with
+    `'handlers': ['cfg://handlers.<name>', ...]`.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        super().__init__(queue.SimpleQueue())
+        # Index access so dictConfig's ConvertingList resolves the cfg:// references
+        self.target_handlers = [handlers[i] for i in range(len(handlers))]
+        self.respect_handler_level = respect_handler_level
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        # A listener thread started before a pre-fork server forks does not exist in the children
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def prepare(self, record):
+        # The stdlib version formats the record here (on the request thread) into
+        # its message and drops exc_info/stack_info; merging the args is enough to
+        # make it safe to hand over, and the target formatters still see the exception.
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        return record
+
+    def _after_fork(self):
+        self.queue = queue.SimpleQueue()
+        self.start()
+
+    def start(self):
+        self.listener = QueueListener(self.queue, *self.target_handlers,
+                                      respect_handler_level=self.respect_handler_level)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id and view.
+
+    Attach it to the queue handler so the context is read on the request
+    thread, before the record crosses over to the listener thread.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.view = view_var.get()
+        return True
+
+
+class ExcludeLoggerFilter(logging.Filter):
+    """Inverse of logging.Filter: drop records from `name` and its children."""
+
+    def filter(self, record):
+        return not super().filter(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request context fields."""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'view': getattr(record, 'view', '-'),
+        }
+        for field in ('latency_ms', 'status', 'method', 'path'):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class RequestContextMiddleware:
+    """Assign a request id, expose the resolved view to log records and log one access line per request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django wraps a sync process_view in a thread under ASGI; offer a native one instead
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._start(request)
+        try:
+            return self._finish(request, self.get_response(request), tokens)
+        finally:
+            self._reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self._start(request)
+        try:
+            return self._finish(request, await self.get_response(request), tokens)
+        finally:
+            self._reset(tokens)
+
+    def _start(self, request):
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        return request_id, request_id_var.set(request_id), view_var.set('-'), time.perf_counter()
+
+    def _finish(self, request, response, tokens):
+        request_id, _, _, started = tokens
+        response['X-Request-ID'] = request_id
+        access_logger.info(
+            "%s %s %s", request.method, request.path, response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
+        return response
+
+    def _reset(self, tokens):
+        _, request_token, view_token, _ = tokens
+        view_var.reset(view_token)
+        request_id_var.reset(request_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_var.set(request.resolver_match.view_name)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        view_var.set(request.resolver_match.view_name)
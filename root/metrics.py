@@ -0,0 +1,270 @@
+import ipaddress
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import path
+from django.utils.crypto import constant_time_compare
+
+from users.signals import cache_accessed
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'met_request_duration_seconds': ("Wall time spent handling a request.", DURATION_BUCKETS),
+    'met_db_queries_per_request': ("Database queries executed per request.", QUERY_COUNT_BUCKETS),
+    'met_db_duration_seconds': ("Time spent in database queries per request.", DURATION_BUCKETS),
+    'met_smtp_duration_seconds': ("Time spent sending email over SMTP per request.", DURATION_BUCKETS),
+}
+COUNTERS = {
+    'met_cache_operations_total': "getKey/setKey calls by result (hit, miss, set).",
+}
+
+_current_stats = ContextVar('met_request_stats', default=None)
+
+
+class RequestStats:
+    """Counters collected while a single sampled request is being handled."""
+    __slots__ = ('db_queries', 'db_time', 'cache_hits', 'cache_misses', 'cache_sets', 'smtp_time')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_sets = 0
+        self.smtp_time = 0.0
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _install_execute_wrapper(sender, connection, **kwargs):
+    """Keep `_execute_wrapper` on every connection.
+
+    A per-request `connection.execute_wrapper()` block would only see the
+    request thread's connection; async views run their queries on executor
+    threads, which the ContextVar follows but a thread-local wrapper does not.
+    """
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+connection_created.connect(_install_execute_wrapper)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-process histograms and counters labelled by resolved view name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def _observe(self, name, view, value):
+        histogram = self.histograms.get((name, view))
+        if histogram is None:
+            histogram = self.histograms[(name, view)] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+    def _inc(self, name, labels, value):
+        if value:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def record(self, view, duration, stats):
+        with self._lock:
+            self._observe('met_request_duration_seconds', view, duration)
+            self._observe('met_db_queries_per_request', view, stats.db_queries)
+            self._observe('met_db_duration_seconds', view, stats.db_time)
+            if stats.smtp_time:
+                self._observe('met_smtp_duration_seconds', view, stats.smtp_time)
+            self._inc('met_cache_operations_total', (view, 'hit'), stats.cache_hits)
+            self._inc('met_cache_operations_total', (view, 'miss'), stats.cache_misses)
+            self._inc('met_cache_operations_total', (view, 'set'), stats.cache_sets)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        for name, (description, _) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, view), histogram in histograms:
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        for name, description in COUNTERS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, (view, result)), value in counters:
+                if metric == name:
+                    lines.append(f'{name}{{view="{view}",result="{result}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def record_cache(result, count=1):
+    """Count `count` getKey/setKey key operations (`hit`, `miss` or `set`) against the current request."""
+    stats = _current_stats.get()
+    if stats is None or not count:
+        return
+    if result == 'hit':
+        stats.cache_hits += count
+    elif result == 'miss':
+        stats.cache_misses += count
+    else:
+        stats.cache_sets += count
+
+
+@receiver(cache_accessed)
+def _cache_accessed(sender, result, count=1, **kwargs):
+    record_cache(result, count)
+
+
+@contextmanager
+def track_smtp():
+    """Attribute the wall time of the wrapped SMTP send to the current request."""
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.smtp_time += time.perf_counter() - started
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, DB queries, cache hits/misses and SMTP time per view.
+
+    Only a `METRICS_SAMPLE_RATE` fraction of requests is instrumented; the
+    rest pass straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        registry.record(_view_name(request), time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        registry.record(_view_name(request), time.perf_counter() - started, stats)
+        return response
+
+    @staticmethod
+    def _sampled():
+        sample_rate = settings.METRICS_SAMPLE_RATE
+        return sample_rate >= 1 or (sample_rate > 0 and random.random() < sample_rate)
+
+
+def _allowed(request):
+    """A scraper presenting METRICS_TOKEN as a bearer token, or calling from METRICS_ALLOWED_IPS."""
+    token = settings.METRICS_TOKEN
+    if token:
+        scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and constant_time_compare(presented.strip(), token):
+            return True
+    address = request.META.get('REMOTE_ADDR')
+    if not address or not settings.METRICS_ALLOWED_IPS:
+        return False
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint; closed unless METRICS_TOKEN or METRICS_ALLOWED_IPS is set."""
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics_urls = [
+    path('metrics', metrics, name='metrics'),
+]
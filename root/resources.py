@@ -0,0 +1,203 @@
+"""Building blocks for the bulk django-import-export resources (users.resources, app.resources).
+
+import-export's defaults handle a file row by row: a SELECT to find each
+row's instance, another per foreign key, a deepcopy for the diff and one
+INSERT or UPDATE. BulkModelResource instead
+
+- loads every instance the file refers to up front, matched on the
+  resource's `instance_lookups` (PrefetchedInstanceLoader);
+- resolves foreign keys from values fetched once per file
+  (PrefetchedForeignKeyWidget);
+- skips unchanged rows by comparing with a snapshot taken at load time
+  rather than a deepcopy of every instance;
+- writes with bulk_create/bulk_update, IMPORT_BATCH_SIZE rows at a time,
+  updating only the columns present in the file.
+
+bulk_create and bulk_update send no signals, so subclasses redo what the
+model's receivers would have done in `after_bulk_import`.
+"""
+from django.conf import settings
+from django.db.models import Model, Q
+from import_export import resources, widgets
+from import_export.instance_loaders import ModelInstanceLoader
+
+# Values per IN (...) or OR'ed lookup query
+PREFETCH_CHUNK = 500
+
+
+def _chunks(items, size=PREFETCH_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _normalize(value):
+    """A spreadsheet cell as a lookup key: strings stripped, 12.0 read as 12."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _is_empty(value):
+    return value is None or value == ''
+
+
+class NullableCharWidget(widgets.CharWidget):
+    """Blank cells become None, so nullable unique columns (phone, passport_id) don't collide on ''."""
+
+    def clean(self, value, row=None, **kwargs):
+        if _is_empty(value) or (isinstance(value, str) and not value.strip()):
+            return None
+        return _normalize(value)
+
+
+class PrefetchedForeignKeyWidget(widgets.ForeignKeyWidget):
+    """A ForeignKeyWidget resolving values from one query per file instead of one per row."""
+
+    def __init__(self, model, field='pk', **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.cache = None
+
+    def prefetch(self, values):
+        keys = {_normalize(value) for value in values if not _is_empty(value)}
+        self.cache = {}
+        for chunk in _chunks(keys):
+            for obj in self.get_queryset(None, None).filter(**{f'{self.field}__in': chunk}):
+                self.cache[_normalize(getattr(obj, self.field))] = obj
+
+    def clean(self, value, row=None, **kwargs):
+        if self.cache is None:
+            return super().clean(value, row, **kwargs)
+        if _is_empty(value):
+            return None
+        obj = self.cache.get(_normalize(value))
+        if obj is None:
+            raise ValueError(f"{self.model._meta.verbose_name.capitalize()} {value!r} does not exist")
+        return obj
+
+
+class PrefetchedInstanceLoader(ModelInstanceLoader):
+    """Loads the instances of every row up front; a row matches on the first of `instance_lookups` that hits.
+
+    Each lookup is a tuple of resource field names, e.g. `(('email',),
+    ('passport_id',))`. Loaded instances carry an `_import_snapshot` of their
+    import field values for BulkModelResource.skip_row.
+    """
+
+    def __init__(self, resource, dataset=None):
+        super().__init__(resource, dataset)
+        self.instances = {}
+        rows = dataset.dict if dataset is not None and dataset.headers else []
+        headers = set(dataset.headers or ()) if dataset is not None else set()
+        self.lookups = [
+            lookup for lookup in resource.get_instance_lookups()
+            if all(resource.fields[name].column_name in headers for name in lookup)
+        ]
+        for lookup in self.lookups:
+            keys = {key for key in (self.row_key(lookup, row) for row in rows) if key is not None}
+            found = self.instances[lookup] = {}
+            for chunk in _chunks(keys):
+                for instance in self.get_queryset().filter(self.lookup_filter(lookup, chunk)):
+                    found[self.instance_key(lookup, instance)] = instance
+        for found in self.instances.values():
+            for instance in found.values():
+                if not hasattr(instance, '_import_snapshot'):
+                    instance._import_snapshot = resource.snapshot(instance)
+
+    def attribute(self, name):
+        """The model attribute behind resource field `name`; `<fk>_id` for relations."""
+        field = self.resource.fields[name]
+        model_field = self.resource._meta.model._meta.get_field(field.attribute)
+        return model_field.attname
+
+    def row_key(self, lookup, row):
+        try:
+            values = [self.resource.fields[name].clean(row) for name in lookup]
+        except Exception:
+            # The row itself reports the bad value when it is imported
+            return None
+        key = tuple(value.pk if isinstance(value, Model) else value for value in values)
+        return None if all(_is_empty(value) for value in key) else key
+
+    def instance_key(self, lookup, instance):
+        return tuple(getattr(instance, self.attribute(name)) for name in lookup)
+
+    def lookup_filter(self, lookup, keys):
+        attributes = [self.attribute(name) for name in lookup]
+        if len(attributes) == 1:
+            return Q(**{f'{attributes[0]}__in': [key[0] for key in keys]})
+        condition = Q()
+        for key in keys:
+            condition |= Q(**dict(zip(attributes, key)))
+        return condition
+
+    def get_instance(self, row):
+        for lookup in self.lookups:
+            key = self.row_key(lookup, row)
+            if key is not None and key in self.instances[lookup]:
+                return self.instances[lookup][key]
+        return None
+
+
+class BulkModelResource(resources.ModelResource):
+    """A ModelResource tuned for large files; see the module docstring."""
+
+    # Alternative keys a row is matched on, in order; defaults to import_id_fields
+    instance_lookups = None
+
+    class Meta:
+        use_bulk = True
+        batch_size = settings.IMPORT_BATCH_SIZE
+        use_transactions = True
+        skip_unchanged = True
+        # The loader's snapshot replaces the per-row deepcopy that the diff needs
+        skip_diff = True
+        report_skipped = False
+        instance_loader_class = PrefetchedInstanceLoader
+
+    @classmethod
+    def widget_from_django_field(cls, f, default=widgets.Widget):
+        if f.get_internal_type() == 'CharField' and f.null:
+            return NullableCharWidget
+        return super().widget_from_django_field(f, default)
+
+    def get_instance_lookups(self):
+        return self.instance_lookups or (tuple(self.get_import_id_fields()),)
+
+    def snapshot(self, instance):
+        return {field.column_name: field.get_value(instance) for field in self.get_import_fields()}
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        self.columns = set(dataset.headers or ())
+        self.saved = []
+        for field in self.get_import_fields():
+            if isinstance(field.widget, PrefetchedForeignKeyWidget) and field.column_name in self.columns:
+                field.widget.prefetch(dataset[field.column_name])
+
+    def get_bulk_update_fields(self):
+        model_fields = {f.name for f in self._meta.model._meta.concrete_fields if not f.primary_key}
+        return [
+            field.attribute for field in self.get_import_fields()
+            if field.attribute in model_fields and field.column_name in self.columns
+        ]
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        snapshot = getattr(instance, '_import_snapshot', None)
+        if import_validation_errors or snapshot is None or not self._meta.skip_unchanged:
+            return False
+        return all(
+            field.get_value(instance) == snapshot[field.column_name]
+            for field in self.get_import_fields() if field.column_name in row
+        )
+
+    def after_save_instance(self, instance, using_transactions, dry_run):
+        # Queued for the next bulk write; pks of new rows are set once it runs
+        self.saved.append(instance)
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        if dry_run or result.has_errors() or result.has_validation_errors() or not self.saved:
+            return
+        self.after_bulk_import(self.saved)
+
+    def after_bulk_import(self, instances):
+        """Redo what signal receivers would have done for the written `instances`."""
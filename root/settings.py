@@ -1,8 +1,11 @@
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
+from root.database import database_config
+
 load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,6 +43,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'root.static.StaticFilesMiddleware',
+    'root.log.RequestContextMiddleware',
+    'root.metrics.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,25 +75,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'root.wsgi.application'
 
+# Database Config
+# DB_ENGINE picks SQLite (default) or PostgreSQL; see root/database.py for the variables
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql_psycopg2'),
-#         'NAME': os.getenv('POSTGRES_DB'),
-#         'USER': os.getenv('POSTGRES_USER'),
-#         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-#         'HOST': os.getenv('POSTGRES_HOST'),
-#         'PORT': os.getenv('POSTGRES_PORT'),
-#         'DISABLE_SERVER_SIDE_CURSORS': True,
-#     }
-# }
-
 # AUTH_PASSWORD_VALIDATORS = [
 #     {
 #         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -117,6 +110,20 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR / 'staticfiles')
 
+# Static files are served in-process by WhiteNoise (root.static.StaticFilesMiddleware).
+# `collectstatic` writes content-hashed copies plus .gz/.br variants next to them, and
+# hashed files are sent with a far-future `immutable` Cache-Control header.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+# Fall back to the unhashed name instead of raising when the manifest is stale
+WHITENOISE_MANIFEST_STRICT = False
+
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR / 'media')
 
@@ -124,6 +131,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Swagger Config
 
+# Identifies the deployed code (e.g. the git SHA); the cached OpenAPI schema is keyed on it
+CODE_VERSION = os.getenv('CODE_VERSION', 'dev')
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'openapi'
+
 SWAGGER_SETTINGS = {
     'VALIDATOR_URL': 'http://localhost:8189',
     'DEFAULT_INFO': 'import.path.to.urls.api_info',
@@ -229,6 +240,94 @@ CACHES = {
     }
 }
 
+# Key version per users.models cache namespace; bump one when its entry format changes
+CACHE_KEY_VERSIONS = {
+    'registration': 2,
+    'verification': 2,
+    'results': 1,
+}
+
+# Cache Codec Config
+# Namespaces stored with users.codec (short field names, `json` or `msgpack`) instead of pickle,
+# zlib-compressed from CACHE_CODEC_COMPRESS_MIN_BYTES; see tools/bench_cache_codec.py
+CACHE_CODEC = os.getenv('CACHE_CODEC', 'json')
+CACHE_CODEC_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_CODEC_COMPRESS_MIN_BYTES', 512))
+CACHE_CODEC_NAMESPACES = ('registration', 'verification')
+
+# Seconds the async dates endpoint serves its list from the cache
+DATES_CACHE_TIMEOUT = 2
+
+# Seat Hold Config
+# How long a held seat stays out of the pool while the user pays (Payme, Click, Xazna)
+SEAT_HOLD_SECONDS = int(os.getenv('SEAT_HOLD_SECONDS', 15 * 60))
+# Active holds one user may have at a time, across all dates
+SEAT_HOLD_MAX_PER_USER = int(os.getenv('SEAT_HOLD_MAX_PER_USER', 1))
+
+# Seat Events Config
+# `redis` fans seat changes out through pub/sub to every node; `local` only reaches this process.
+# Defaults to `redis` only when SEAT_EVENTS_REDIS_URL is set.
+SEAT_EVENTS_BACKEND = os.getenv('SEAT_EVENTS_BACKEND', 'redis' if os.getenv('SEAT_EVENTS_REDIS_URL') else 'local')
+SEAT_EVENTS_REDIS_URL = os.getenv('SEAT_EVENTS_REDIS_URL', CACHES['default']['LOCATION'])
+# Seconds between keep-alive comments on an idle stream
+SEAT_EVENTS_HEARTBEAT = 15
+
+# Lock Config
+# Backend of users.locks: `redis` (expiring SET NX PX locks with renewal and fencing tokens on the
+# default cache), `postgres` (advisory locks) or `file` (flock in LOCK_DIR, single node only)
+LOCK_BACKEND = os.getenv('LOCK_BACKEND', 'redis')
+LOCK_DIR = os.getenv('LOCK_DIR', os.path.join(tempfile.gettempdir(), 'met_wut_locks'))
+# Seconds a redis lock lives without renewal; held locks are renewed every third of it
+LOCK_TTL = int(os.getenv('LOCK_TTL', 60))
+
+# Jobs Config
+# Pool processes of the `run_jobs` worker that runs queued admin operations (app.jobs)
+JOBS_PROCESSES = int(os.getenv('JOBS_PROCESSES', 2))
+# Seconds between heartbeats of running jobs, and without one before a running job counts as dead
+JOBS_HEARTBEAT_SECONDS = int(os.getenv('JOBS_HEARTBEAT_SECONDS', 30))
+JOBS_STALE_SECONDS = int(os.getenv('JOBS_STALE_SECONDS', 300))
+
+# Import Config
+# Rows per bulk_create/bulk_update of the admin imports (root.resources)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+# Enrollment Config
+# Processes hashing supplied passwords in bulk enrollment (users.enrollment); 1 hashes in-process.
+# Every web worker that enrolls a large batch keeps this many extra processes, so keep it small
+ENROLLMENT_PROCESSES = int(os.getenv('ENROLLMENT_PROCESSES', 2))
+# Most candidates per bulk-register request or enroll_candidates file
+ENROLLMENT_MAX_CANDIDATES = int(os.getenv('ENROLLMENT_MAX_CANDIDATES', 5000))
+# Invitation emails per send_messages call on the shared SMTP connection
+ENROLLMENT_EMAIL_BATCH = int(os.getenv('ENROLLMENT_EMAIL_BATCH', 100))
+
+# Results Config
+# How long a candidate's results payload stays cached (it is dropped on every change anyway)
+RESULTS_CACHE_TIMEOUT = int(os.getenv('RESULTS_CACHE_TIMEOUT', 7 * 24 * 3600))
+# ...and an entry rebuilt on a miss, which may race with an invalidation
+RESULTS_MISS_CACHE_TIMEOUT = int(os.getenv('RESULTS_MISS_CACHE_TIMEOUT', 60))
+
+# Test Date Stats Config
+# `table` keeps app.TestDateStats current with signal deltas; `materialized_view` (PostgreSQL only)
+# reads the app_testdatestats_mv view instead, refreshed by `rebuild_test_date_stats --interval`
+TEST_DATE_STATS_SOURCE = os.getenv('TEST_DATE_STATS_SOURCE', 'table')
+
+# Health Check Config
+# Per-dependency timeouts (seconds) for /readyz, and how long a probe result is reused
+HEALTH_CHECK_TIMEOUTS = {
+    'database': 2,
+    'cache': 1,
+    'smtp': 3,
+}
+HEALTH_CHECK_CACHE_SECONDS = 5
+
+# Metrics Config
+# Fraction of requests instrumented by RequestMetricsMiddleware (0 disables it)
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0))
+# /metrics answers scrapers sending `Authorization: Bearer <METRICS_TOKEN>` or calling from one of
+# METRICS_ALLOWED_IPS (comma-separated addresses or networks); with neither set it is closed.
+# Behind a reverse proxy on the same host every caller is 127.0.0.1, so prefer the token there.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
 # Logging Configuration
 
 # Create logs directory if it doesn't exist
@@ -248,6 +347,21 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'root.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'request_context': {
+            '()': 'root.log.RequestContextFilter',
+        },
+        'mail_only': {
+            'name': 'django.core.mail',
+        },
+        'exclude_mail': {
+            '()': 'root.log.ExcludeLoggerFilter',
+            'name': 'django.core.mail',
+        },
     },
     'handlers': {
         'console': {
@@ -259,35 +373,44 @@ LOGGING = {
             'filename': str(LOGS_DIR / 'django.log'),
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json',
+            'filters': ['exclude_mail'],
         },
         'mail_file': {
             'class': 'logging.handlers.RotatingFileHandler',
             'filename': str(LOGS_DIR / 'email.log'),
             'maxBytes': 1024 * 1024 * 10,  # 10 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json',
+            'filters': ['mail_only'],
+        },
+        # Every logger writes through this one queue; a single listener thread
+        # does the console and file I/O. Must sort after the handlers it references.
+        'queue': {
+            '()': 'root.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file', 'cfg://handlers.mail_file'],
+            'filters': ['request_context'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'users': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'django.core.mail': {
-            'handlers': ['console', 'mail_file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': False,
         },
     },
     'root': {
-        'handlers': ['console'],
+        'handlers': ['queue'],
         'level': 'INFO',
     },
 }
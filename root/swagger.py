@@ -1,21 +1,122 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
 from django.urls import re_path
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework import permissions
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from drf_yasg.codecs import OpenAPICodecYaml
+from drf_yasg.renderers import _SpecRenderer
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="MET WUT API",
-        default_version='v1',
-        description="**Created by Zokirjonova Muslima**\n\n**MET WUT API Documentation**\n\n**Version 1.0**",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@snippets.local"),
-        license=openapi.License(name="Zokirjonova Muslima"),
-    ),
+api_info = openapi.Info(
+    title="MET WUT API",
+    default_version='v1',
+    description="**Created by Zokirjonova Muslima**\n\n**MET WUT API Documentation**\n\n**Version 1.0**",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@snippets.local"),
+    license=openapi.License(name="Zokirjonova Muslima"),
+)
+
+SchemaView = get_schema_view(
+    api_info,
     public=True,
     permission_classes=[permissions.AllowAny],
 )
 
+SCHEMA_FORMATS = ('json', 'yaml')
+
+# (code version, format) -> (body, etag); filled once per process
+_schema_cache = {}
+_schema_lock = threading.Lock()
+
+
+def schema_path(fmt, version=None):
+    """Location of the pre-generated schema for `fmt` and the given code version."""
+    version = version or settings.CODE_VERSION
+    return settings.OPENAPI_SCHEMA_DIR / f"openapi-{version}.{fmt}"
+
+
+def generate_schema_documents():
+    """Walk every view once and encode the public schema as JSON and YAML bytes.
+
+    Views are introspected against an anonymous mock request, and `url=''`
+    keeps that request's host out of the document so one copy fits every host.
+    """
+    request = APIView().initialize_request(APIRequestFactory().get('/swagger.json'))
+    generator = SchemaView.generator_class(api_info, url='')
+    schema = generator.get_schema(request=request, public=True)
+    documents = {}
+    for renderer_class in SchemaView.renderer_classes:
+        fmt = 'yaml' if renderer_class.codec_class is OpenAPICodecYaml else 'json'
+        if fmt not in documents:
+            documents[fmt] = renderer_class().render(schema)
+    return documents
+
+
+def get_schema_document(fmt):
+    """Return `(body, etag)` for the schema in `fmt`.
+
+    Looks in process memory first, then on disk (written by the
+    `generate_openapi_schema` command), and only generates the schema when
+    neither has a copy for the current code version.
+    """
+    version = settings.CODE_VERSION
+    cached = _schema_cache.get((version, fmt))
+    if cached is not None:
+        return cached
+
+    with _schema_lock:
+        cached = _schema_cache.get((version, fmt))
+        if cached is not None:
+            return cached
+
+        documents = {}
+        for name in SCHEMA_FORMATS:
+            path = schema_path(name, version)
+            if path.exists():
+                documents[name] = path.read_bytes()
+        if len(documents) != len(SCHEMA_FORMATS):
+            documents = generate_schema_documents()
+
+        for name, body in documents.items():
+            etag = '"%s-%s"' % (version, hashlib.sha1(body).hexdigest()[:16])
+            _schema_cache[(version, name)] = (body, etag)
+        return _schema_cache[(version, fmt)]
+
+
+class CachedSchemaView(SchemaView):
+    """Schema view that serves pre-rendered JSON/YAML instead of regenerating it.
+
+    The UI renderers already build an empty schema, so only the spec
+    formats (`?format=openapi`, `swagger.json`, `swagger.yaml`) are cached.
+    """
+
+    def get(self, request, version='', format=None):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, _SpecRenderer):
+            return super().get(request, version, format)
+
+        fmt = 'yaml' if renderer.codec_class is OpenAPICodecYaml else 'json'
+        body, etag = get_schema_document(fmt)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type=f"{renderer.media_type}; charset=utf-8")
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+schema_view = CachedSchemaView
+
 swagger_urls = [
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0),
             name='schema-json'),
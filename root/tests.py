@@ -0,0 +1,373 @@
+import io
+import json
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.db import OperationalError, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from root import database, health, log, metrics, swagger
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CODE_VERSION='test')
+class SchemaCacheTests(SimpleTestCase):
+    def setUp(self):
+        swagger._schema_cache.clear()
+
+    def test_schema_is_generated_once_per_process(self):
+        with mock.patch.object(swagger, 'generate_schema_documents',
+                               wraps=swagger.generate_schema_documents) as generate:
+            first = self.client.get('/swagger.json')
+            second = self.client.get('/?format=openapi')
+            yaml = self.client.get('/swagger.yaml')
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertIn(b'swagger:', yaml.content)
+
+    def test_matching_etag_returns_not_modified(self):
+        response = self.client.get('/swagger.json')
+        etag = response['ETag']
+
+        cached = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+
+    def test_new_code_version_invalidates_schema(self):
+        etag = self.client.get('/swagger.json')['ETag']
+
+        with override_settings(CODE_VERSION='next'):
+            response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class HealthTests(SimpleTestCase):
+    def test_healthz(self):
+        response = self.client.get('/healthz')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    HEALTH_CHECK_TIMEOUTS={'database': 2, 'cache': 0.2, 'smtp': 2},
+)
+class ReadinessTests(TestCase):
+    def setUp(self):
+        health._last_probe = None
+        health._running.clear()
+        health._probe_cache = None
+
+    def test_readyz_reports_each_dependency(self):
+        response = self.client.get('/readyz')
+
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()['checks']
+        self.assertEqual(checks['database']['status'], 'ok')
+        self.assertEqual(checks['cache']['status'], 'ok')
+        self.assertEqual(checks['smtp']['status'], 'skipped')
+        self.assertIn('latency_ms', checks['database'])
+
+    def test_failing_dependency_makes_service_unavailable(self):
+        def broken():
+            raise ConnectionError('redis down')
+
+        with mock.patch.dict(health.READINESS_CHECKS, cache=broken):
+            response = self.client.get('/readyz')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['cache'], {
+            'status': 'error', 'error': 'redis down', 'latency_ms': mock.ANY,
+        })
+
+    def test_failing_dependency_latency_is_its_own(self):
+        def broken():
+            raise ConnectionError('redis down')
+
+        with mock.patch.dict(health.READINESS_CHECKS, database=lambda: time.sleep(0.3), cache=broken):
+            checks = self.client.get('/readyz').json()['checks']
+
+        self.assertGreaterEqual(checks['database']['latency_ms'], 300)
+        self.assertLess(checks['cache']['latency_ms'], 100)
+
+    def test_hung_check_is_not_started_again(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def hung():
+            calls.append(1)
+            release.wait(5)
+
+        with mock.patch.dict(health.READINESS_CHECKS, cache=hung):
+            self.client.get('/readyz')
+            health._last_probe = None
+            checks = self.client.get('/readyz').json()['checks']
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(checks['cache']['status'], 'timeout')
+        self.assertEqual(checks['cache']['error'], 'previous check still running')
+        self.assertEqual(checks['database']['status'], 'ok')
+
+    def test_slow_dependency_is_cut_off_by_its_timeout(self):
+        with mock.patch.dict(health.READINESS_CHECKS, cache=lambda: time.sleep(1)):
+            started = time.monotonic()
+            response = self.client.get('/readyz')
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.json()['checks']['cache']['status'], 'timeout')
+
+    def test_probe_result_is_reused(self):
+        check = mock.Mock(return_value=None)
+
+        with mock.patch.dict(health.READINESS_CHECKS, cache=check):
+            self.client.get('/readyz')
+            self.client.get('/readyz')
+
+        check.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_SAMPLE_RATE=1.0, METRICS_TOKEN='scrape-token', METRICS_ALLOWED_IPS=[])
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    def scrape(self, **extra):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token', **extra)
+
+    def test_scrapes_need_the_token_or_an_allowed_address(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.scrape().status_code, 200)
+
+        with self.settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='192.0.2.1').status_code, 403)
+            # Nothing configured: closed
+            with self.settings(METRICS_ALLOWED_IPS=[]):
+                self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 403)
+
+    def test_request_is_recorded_per_view(self):
+        self.client.get('/healthz')
+
+        body = self.scrape().content.decode()
+
+        self.assertIn('met_request_duration_seconds_count{view="healthz"} 1', body)
+        self.assertIn('met_db_queries_per_request_bucket{view="healthz",le="0"} 1', body)
+
+    def test_database_queries_are_counted(self):
+        self.client.get('/api/v1/dates')
+
+        histogram = metrics.registry.histograms[('met_db_queries_per_request', 'test-dates')]
+        self.assertEqual(histogram.sum, 1)
+
+    def test_cache_lookups_are_counted(self):
+        self.client.post('/api/v1/users/register-activate-code',
+                         {'email': 'nobody@example.com', 'activate_code': 123456})
+
+        body = self.scrape().content.decode()
+        self.assertIn('view="users.views.CheckActivationCodeGenericAPIView",result="miss"} 1', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_can_disable_instrumentation(self):
+        self.client.get('/healthz')
+
+        self.assertEqual(metrics.registry.histograms, {})
+
+
+class RequestLoggingTests(SimpleTestCase):
+    def test_access_line_carries_request_context(self):
+        with self.assertLogs('root.requests', level='INFO') as logs:
+            response = self.client.get('/healthz', HTTP_X_REQUEST_ID='abc123')
+
+        self.assertEqual(response['X-Request-ID'], 'abc123')
+        record = logs.records[0]
+        self.assertEqual(record.status, 200)
+        self.assertGreaterEqual(record.latency_ms, 0)
+
+    def test_json_formatter_includes_request_id_and_view(self):
+        record = logging.LogRecord('users', logging.INFO, __file__, 1, "Login for %s", ('a@b.c',), None)
+        request_token = log.request_id_var.set('req-1')
+        view_token = log.view_var.set('test-dates')
+        try:
+            log.RequestContextFilter().filter(record)
+        finally:
+            log.view_var.reset(view_token)
+            log.request_id_var.reset(request_token)
+
+        payload = json.loads(log.JsonFormatter().format(record))
+
+        self.assertEqual(payload['message'], 'Login for a@b.c')
+        self.assertEqual(payload['request_id'], 'req-1')
+        self.assertEqual(payload['view'], 'test-dates')
+
+
+    def test_queued_records_keep_the_exception_for_the_formatter(self):
+        stream = io.StringIO()
+        target = logging.StreamHandler(stream)
+        target.setFormatter(log.JsonFormatter())
+        handler = log.QueueListenerHandler([target])
+        self.addCleanup(handler.stop)
+        logger = logging.getLogger('root.tests.queue')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.error("Import of %s failed", 'users.csv', exc_info=True)
+        handler.stop()
+
+        payload = json.loads(stream.getvalue())
+        self.assertEqual(payload['message'], 'Import of users.csv failed')
+        self.assertIn('ValueError: boom', payload['exc_info'])
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    POSTGRES_ENV = {
+        'DB_ENGINE': 'postgres',
+        'POSTGRES_DB': 'met',
+        'POSTGRES_USER': 'met',
+        'POSTGRES_PASSWORD': 'secret',
+        'POSTGRES_HOST': 'db',
+    }
+
+    def test_sqlite_is_the_default(self):
+        config = database.database_config(Path('/srv'), env={})
+        self.assertEqual(config['ENGINE'], 'root.db_backends.sqlite3')
+        self.assertEqual(config['NAME'], Path('/srv/db.sqlite3'))
+
+    def test_postgres_keeps_connections_with_health_checks(self):
+        config = database.database_config(Path('/srv'), env=self.POSTGRES_ENV)
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertFalse(config['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_statement_timeout_depends_on_the_profile(self):
+        def options(**env):
+            return database.database_config(Path('/srv'), env={**self.POSTGRES_ENV, **env})['OPTIONS'].get('options')
+
+        self.assertIsNone(options())
+        self.assertEqual(options(DB_TIMEOUT_PROFILE='web'), '-c statement_timeout=5000')
+        self.assertEqual(options(DB_TIMEOUT_PROFILE='web', DB_STATEMENT_TIMEOUT='2000'), '-c statement_timeout=2000')
+        self.assertIsNone(options(DB_TIMEOUT_PROFILE='web', DB_STATEMENT_TIMEOUT='0'))
+        # Commands only get their own setting
+        self.assertIsNone(options(DB_TIMEOUT_PROFILE='command', DB_STATEMENT_TIMEOUT='2000'))
+        self.assertEqual(options(DB_TIMEOUT_PROFILE='command', DB_COMMAND_STATEMENT_TIMEOUT='60000'),
+                         '-c statement_timeout=60000')
+
+    def test_pooler_mode_disables_server_side_cursors_and_startup_options(self):
+        config = database.database_config(Path('/srv'), env={**self.POSTGRES_ENV, 'DB_POOLER': 'pgbouncer',
+                                                              'DB_STATEMENT_TIMEOUT': '5000'})
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('options', config['OPTIONS'])
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            database.database_config(Path('/srv'), env={'DB_ENGINE': 'oracle'})
+
+    def test_sqlite_connections_use_wal_and_busy_timeout(self):
+        path = Path(tempfile.mkdtemp()) / 'wal.sqlite3'
+        config = database.database_config(Path('/srv'), env={'SQLITE_PATH': str(path), 'SQLITE_BUSY_TIMEOUT': '1234'})
+        connection = ConnectionHandler({'default': config})['default']
+        try:
+            with connection.cursor() as cursor:
+                self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
+        finally:
+            connection.close()
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    ALIAS = 'concurrency'
+
+    def setUp(self):
+        path = Path(tempfile.mkdtemp()) / 'concurrency.sqlite3'
+        config = database.database_config(Path('/srv'), env={'SQLITE_PATH': str(path), 'SQLITE_BUSY_TIMEOUT': '10000'})
+        # A real alias so transaction.atomic() goes through the backend's BEGIN IMMEDIATE
+        patcher = mock.patch.dict(connections.settings, {self.ALIAS: ConnectionHandler({'default': config}).settings['default']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute('CREATE TABLE seats (id INTEGER PRIMARY KEY, taken INTEGER)')
+        self.addCleanup(self.drop_connection)
+
+    def drop_connection(self):
+        connections[self.ALIAS].close()
+        del connections[self.ALIAS]
+
+    def test_concurrent_writers_do_not_hit_lock_errors(self):
+        writers, writes = 8, 25
+        errors = []
+
+        @database.retry_on_db_lock(using=self.ALIAS)
+        def take_seat():
+            # Read-then-write: under BEGIN DEFERRED this upgrade is where "database is locked" comes from
+            with connections[self.ALIAS].cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM seats')
+                taken = cursor.fetchone()[0]
+                time.sleep(0.001)  # let the other writers pile up behind us
+                cursor.execute('INSERT INTO seats (taken) VALUES (%s)', [taken + 1])
+
+        def writer():
+            try:
+                for _ in range(writes):
+                    take_seat()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.ALIAS].close()
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*), COUNT(DISTINCT taken), MAX(taken) FROM seats')
+            self.assertEqual(cursor.fetchone(), (writers * writes,) * 3)
+
+    def test_lock_errors_are_retried_with_backoff(self):
+        calls = []
+
+        @database.retry_on_db_lock(using=self.ALIAS, base_delay=0)
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(flaky(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_and_outer_transactions_are_not_retried(self):
+        calls = []
+
+        @database.retry_on_db_lock(using=self.ALIAS, base_delay=0)
+        def broken():
+            calls.append(1)
+            raise OperationalError('no such table: missing')
+
+        with self.assertRaises(OperationalError):
+            broken()
+        with self.assertRaises(OperationalError), transaction.atomic(using=self.ALIAS):
+            broken()
+        self.assertEqual(len(calls), 2)
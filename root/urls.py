@@ -2,7 +2,9 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
-from root.settings import MEDIA_URL, MEDIA_ROOT, STATIC_URL, STATIC_ROOT
+from root.settings import MEDIA_URL, MEDIA_ROOT
+from root.health import health_urls
+from root.metrics import metrics_urls
 from root.swagger import schema_view, swagger_urls
 
 urlpatterns = [
@@ -14,5 +16,5 @@ urlpatterns = [
     path('api/v1/users/', include('users.urls')),
 
 
-] + swagger_urls + static(MEDIA_URL, document_root=MEDIA_ROOT) + static(STATIC_URL,document_root=STATIC_ROOT)
+] + health_urls + metrics_urls + swagger_urls + static(MEDIA_URL, document_root=MEDIA_ROOT)
 
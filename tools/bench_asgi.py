@@ -0,0 +1,140 @@
+"""Compare the sync and async read endpoints under ASGI at rising concurrency.
+
+Drives `root.asgi.application` directly with raw ASGI scopes (no server or
+socket in between) against the same seeded database as tools/benchmark.py,
+so the numbers isolate what the handler does with its event loop and
+threads. Each level fires `--requests` requests with at most `concurrency`
+in flight.
+
+    python tools/bench_asgi.py
+    python tools/bench_asgi.py --levels 1 10 100 --requests 500
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmark import _auth, bench_environment, git_revision, save_results, seed, summarize  # noqa: E402 (runs django.setup())
+
+from root.asgi import application  # noqa: E402
+
+ENDPOINTS = {
+    'dates_sync': ('/api/v1/dates', False),
+    'dates_async': ('/api/v1/async/dates', False),
+    'bookings_sync': ('/api/v1/bookings', True),
+    'bookings_async': ('/api/v1/async/bookings', True),
+}
+
+
+async def asgi_get(path, headers):
+    """Send one GET through the ASGI application and return its status code."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The handler listens for a disconnect while the response is built
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+async def run_level(path, header_for, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            status = await asgi_get(path, header_for(i))
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, [], statuses, time.perf_counter() - started)
+
+
+def print_results(results):
+    print(f"\n{'endpoint':<16} {'conc':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}  statuses")
+    for name, levels in results['scenarios'].items():
+        for level, row in levels.items():
+            print(f"{name:<16} {level:>5} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+                  f"{row['throughput_rps']:>9}  {row['statuses']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--dates', type=int, default=300)
+    parser.add_argument('--bookings', type=int, default=10_000)
+    parser.add_argument('--requests', type=int, default=1000, help="requests per endpoint and level")
+    parser.add_argument('--levels', type=int, nargs='*', default=[1, 10, 100, 1000])
+    parser.add_argument('--only', nargs='*', help="run only these endpoints")
+    parser.add_argument('--output', help="results path (default tools/baselines/<git sha>-asgi.json)")
+    args = parser.parse_args(argv)
+
+    results = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'asgi',
+        'size': {'users': args.users, 'dates': args.dates, 'bookings': args.bookings},
+        'scenarios': {},
+    }
+    with bench_environment():
+        ids = seed(args.users, args.dates, args.bookings)
+        # Encode the tokens up front so signing is not part of the measurement
+        booked = ids['booked_user_ids']
+        tokens = [_auth(user_id)['HTTP_AUTHORIZATION'].encode() for user_id in booked[:args.requests]]
+
+        for name, (path, authenticated) in ENDPOINTS.items():
+            if args.only and name not in args.only:
+                continue
+            if authenticated:
+                def header_for(i):
+                    return [(b'authorization', tokens[i % len(tokens)])]
+            else:
+                def header_for(i):
+                    return []
+            results['scenarios'][name] = {}
+            for level in args.levels:
+                print(f"running {name} at concurrency {level} ...", flush=True)
+                results['scenarios'][name][str(level)] = asyncio.run(
+                    run_level(path, header_for, args.requests, level))
+
+    print_results(results)
+    path = save_results(results, args.output or PROJECT_ROOT / 'tools' / 'baselines' / f"{results['revision']}-asgi.json")
+    print(f"\nSaved {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Compare pickle with users.codec for cached registration and verification entries.
+
+Builds realistic pending-registration and verification payloads and reports,
+per strategy, the bytes stored in Redis per entry and the encode/decode time.
+django-redis pickles whatever it is given, so the codec strategies are
+measured as they are stored: the encoded bytes wrapped in pickle.
+
+    python tools/bench_cache_codec.py
+    python tools/bench_cache_codec.py --entries 50000 --output /tmp/codec.json
+"""
+import argparse
+import json
+import pickle
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from users import codec  # noqa: E402 (plain module, no Django setup needed)
+
+
+def registration(rng, i):
+    return {
+        'user': {
+            'first_name': rng.choice(['Ali', 'Dilnoza', 'Jasur', 'Madina', 'Sardor']),
+            'last_name': rng.choice(['Valiyev', 'Karimova', 'Tashkentov', 'Rahimova']),
+            'email': f'candidate{i}@example.com',
+            'phone': f'+99890{rng.randrange(10**7):07d}',
+            'passport_id': 'AA' + ''.join(rng.choices(string.digits, k=7)),
+            'is_bachelor': rng.random() < 0.4,
+            'password': ''.join(rng.choices(string.ascii_letters + string.digits, k=12)),
+            'is_active': False,
+        },
+        'activate_code': rng.randrange(100000, 1000000),
+    }
+
+
+def verification(rng, i):
+    return {'activate_code': str(rng.randrange(100000, 1000000))}
+
+
+def strategies(compress_min_bytes):
+    def pickled(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    found = {'pickle': (pickled, pickle.loads)}
+    formats = [codec.JSON] + ([codec.MSGPACK] if codec.msgpack is not None else [])
+    for format in formats:
+        for label, threshold in ((format, None), (f'{format}+zlib', compress_min_bytes)):
+            def dumps(value, format=format, threshold=threshold):
+                return pickled(codec.encode(value, format, threshold))
+
+            def loads(data):
+                return codec.decode(pickle.loads(data))
+
+            found[label] = (dumps, loads)
+    return found
+
+
+def measure(dumps, loads, payloads):
+    started = time.perf_counter()
+    stored = [dumps(payload) for payload in payloads]
+    encoded = time.perf_counter() - started
+    started = time.perf_counter()
+    decoded = [loads(data) for data in stored]
+    elapsed = time.perf_counter() - started
+    assert decoded == payloads
+    return {
+        'bytes_per_entry': round(sum(map(len, stored)) / len(stored), 1),
+        'encode_us': round(encoded / len(payloads) * 1e6, 2),
+        'decode_us': round(elapsed / len(payloads) * 1e6, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--entries', type=int, default=20_000)
+    parser.add_argument('--compress-min-bytes', type=int, default=0,
+                        help="zlib threshold for the +zlib strategies (0 compresses every entry)")
+    parser.add_argument('--output', help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    results = {'msgpack_installed': codec.msgpack is not None, 'entries': args.entries, 'payloads': {}}
+    for name, build in (('registration', registration), ('verification', verification)):
+        payloads = [build(rng, i) for i in range(args.entries)]
+        results['payloads'][name] = {
+            label: measure(dumps, loads, payloads)
+            for label, (dumps, loads) in strategies(args.compress_min_bytes).items()
+        }
+
+    print(f"\n{'payload':<14} {'strategy':<14} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, rows in results['payloads'].items():
+        for label, row in rows.items():
+            print(f"{name:<14} {label:<14} {row['bytes_per_entry']:>8} {row['encode_us']:>10} {row['decode_us']:>10}")
+    if not results['msgpack_installed']:
+        print("\nmsgpack is not installed; only the JSON strategies ran")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Compare import-export's default ModelResource with users.resources.UserResource.
+
+Imports N new candidates into a fresh test database, then re-imports the
+same file with a tenth of the rows changed (updates; the rest are unchanged),
+and reports seconds, rows per second and queries for each resource.
+
+    python tools/bench_user_import.py
+    python tools/bench_user_import.py --users 10000 --output /tmp/import.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from benchmark import QueryCounter, bench_environment  # noqa: E402 (sets Django up)
+
+from django.db import connection
+from import_export import resources
+from tablib import Dataset
+
+from users.models import User
+from users.resources import UserResource
+
+HEADERS = ('email', 'first_name', 'last_name', 'phone', 'passport_id', 'is_bachelor',
+           'total_score', 'cefr_level', 'decision')
+
+
+class DefaultUserResource(resources.ModelResource):
+    """The same columns with import-export's defaults: row by row, one SELECT per row."""
+
+    class Meta:
+        model = User
+        import_id_fields = ('email',)
+        fields = HEADERS
+
+
+def rows(users, rng):
+    return [
+        [f'candidate{i}@example.com', 'Ali', 'Valiyev', f'+99890{i:07d}', f'AA{i:07d}', i % 3 == 0,
+         rng.randrange(80, 230), rng.choice(['A2', 'B1', 'B2', 'C1']), rng.choice(['Pass', 'Fail'])]
+        for i in range(users)
+    ]
+
+
+def changed(data, rng, share=0.1):
+    data = [list(row) for row in data]
+    for row in rng.sample(data, int(len(data) * share)):
+        row[6] = row[6] + 1
+    return data
+
+
+def measure(resource_class, data):
+    counter = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        result = resource_class().import_data(Dataset(*data, headers=HEADERS))
+    elapsed = time.perf_counter() - started
+    assert not result.has_errors() and not result.has_validation_errors()
+    return {
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(len(data) / elapsed),
+        'queries': counter.count,
+        'totals': {kind: n for kind, n in result.totals.items() if n},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--output', help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    first = rows(args.users, rng)
+    second = changed(first, rng)
+    results = {'users': args.users, 'resources': {}}
+    with bench_environment():
+        results['database'] = connection.vendor
+        for label, resource_class in (('default', DefaultUserResource), ('bulk', UserResource)):
+            User.objects.all().delete()
+            print(f"importing {args.users} users with the {label} resource ...", flush=True)
+            results['resources'][label] = {
+                'create': measure(resource_class, first),
+                'reimport': measure(resource_class, second),
+            }
+
+    print(f"\n{'resource':<10} {'pass':<10} {'seconds':>9} {'rows/s':>9} {'queries':>9}  totals")
+    for label, passes in results['resources'].items():
+        for name, row in passes.items():
+            print(f"{label:<10} {name:<10} {row['seconds']:>9} {row['rows_per_second']:>9} "
+                  f"{row['queries']:>9}  {row['totals']}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""Benchmark the API's hot endpoints against a seeded, throwaway database.
+
+Seeds users, test dates and bookings into a fresh test database, then drives
+the endpoints in-process through Django's test client (mail and cache are
+swapped for local in-memory stand-ins) and reports p50/p95/p99 latency,
+throughput and queries per request. Results are written as a JSON baseline
+so two commits can be compared.
+
+    python tools/benchmark.py
+    python tools/benchmark.py --users 5000 --dates 50 --bookings 2000 --requests 200
+    python tools/benchmark.py --compare tools/baselines/<sha>.json
+    python tools/benchmark.py --url http://127.0.0.1:8000 --email me@example.com --password secret
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+# Ensure the project root is on sys.path so `root.settings` can be imported
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'root.settings')
+import django
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases
+from rest_framework_simplejwt.tokens import AccessToken
+
+from app.models import Booking, TestDate
+from users.models import User
+
+BASELINE_DIR = PROJECT_ROOT / 'tools' / 'baselines'
+BENCH_PASSWORD = 'bench-password'
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# -------------------- ENVIRONMENT --------------------
+@contextmanager
+def bench_environment():
+    """Fresh test database plus locmem mail/cache, torn down afterwards."""
+    setup_test_environment(debug=False)
+    # One access line per request would dominate the measurement
+    logging.getLogger('root.requests').setLevel(logging.WARNING)
+    logging.getLogger('users').setLevel(logging.WARNING)
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    if connection.vendor == 'sqlite':
+        # A file, not the shared-cache in-memory default, so concurrent writers behave as in production
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    with override_settings(CACHES=LOCMEM_CACHES):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+# -------------------- SEEDING --------------------
+def seed(users, dates, bookings, batch_size=5000):
+    """Bulk-insert a realistic data set and return the ids the scenarios need."""
+    password = make_password(BENCH_PASSWORD)  # hash once; PBKDF2 per row would dominate seeding
+    User.objects.bulk_create(
+        (
+            User(
+                email=f"user{i}@bench.local",
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                phone=f"+99890{i:07d}",
+                passport_id=f"AB{i:07d}",
+                is_bachelor=i % 3 == 0,
+                password=password,
+            )
+            for i in range(users)
+        ),
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+
+    per_date = -(-bookings // dates) if dates else 0
+    start = date.today() + timedelta(days=1)
+    TestDate.objects.bulk_create(
+        TestDate(date=start + timedelta(days=i), max_spots=per_date + 100) for i in range(dates)
+    )
+    date_ids = list(TestDate.objects.order_by('id').values_list('id', flat=True))
+
+    Booking.objects.bulk_create(
+        (Booking(user_id=user_ids[i], test_date_id=date_ids[i % dates]) for i in range(bookings)),
+        batch_size=batch_size,
+    )
+    return {
+        'booked_user_ids': user_ids[:bookings],
+        'free_user_ids': user_ids[bookings:],
+        'date_ids': date_ids,
+    }
+
+
+# -------------------- MEASUREMENT --------------------
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies, queries, statuses, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+
+
+def run_scenario(call, requests, concurrency):
+    """Run `call(i)` `requests` times over `concurrency` threads.
+
+    `call` returns a status code; latency and the DB queries issued on the
+    calling thread are recorded around it.
+    """
+    latencies, queries, statuses = [], [], []
+    lock = threading.Lock()
+
+    def one(i):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            status = call(i)
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            queries.append(counter.count)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(requests):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+    return summarize(latencies, queries, statuses, time.perf_counter() - started)
+
+
+def _auth(user_id):
+    token = AccessToken.for_user(User(id=user_id))
+    return {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+
+
+def in_process_scenarios(ids, concurrency):
+    client = Client()
+    booked = ids['booked_user_ids'] or ids['free_user_ids']
+    free_users = list(ids['free_user_ids'])
+    random.shuffle(free_users)
+    date_ids = ids['date_ids']
+    # Each thread needs its own client; Client is not thread-safe
+    local = threading.local()
+
+    def thread_client():
+        if not hasattr(local, 'client'):
+            # Count server errors (e.g. "database is locked") instead of aborting the run
+            local.client = Client(raise_request_exception=False)
+        return local.client
+
+    def post_booking(i):
+        user_id = free_users[i % len(free_users)]
+        response = thread_client().post('/api/v1/bookings', {'test_date': date_ids[i % len(date_ids)]},
+                                        **_auth(user_id))
+        return response.status_code
+
+    return {
+        'dates_list': (lambda i: client.get('/api/v1/dates').status_code, 1),
+        'dates_by_day': (lambda i: client.get('/api/v1/dates/by-day').status_code, 1),
+        'bookings_list': (lambda i: client.get('/api/v1/bookings', **_auth(booked[i % len(booked)])).status_code, 1),
+        'bookings_create': (post_booking, concurrency),
+        'login': (lambda i: client.post('/api/v1/users/login', {
+            'email': f"user{i % len(booked)}@bench.local", 'password': BENCH_PASSWORD,
+        }).status_code, 1),
+        'profile': (lambda i: client.get('/api/v1/users/profile', **_auth(booked[i % len(booked)])).status_code, 1),
+    }
+
+
+def http_scenarios(base_url, email=None, password=None):
+    """Scenarios for a running server; authenticated ones need an existing account."""
+    def fetch(path, data=None, token=None):
+        request = urllib.request.Request(base_url.rstrip('/') + path)
+        if data is not None:
+            request.data = json.dumps(data).encode()
+            request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, b''
+
+    scenarios = {'dates_list': (lambda i: fetch('/api/v1/dates')[0], None)}
+    if email and password:
+        credentials = {'email': email, 'password': password}
+        token = json.loads(fetch('/api/v1/users/login', credentials)[1])['access']
+        scenarios['bookings_list'] = (lambda i: fetch('/api/v1/bookings', token=token)[0], None)
+        scenarios['login'] = (lambda i: fetch('/api/v1/users/login', credentials)[0], 1)
+        scenarios['profile'] = (lambda i: fetch('/api/v1/users/profile', token=token)[0], None)
+    return scenarios
+
+
+# -------------------- BASELINES --------------------
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(results, output=None):
+    path = Path(output) if output else BASELINE_DIR / f"{results['revision']}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+    return path
+
+
+def compare(results, baseline_path, threshold):
+    """Print per-scenario deltas against a saved baseline; return the regressed scenarios."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    regressions = []
+    print(f"\nCompared with {baseline['revision']} ({baseline_path}):")
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            flag = ''
+            if change > threshold:
+                flag = '  <-- regression'
+                regressions.append(f"{name}.{metric}")
+            print(f"  {name:<16} {metric:<20} {old:>10} -> {new:<10} {change:+.1f}%{flag}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'scenario':<16} {'reqs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8}  statuses")
+    for name, row in results['scenarios'].items():
+        print(f"{name:<16} {row['requests']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+              f"{row['throughput_rps']:>9} {str(row['queries_per_request']):>8}  {row['statuses']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--dates', type=int, default=300)
+    parser.add_argument('--bookings', type=int, default=30_000)
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8, help="threads for concurrent scenarios")
+    parser.add_argument('--only', nargs='*', help="run only these scenarios")
+    parser.add_argument('--url', help="drive a running server over HTTP instead of the in-process client")
+    parser.add_argument('--email', help="account used for authenticated scenarios with --url")
+    parser.add_argument('--password')
+    parser.add_argument('--output', help="baseline path (default tools/baselines/<git sha>.json)")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args(argv)
+
+    results = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': connection.vendor,
+        'mode': 'http' if args.url else 'in-process',
+        'size': {'users': args.users, 'dates': args.dates, 'bookings': args.bookings},
+        'scenarios': {},
+    }
+
+    def run_all(scenarios):
+        for name, (call, concurrency) in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"running {name} ...", flush=True)
+            results['scenarios'][name] = run_scenario(call, args.requests, concurrency or args.concurrency)
+
+    if args.url:
+        run_all(http_scenarios(args.url, args.email, args.password))
+    else:
+        with bench_environment():
+            started = time.perf_counter()
+            ids = seed(args.users, args.dates, args.bookings)
+            results['seed_seconds'] = round(time.perf_counter() - started, 2)
+            print(f"seeded {args.users} users, {args.dates} dates, {args.bookings} bookings "
+                  f"in {results['seed_seconds']}s")
+            run_all(in_process_scenarios(ids, args.concurrency))
+
+    print_results(results)
+    path = save_results(results, args.output)
+    print(f"\nSaved {path}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
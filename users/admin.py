@@ -1,11 +1,16 @@
 from django.contrib import admin
 from django import forms
 from django.shortcuts import render
+from import_export.admin import ImportExportModelAdmin
+
+from app import jobs
 from users.models import User
+from users.resources import UserResource
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(jobs.ImportJobMixin, ImportExportModelAdmin):
+    resource_classes = [UserResource]
     list_display = (
         'id',
         'first_name',
@@ -19,7 +24,7 @@ class UserAdmin(admin.ModelAdmin):
         'slate_status'
     )
     search_fields = ('first_name', 'last_name', 'email', 'proctor', 'passport_id')
-    list_filter = ('decision', 'payment_status', 'proctor', 'slate_status')
+    list_filter = ('decision', 'results_published', 'payment_status', 'proctor', 'slate_status')
     ordering = ('-id',)
 
     # ---- custom bulk action ----
@@ -27,7 +32,7 @@ class UserAdmin(admin.ModelAdmin):
 
     @admin.action(description="Assign selected users to a specific proctor")
     def assign_proctor(self, request, queryset):
-        """Bulk-assign a proctor name to all selected users."""
+        """Bulk-assign a proctor name to all selected users, in a background job (see app.jobs)."""
         class ProctorForm(forms.Form):
             proctor_name = forms.CharField(label="Proctor name", max_length=100)
 
@@ -35,8 +40,8 @@ class UserAdmin(admin.ModelAdmin):
             form = ProctorForm(request.POST)
             if form.is_valid():
                 proctor_name = form.cleaned_data['proctor_name']
-                updated = queryset.update(proctor=proctor_name)
-                self.message_user(request, f"{updated} users updated with proctor '{proctor_name}'.")
+                jobs.submit_from_admin(self, request, 'assign-proctor', "Proctor assignment queued.",
+                                       user_ids=list(queryset.values_list('pk', flat=True)), proctor=proctor_name)
                 return None
         else:
             form = ProctorForm(initial={'_selected_action': queryset.values_list('id', flat=True)})
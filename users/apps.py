@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # Connects the receiver that drops cached results when they change,
+        # and registers the enrollment-invitations job task for the worker
+        from . import enrollment, results  # noqa: F401
@@ -0,0 +1,91 @@
+"""Compact encoding for cached registration and verification entries.
+
+django-redis pickles values by default, and a pickled registration dict
+spends most of its bytes on class framing and long field names. Entries in
+the namespaces listed in CACHE_CODEC_NAMESPACES are encoded here instead:
+known field names are shortened, the result is written as compact JSON or
+msgpack (when installed), and zlib-compressed when it exceeds
+`compress_min_bytes`.
+
+The first byte records the format, so entries written under one CACHE_CODEC
+setting still decode after it changes:
+
+    J / M   JSON / msgpack
+    j / m   the same, zlib-compressed
+"""
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON is used instead
+    msgpack = None
+
+# Field names of the cached registration and verification payloads
+SHORT_NAMES = {
+    'user': 'u',
+    'activate_code': 'c',
+    'first_name': 'f',
+    'last_name': 'l',
+    'email': 'e',
+    'phone': 'p',
+    'passport_id': 'i',
+    'is_bachelor': 'b',
+    'password': 'w',
+    'is_active': 'a',
+}
+LONG_NAMES = {short: name for name, short in SHORT_NAMES.items()}
+
+JSON, MSGPACK = 'json', 'msgpack'
+_HEADERS = {JSON: b'J', MSGPACK: b'M'}
+_FORMATS = {b'J': JSON, b'M': MSGPACK}
+
+
+def _rename(value, names, strict=False):
+    if isinstance(value, dict):
+        renamed = {}
+        for key, item in value.items():
+            if strict and key in LONG_NAMES:
+                # A real key spelled like a short name would decode as the long one
+                raise ValueError(f"Cache payload key {key!r} clashes with a short field name")
+            renamed[names.get(key, key)] = _rename(item, names, strict)
+        return renamed
+    if isinstance(value, list):
+        return [_rename(item, names, strict) for item in value]
+    return value
+
+
+def available_format(format):
+    """`format`, or JSON when msgpack is asked for but not installed."""
+    return MSGPACK if format == MSGPACK and msgpack is not None else JSON
+
+
+def encode(value, format=JSON, compress_min_bytes=None):
+    """Encode `value` (JSON-compatible data) to bytes."""
+    format = available_format(format)
+    value = _rename(value, SHORT_NAMES, strict=True)
+    if format == MSGPACK:
+        body = msgpack.packb(value, use_bin_type=True)
+    else:
+        body = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+    header = _HEADERS[format]
+    if compress_min_bytes is not None and len(body) >= compress_min_bytes:
+        return header.lower() + zlib.compress(body)
+    return header + body
+
+
+def decode(data):
+    """Reverse `encode`."""
+    header, body = data[:1], data[1:]
+    if header.islower():
+        header, body = header.upper(), zlib.decompress(body)
+    format = _FORMATS.get(header)
+    if format is None:
+        raise ValueError(f"Unknown cache payload header {header!r}")
+    if format == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Cache payload is msgpack-encoded but msgpack is not installed")
+        value = msgpack.unpackb(body, raw=False)
+    else:
+        value = json.loads(body)
+    return _rename(value, LONG_NAMES)
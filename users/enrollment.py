@@ -0,0 +1,195 @@
+"""Bulk enrollment of the candidate lists partner schools send us.
+
+`UserRegisterView` costs a cache write, an SMTP round-trip and an activation
+step per person. `enroll()` takes the whole validated list at once:
+
+- emails, phones and passport_ids are checked against the batch itself and
+  then against the database with one IN query per field, and any conflict
+  rejects the batch with per-row errors (the shape of a `many=True` serializer);
+- supplied passwords are hashed in a pool of ENROLLMENT_PROCESSES spawned
+  processes, since PBKDF2 is the slowest part by far. The pool is started on
+  a process's first large batch and kept, so a web worker pays for spawning
+  it (each worker imports Django) once rather than per request. Candidates
+  without a password get an unusable one and set theirs through the password
+  reset flow;
+- users, and optionally their bookings on one session, are written with
+  bulk_create in one transaction, with the session row locked for the seat check;
+- invitations are an `enrollment-invitations` job (app.jobs) queued in the
+  same transaction; the worker sends them over one SMTP connection,
+  ENROLLMENT_EMAIL_BATCH messages per send_messages call.
+
+bulk_create sends no signals, so the booking receivers' work (stats, results
+analytics, seat events) is done here once per batch.
+"""
+import logging
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from rest_framework.exceptions import ValidationError
+
+from app import analytics, jobs, stats
+from app.events import publish_seat_change
+from app.models import Booking, TestDate
+from app.services import lock_test_date
+from root import metrics
+from users.models import User
+from users.serializers import UNIQUE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Below this many passwords, handing them to the pool costs more than it saves
+POOL_MIN_PASSWORDS = 8
+
+# Hashing pools of this process by size, kept between batches
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def find_conflicts(candidates):
+    """Per-row errors for unique values repeated in the batch or already taken; [] if there are none."""
+    errors = [{} for _ in candidates]
+    for field in UNIQUE_FIELDS:
+        first_row = {}
+        for i, candidate in enumerate(candidates):
+            value = candidate.get(field)
+            if value in (None, ''):
+                continue
+            if value in first_row:
+                errors[i][field] = [f"Same {field} as row {first_row[value] + 1}."]
+            else:
+                first_row[value] = i
+        if not first_row:
+            continue
+        taken = User.objects.filter(**{f'{field}__in': list(first_row)}).values_list(field, flat=True)
+        for value in taken:
+            errors[first_row[value]][field] = [f"A user with this {field} already exists."]
+    return errors if any(errors) else []
+
+
+def password_pool(processes):
+    """This process's pool of `processes` hashing workers, started on first use."""
+    pool = _pools.get(processes)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(processes)
+            if pool is None:
+                pool = _pools[processes] = ProcessPoolExecutor(
+                    processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    return pool
+
+
+def hash_passwords(passwords, processes=None):
+    """make_password() of each password, in the process pool when there are enough of them."""
+    processes = settings.ENROLLMENT_PROCESSES if processes is None else processes
+    if processes <= 1 or len(passwords) < POOL_MIN_PASSWORDS:
+        return [make_password(password) for password in passwords]
+    pool = password_pool(processes)
+    try:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (processes * 4))))
+    except BrokenProcessPool as e:
+        # A worker died (e.g. OOM killed); the next batch starts a fresh pool
+        logger.warning("⚠️ Password hashing pool broke, hashing in-process: %s", e)
+        with _pools_lock:
+            if _pools.get(processes) is pool:
+                del _pools[processes]
+        return [make_password(password) for password in passwords]
+
+
+def enroll(candidates, test_date_id=None, send_invitations=True, processes=None, enrolled_by=None):
+    """Create the validated `candidates` (dicts of User fields, `password` optional) as active users.
+
+    With `test_date_id` each one is also booked on that session, all or
+    none. Raises ValidationError without writing anything on a conflict.
+    Returns the created users and the invitations job (None without invitations).
+    """
+    errors = find_conflicts(candidates)
+    if errors:
+        raise ValidationError({'candidates': errors})
+
+    # Hashed before the transaction opens, so the session row isn't locked meanwhile
+    hashed = iter(hash_passwords([c['password'] for c in candidates if c.get('password')], processes))
+    users = []
+    for candidate in candidates:
+        fields = {field: value for field, value in candidate.items() if field != 'password'}
+        password = next(hashed) if candidate.get('password') else UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30)
+        users.append(User(**fields, password=password, is_active=True))
+
+    try:
+        with transaction.atomic():
+            test_date = None
+            if test_date_id is not None:
+                try:
+                    test_date = lock_test_date(test_date_id)
+                except TestDate.DoesNotExist:
+                    raise ValidationError({'test_date': "Test date not found."})
+                if test_date.spots_left < len(users):
+                    raise ValidationError({'test_date': f"Only {test_date.spots_left} spots left for this date."})
+            User.objects.bulk_create(users, batch_size=settings.IMPORT_BATCH_SIZE)
+            if test_date is not None:
+                Booking.objects.bulk_create([Booking(user=user, test_date=test_date) for user in users],
+                                            batch_size=settings.IMPORT_BATCH_SIZE)
+                # What the Booking save receivers do; new candidates have no attendance, payment or decision yet
+                if not stats.uses_materialized_view():
+                    stats.apply_delta(test_date.pk, booked=len(users))
+                analytics.mark_dirty(test_date_ids=[test_date.pk])
+                publish_seat_change(test_date.pk, -len(users))
+            job = None
+            if send_invitations:
+                job = jobs.submit('enrollment-invitations', enrolled_by, user_ids=[user.pk for user in users],
+                                  test_date_id=test_date_id)
+    except IntegrityError:
+        # Someone registered one of these between the check and the insert
+        raise ValidationError({'candidates': "Some of these candidates were registered meanwhile, please retry."})
+
+    logger.info("🎓 Enrolled %s candidates%s", len(users), f" on {test_date}" if test_date else "")
+    return users, job
+
+
+@jobs.task('enrollment-invitations', shared=True)
+def send_invitations(job, user_ids, test_date_id=None):
+    users = list(User.objects.filter(pk__in=user_ids).order_by('pk'))
+    test_date = TestDate.objects.filter(pk=test_date_id).first() if test_date_id is not None else None
+    jobs.report(job, 0, len(users), message=f"Sending {len(users)} invitations")
+    sent = send_invitation_emails(users, test_date, job=job)
+    jobs.report(job, len(users), message=f"{sent} invitations sent.")
+    return {'sent': sent}
+
+
+def send_invitation_emails(users, test_date=None, job=None):
+    """Mail each user their invitation over one SMTP connection; returns how many were sent.
+
+    With a `job`, progress is reported after each batch.
+    """
+    from_email = f"WUT Team <{settings.EMAIL_HOST_USER}>"
+    messages = []
+    for user in users:
+        html_content = render_to_string('invitation.html', {
+            'user': user, 'test_date': test_date, 'set_password': not user.has_usable_password(),
+        })
+        message = EmailMultiAlternatives("Your WUT M-EPT account", strip_tags(html_content), from_email, [user.email])
+        message.attach_alternative(html_content, "text/html")
+        messages.append(message)
+
+    sent = 0
+    batch_size = settings.ENROLLMENT_EMAIL_BATCH
+    try:
+        with metrics.track_smtp(), get_connection() as connection:
+            for start in range(0, len(messages), batch_size):
+                sent += connection.send_messages(messages[start:start + batch_size]) or 0
+                if job is not None:
+                    jobs.report(job, min(start + batch_size, len(messages)))
+    except Exception as e:
+        logger.error("❌ Invitation emails failed after %s of %s: %s", sent, len(messages), e)
+        raise
+    logger.info("✅ Sent %s invitation emails", sent)
+    return sent
@@ -0,0 +1,252 @@
+"""Locks that keep bulk jobs from running twice at once.
+
+Admin actions and cron commands (results publishing, proctor assignment,
+stats rebuilds, sweeps) can be started from two admin tabs or two hosts;
+wrapping them in a lock makes the second run fail fast instead of
+double-writing:
+
+    with lock('assign-candidates'):
+        ...
+
+    @lock('rebuild-test-date-stats', blocking=True, timeout=30)
+    def rebuild(): ...
+
+LOCK_BACKEND picks the implementation:
+
+    redis     SET NX PX on the default (django-redis) cache. The key expires
+              after LOCK_TTL seconds so a crashed holder can't keep it, and
+              a background thread renews it while the job runs. Each
+              acquisition gets a fencing token from an INCR counter; a
+              holder that stalled past its TTL carries an older token, so
+              writes stamped with it can be told apart from the new holder's.
+    postgres  pg_try_advisory_lock on the default database connection; held
+              until released or the connection closes.
+    file      fcntl.flock on a file in LOCK_DIR; single node only.
+
+Advisory and file locks can't expire under a live holder, so they have no
+renewal and no fencing token (`token` is None).
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from users.models import _redis
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts of a blocking acquire
+RETRY_INTERVAL = 0.1
+
+
+class LockNotAcquired(Exception):
+    """Another run holds the lock."""
+
+
+class Held:
+    """One acquisition: the lock name, its fencing token and the backend's handle."""
+
+    def __init__(self, name, token=None, handle=None):
+        self.name = name
+        self.token = token
+        self.handle = handle
+
+
+# -------------------- BACKENDS --------------------
+class RedisLockBackend:
+    expires = True
+    prefix = 'lock:'
+    # Only the holder (same token) may release or extend the key
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    RENEW = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+             "return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0")
+
+    @property
+    def client(self):
+        client = _redis()
+        if client is None:
+            raise RuntimeError("LOCK_BACKEND='redis' needs the django-redis cache backend")
+        return client
+
+    def acquire(self, name, ttl):
+        client = self.client
+        key = self.prefix + name
+        token = client.incr(f'{key}:fence')
+        if client.set(key, token, nx=True, px=int(ttl * 1000)):
+            return Held(name, token)
+        return None
+
+    def renew(self, held, ttl):
+        return bool(self.client.eval(self.RENEW, 1, self.prefix + held.name, held.token, int(ttl * 1000)))
+
+    def release(self, held):
+        self.client.eval(self.RELEASE, 1, self.prefix + held.name, held.token)
+
+
+class PostgresLockBackend:
+    expires = False
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    @staticmethod
+    def key(name):
+        """The bigint advisory lock key for `name`."""
+        return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+    def _execute(self, sql, name):
+        connection = connections[self.using]
+        if connection.vendor != 'postgresql':
+            raise RuntimeError("LOCK_BACKEND='postgres' needs a PostgreSQL database")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.key(name)])
+            return cursor.fetchone()[0]
+
+    def acquire(self, name, ttl):
+        return Held(name) if self._execute("SELECT pg_try_advisory_lock(%s)", name) else None
+
+    def release(self, held):
+        self._execute("SELECT pg_advisory_unlock(%s)", held.name)
+
+
+class FileLockBackend:
+    expires = False
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory or settings.LOCK_DIR, re.sub(r'[^\w.-]', '_', name) + '.lock')
+
+    def acquire(self, name, ttl):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        # The holder's pid, for whoever finds the file while debugging a stuck job
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return Held(name, handle=fd)
+
+    def release(self, held):
+        try:
+            fcntl.flock(held.handle, fcntl.LOCK_UN)
+        finally:
+            os.close(held.handle)
+
+
+BACKENDS = {
+    'redis': RedisLockBackend,
+    'postgres': PostgresLockBackend,
+    'file': FileLockBackend,
+}
+
+
+def get_backend(name=None):
+    """The backend instance for `name`, LOCK_BACKEND by default."""
+    return BACKENDS[name or settings.LOCK_BACKEND]()
+
+
+# -------------------- LOCK --------------------
+class Lock:
+    """A named lock, usable as a context manager or a decorator.
+
+    Non-blocking by default: a second run raises LockNotAcquired right away.
+    With `blocking=True` it retries until `timeout` seconds (forever if None).
+    Inside the block `token` is the fencing token (redis backend) and `lost`
+    turns True if a renewal found the lock taken over.
+    """
+
+    def __init__(self, name, ttl=None, blocking=False, timeout=None, backend=None):
+        self.name = name
+        self.ttl = ttl or settings.LOCK_TTL
+        self.blocking = blocking
+        self.timeout = timeout
+        self.backend_name = backend
+        self.backend = None
+        self.token = None
+        self._held = None
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._renewer = None
+
+    @property
+    def lost(self):
+        return self._lost.is_set()
+
+    def acquire(self):
+        self.backend = get_backend(self.backend_name)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            held = self.backend.acquire(self.name, self.ttl)
+            if held is not None:
+                break
+            if not self.blocking or (deadline is not None and time.monotonic() >= deadline):
+                raise LockNotAcquired(f"{self.name!r} is already running")
+            time.sleep(RETRY_INTERVAL)
+
+        self._held, self.token = held, held.token
+        self._stop.clear()
+        self._lost.clear()
+        if self.backend.expires:
+            self._renewer = threading.Thread(target=self._renew, name=f'lock-{self.name}', daemon=True)
+            self._renewer.start()
+        logger.info("🔒 Lock %s acquired (token %s)", self.name, self.token)
+        return self
+
+    def release(self):
+        if self._held is None:
+            return
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        held, self._held = self._held, None
+        try:
+            self.backend.release(held)
+        except Exception as e:
+            # An expiring lock frees itself after its TTL anyway
+            logger.warning("Lock %s release failed: %s", self.name, e)
+        logger.info("🔓 Lock %s released", self.name)
+
+    def _renew(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.backend.renew(self._held, self.ttl)
+            except Exception as e:
+                logger.warning("Lock %s renewal failed: %s", self.name, e)
+                continue
+            if not renewed:
+                self._lost.set()
+                logger.error("❌ Lock %s was lost; another run may have taken it over", self.name)
+                return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def __call__(self, func):
+        # A fresh Lock per call, so concurrent calls don't share acquisition state
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with Lock(self.name, self.ttl, self.blocking, self.timeout, self.backend_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def lock(name, ttl=None, blocking=False, timeout=None, backend=None):
+    """A Lock named `name`; see Lock."""
+    return Lock(name, ttl, blocking, timeout, backend)
@@ -0,0 +1,69 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from tablib import Dataset
+
+from users.enrollment import enroll
+from users.serializers import EnrollmentSerializer
+
+FORMATS = {'.csv': 'csv', '.xlsx': 'xlsx', '.xls': 'xls', '.json': 'json'}
+
+
+def _cell(value):
+    # Spreadsheets read numbers (phones, passport numbers) as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return None if value is None else str(value).strip()
+
+
+def _errors(detail):
+    """ValidationError detail as `row N: field: message` lines."""
+    lines = []
+    for key, errors in detail.items():
+        if key == 'candidates' and isinstance(errors, list) and errors and isinstance(errors[0], dict):
+            for row, row_errors in enumerate(errors, start=1):
+                lines += [f"row {row}: {field}: {' '.join(map(str, messages))}" for field, messages in row_errors.items()]
+        else:
+            lines.append(f"{key}: {' '.join(map(str, errors if isinstance(errors, list) else [errors]))}")
+    return lines
+
+
+class Command(BaseCommand):
+    help = ("Enroll a partner school's candidate sheet (CSV/XLSX with first_name, last_name, email and optional "
+            "phone, passport_id, is_bachelor, password columns) as active users.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--test-date', type=int, help="book every candidate on this session (id)")
+        parser.add_argument('--no-invitations', action='store_true', help="don't email the candidates")
+        parser.add_argument('--processes', type=int, help="password hashing processes (default ENROLLMENT_PROCESSES)")
+
+    def handle(self, *args, **options):
+        path = options['file']
+        format = FORMATS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            raise CommandError(f"Unsupported file type: {path} (use {', '.join(FORMATS)})")
+        with open(path, 'rb') as f:
+            content = f.read()
+        dataset = Dataset().load(content.decode('utf-8-sig') if format in ('csv', 'json') else content, format=format)
+
+        candidates = [
+            {column: _cell(value) for column, value in row.items() if column and _cell(value) not in (None, '')}
+            for row in dataset.dict
+        ]
+        serializer = EnrollmentSerializer(data={
+            'candidates': candidates, 'test_date': options['test_date'],
+            'send_invitations': not options['no_invitations'],
+        })
+        try:
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+            users, job = enroll(data['candidates'], data.get('test_date'), data['send_invitations'],
+                                options['processes'])
+        except ValidationError as e:
+            raise CommandError("Nothing was enrolled:\n" + "\n".join(_errors(e.detail)))
+
+        booked = f", booked on session {data['test_date']}" if data.get('test_date') is not None else ""
+        invited = f"; invitations queued as job #{job.pk}" if job is not None else ""
+        self.stdout.write(self.style.SUCCESS(f"Enrolled {len(users)} candidates{booked}{invited}"))
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.2 on 2026-10-18 23:42
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_rename_is_master_user_is_bachelor_remove_user_bio_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.CustomUserManager()),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='username',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='amount_paid',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Total amount paid by user', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='attendance',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='cefr_level',
+            field=models.CharField(blank=True, max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='decision',
+            field=models.CharField(blank=True, choices=[('Pass', 'Pass'), ('Fail', 'Fail'), ('ESL Bridge', 'ESL Bridge'), ('ESL Full', 'ESL Full'), ('Conditional ESL Full', 'Conditional ESL Full'), ('Conditional Pass', 'Conditional Pass')], help_text='Final placement or exam result decision', max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='gvr_score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='listening_score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='payment_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='payment_provider',
+            field=models.CharField(blank=True, choices=[('Payme', 'Payme'), ('Click', 'Click'), ('Xazna', 'Xazna')], help_text='Platform through which payment was made', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='payment_status',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='payment_status_auto',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Failed', 'Failed'), ('Refunded', 'Refunded')], default='Pending', help_text='Payment status synchronized from provider', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='proctor',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='slate_status',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='total_score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='transaction_id',
+            field=models.CharField(blank=True, help_text='Unique transaction ID returned by provider', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='writing_score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
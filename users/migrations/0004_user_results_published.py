@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_managers_remove_user_username_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='results_published',
+            field=models.BooleanField(default=False, help_text='Scores and decision are visible to the candidate'),
+        ),
+    ]
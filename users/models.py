@@ -1,9 +1,14 @@
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
+from django.conf import settings
 from django.core.cache import cache
 from django.db import models
 import threading
 import logging
+import time
+
+from users import codec
+from users.signals import cache_accessed
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +82,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         null=True,
         help_text="Final placement or exam result decision"
     )
+    results_published = models.BooleanField(
+        default=False,
+        help_text="Scores and decision are visible to the candidate"
+    )
 
     # -------------------- PAYMENT INTEGRATION --------------------
     PAYMENT_PROVIDER_CHOICES = [
@@ -140,32 +149,214 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.first_name} {self.last_name}"
 
 
+# -------------------- CACHE --------------------
+# Key namespaces; registration data and verification codes are both keyed by email
+REGISTRATION = 'registration'
+VERIFICATION = 'verification'
+RESULTS = 'results'
+
+# Entries that could not reach the cache: full key -> (value, expires at or None)
 _local_cache = {}
+# During a long outage: once this many entries are kept, expired ones are pruned
+# and then the oldest dropped, down to 90%
+LOCAL_CACHE_MAX_ENTRIES = 10000
 _local_lock = threading.Lock()
 
 
-def getKey(key):
+def _accessed(result, count=1):
+    cache_accessed.send(sender=User, result=result, count=count)
+
+
+def _name(key, namespace):
+    return f"{namespace}:{key}" if namespace else key
+
+
+def _version(namespace):
+    """The namespace's CACHE_KEY_VERSIONS entry; bumping it orphans every key written before."""
+    return settings.CACHE_KEY_VERSIONS.get(namespace)
+
+
+def _full_key(key, namespace):
+    """The key as stored by the backend (prefix, version and name), also used by the local fallback."""
+    return cache.make_key(_name(key, namespace), version=_version(namespace))
+
+
+def _local_get(full_key):
+    entry = _local_cache.get(full_key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at is not None and expires_at <= time.monotonic():
+        del _local_cache[full_key]
+        return None
+    return value
+
+
+def _local_set(full_key, value, timeout):
+    now = time.monotonic()
+    if full_key not in _local_cache and len(_local_cache) >= LOCAL_CACHE_MAX_ENTRIES:
+        for key in [key for key, (_, expires_at) in _local_cache.items()
+                    if expires_at is not None and expires_at <= now]:
+            del _local_cache[key]
+        while len(_local_cache) >= LOCAL_CACHE_MAX_ENTRIES * 0.9:
+            # Dicts keep insertion order
+            del _local_cache[next(iter(_local_cache))]
+    _local_cache[full_key] = (value, now + timeout if timeout else None)
+
+
+def _redis():
+    """The redis-py client behind the default cache (django-redis), or None for other backends."""
+    get_client = getattr(getattr(cache, 'client', None), 'get_client', None)
+    return get_client(write=True) if get_client else None
+
+
+def _dump(value, namespace):
+    """Encode entries of CACHE_CODEC_NAMESPACES with users.codec; others are pickled by the backend."""
+    if namespace not in settings.CACHE_CODEC_NAMESPACES:
+        return value
+    return codec.encode(value, settings.CACHE_CODEC, settings.CACHE_CODEC_COMPRESS_MIN_BYTES)
+
+
+def _load(value, namespace):
+    if value is None or namespace not in settings.CACHE_CODEC_NAMESPACES:
+        return value
+    return codec.decode(value)
+
+
+def getKey(key, namespace=None):
+    try:
+        value = cache.get(_name(key, namespace), version=_version(namespace))
+    except Exception as e:
+        logger.warning("Cache get failed: %s", e)
+        with _local_lock:
+            value = _local_get(_full_key(key, namespace))
+    _accessed('miss' if value is None else 'hit')
+    return _load(value, namespace)
+
+
+def setKey(key, value, timeout=None, namespace=None):
+    _accessed('set')
+    value = _dump(value, namespace)
     try:
-        return cache.get(key)
+        cache.set(_name(key, namespace), value, timeout, version=_version(namespace))
     except Exception as e:
-        logger.warning(f"Cache get failed: {e}")
+        logger.warning("Cache set failed: %s", e)
         with _local_lock:
-            return _local_cache.get(key)
+            _local_set(_full_key(key, namespace), value, timeout)
+
+
+def addKey(key, value, timeout=None, namespace=None):
+    """Like setKey, but only if the key is absent; returns whether it was written."""
+    _accessed('set')
+    value = _dump(value, namespace)
+    try:
+        return cache.add(_name(key, namespace), value, timeout, version=_version(namespace))
+    except Exception as e:
+        logger.warning("Cache add failed: %s", e)
+        with _local_lock:
+            full_key = _full_key(key, namespace)
+            if _local_get(full_key) is not None:
+                return False
+            _local_set(full_key, value, timeout)
+        return True
+
+
+def get_many(keys, namespace=None):
+    """`{key: value}` for the keys found, in one round trip (MGET under django-redis)."""
+    keys = list(keys)
+    names = {_name(key, namespace): key for key in keys}
+    try:
+        found = {names[name]: value for name, value in
+                 cache.get_many(list(names), version=_version(namespace)).items()}
+    except Exception as e:
+        logger.warning("Cache get_many failed: %s", e)
+        with _local_lock:
+            found = {key: value for key in keys
+                     if (value := _local_get(_full_key(key, namespace))) is not None}
+    _accessed('hit', len(found))
+    _accessed('miss', len(keys) - len(found))
+    return {key: _load(value, namespace) for key, value in found.items()}
+
+
+def set_many(mapping, timeout=None, namespace=None):
+    """Write every `{key: value}` in one pipelined round trip."""
+    _accessed('set', len(mapping))
+    mapping = {key: _dump(value, namespace) for key, value in mapping.items()}
+    try:
+        cache.set_many({_name(key, namespace): value for key, value in mapping.items()}, timeout,
+                       version=_version(namespace))
+    except Exception as e:
+        logger.warning("Cache set_many failed: %s", e)
+        with _local_lock:
+            for key, value in mapping.items():
+                _local_set(_full_key(key, namespace), value, timeout)
+
+
+def delete_many(keys, namespace=None):
+    keys = list(keys)
+    if not keys:
+        return
+    try:
+        cache.delete_many([_name(key, namespace) for key in keys], version=_version(namespace))
+    except Exception as e:
+        logger.warning("Cache delete_many failed: %s", e)
+    # Drop fallback copies too, or they would resurface while the cache is down
+    with _local_lock:
+        for key in keys:
+            _local_cache.pop(_full_key(key, namespace), None)
+
+
+def get_and_delete(key, namespace=None):
+    """Read and remove a key in one step, so a one-time code can only be used once.
+
+    Atomic (GET and DEL in one MULTI) under django-redis; other backends read then delete.
+    """
+    full_key = _full_key(key, namespace)
+    try:
+        client = _redis()
+        if client is None:
+            name, version = _name(key, namespace), _version(namespace)
+            value = cache.get(name, version=version)
+            cache.delete(name, version=version)
+        else:
+            pipe = client.pipeline(transaction=True)
+            pipe.get(full_key)
+            pipe.delete(full_key)
+            raw, _ = pipe.execute()
+            value = None if raw is None else cache.client.decode(raw)
+    except Exception as e:
+        logger.warning("Cache get_and_delete failed: %s", e)
+        with _local_lock:
+            value = _local_get(full_key)
+            _local_cache.pop(full_key, None)
+    _accessed('miss' if value is None else 'hit')
+    return _load(value, namespace)
+
 
+def incr(key, delta=1, timeout=None, namespace=None):
+    """Atomically add `delta` to a counter, creating it at 0 (with `timeout`) if missing; returns the new value.
 
-def setKey(key, value, timeout=None):
+    The timeout only applies when the counter is created, so a fixed window
+    (e.g. attempts per 10 minutes) is not extended by each hit.
+    """
+    full_key = _full_key(key, namespace)
     try:
-        cache.set(key, value, timeout)
+        client = _redis()
+        if client is None:
+            name, version = _name(key, namespace), _version(namespace)
+            cache.add(name, 0, timeout, version=version)
+            return cache.incr(name, delta, version=version)
+        pipe = client.pipeline(transaction=True)
+        pipe.set(full_key, 0, nx=True, px=int(timeout * 1000) if timeout else None)
+        pipe.incrby(full_key, delta)
+        return pipe.execute()[1]
     except Exception as e:
-        logger.warning(f"Cache set failed: {e}")
+        logger.warning("Cache incr failed: %s", e)
         with _local_lock:
-            _local_cache[key] = value
-        if timeout:
-            def _expire():
-                import time
-                time.sleep(timeout)
-                with _local_lock:
-                    _local_cache.pop(key, None)
-
-            t = threading.Thread(target=_expire, daemon=True)
-            t.start()
+            value = (_local_get(full_key) or 0) + delta
+            entry = _local_cache.get(full_key)
+            if entry is None:
+                _local_set(full_key, value, timeout)
+            else:
+                _local_cache[full_key] = (value, entry[1])
+        return value
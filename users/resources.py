@@ -0,0 +1,46 @@
+"""Admin import/export of candidates (bulk; see root.resources)."""
+import secrets
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import transaction
+
+from app import analytics, stats
+from app.models import Booking
+from root.resources import BulkModelResource
+from users.models import User
+from users.results import invalidate_results
+
+
+class UserResource(BulkModelResource):
+    """Candidates matched on email, or on passport_id when the email changed.
+
+    New candidates get an unusable password; they set one through the
+    password reset flow.
+    """
+    instance_lookups = (('email',), ('passport_id',))
+
+    class Meta:
+        model = User
+        import_id_fields = ('email',)
+        fields = (
+            'email', 'first_name', 'last_name', 'phone', 'passport_id', 'is_bachelor',
+            'payment_status', 'attendance', 'proctor',
+            'listening_score', 'gvr_score', 'writing_score', 'total_score', 'cefr_level', 'slate_status',
+            'decision', 'results_published',
+        )
+        export_order = fields
+
+    def before_save_instance(self, instance, using_transactions, dry_run):
+        if instance.pk is None and not instance.password:
+            # set_unusable_password(), minus its per-character secrets.choice loop
+            instance.password = UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30)
+
+    def after_bulk_import(self, instances):
+        user_ids = [user.pk for user in instances if user.pk is not None]
+        # What the User save receivers do, for every imported user at once
+        analytics.mark_dirty(user_ids=user_ids)
+        transaction.on_commit(lambda: invalidate_results(user_ids))
+        if not stats.uses_materialized_view():
+            test_date_ids = set(Booking.objects.filter(user__in=user_ids).values_list('test_date_id', flat=True))
+            if test_date_ids:
+                stats.rebuild(test_date_ids)
@@ -0,0 +1,69 @@
+"""Per-user cache of a candidate's published results.
+
+On results day every candidate reloads their results, so the payload lives
+in the `results` cache namespace under the user id: written for a whole
+cohort in one `set_many` when results are published, deleted whenever the
+user's results change, and rebuilt from the DB on a miss. Unpublished results are cached
+too, as `{"published": false}`, so early reloads don't reach the DB either.
+
+A miss can read the DB just before a change commits and write the old
+payload just after its invalidation. Entries rebuilt on a miss therefore
+only live RESULTS_MISS_CACHE_TIMEOUT seconds, and never replace one written
+meanwhile. Deactivating a user drops their entry, and inactive users get no results.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from users.models import RESULTS, User, addKey, delete_many, getKey, set_many
+
+RESULT_FIELDS = ('listening_score', 'gvr_score', 'writing_score', 'total_score', 'cefr_level', 'decision')
+# Saves of these columns drop the user's cached payload
+CACHED_FIELDS = frozenset(RESULT_FIELDS + ('results_published', 'is_active'))
+
+
+def results_payload(values):
+    """The cached payload for a user's `values` (RESULT_FIELDS plus results_published)."""
+    if not values['results_published']:
+        return {'published': False}
+    return {'published': True, **{field: values[field] for field in RESULT_FIELDS}}
+
+
+def get_results(user_id):
+    """The user's results payload, from the cache when possible; None for an unknown or inactive user."""
+    payload = getKey(user_id, namespace=RESULTS)
+    if payload is not None:
+        return payload
+    values = User.objects.filter(pk=user_id, is_active=True).values('results_published', *RESULT_FIELDS).first()
+    if values is None:
+        return None
+    payload = results_payload(values)
+    addKey(user_id, payload, settings.RESULTS_MISS_CACHE_TIMEOUT, namespace=RESULTS)
+    return payload
+
+
+def warm_results(users):
+    """Write the payloads of `users` (dicts or User instances) in one pipelined `set_many`."""
+    payloads = {}
+    for user in users:
+        values = user if isinstance(user, dict) else {
+            field: getattr(user, field) for field in ('id', 'results_published') + RESULT_FIELDS}
+        payloads[values['id']] = results_payload(values)
+    set_many(payloads, settings.RESULTS_CACHE_TIMEOUT, namespace=RESULTS)
+    return len(payloads)
+
+
+def invalidate_results(user_ids):
+    """Drop cached payloads; the next lookup reads the DB again."""
+    delete_many(user_ids, namespace=RESULTS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not CACHED_FIELDS.intersection(update_fields):
+        return
+    # After commit, so a concurrent miss can't re-cache the old values
+    transaction.on_commit(lambda: invalidate_results([instance.pk]))
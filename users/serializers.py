@@ -3,17 +3,24 @@ import logging
 from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.core.mail import EmailMultiAlternatives
+from django.db.models import Q
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from users.models import User, getKey, setKey
+from root import metrics
+from users.models import REGISTRATION, VERIFICATION, User, addKey, getKey, setKey
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# User columns a new registration must not share with an existing user
+UNIQUE_FIELDS = ("email", "phone", "passport_id")
+# Seconds a pending registration waits for its activation code
+REGISTRATION_TIMEOUT = 900
+
 
 # ---------- Helper: Synchronous email sender with proper error handling ----------
 def send_email_sync(subject, text_content, html_content, from_email, recipient):
@@ -24,11 +31,12 @@ def send_email_sync(subject, text_content, html_content, from_email, recipient):
     try:
         msg = EmailMultiAlternatives(subject, text_content, from_email, [recipient])
         msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
-        logger.info(f"✅ Email sent successfully to {recipient}")
+        with metrics.track_smtp():
+            msg.send(fail_silently=False)
+        logger.info("✅ Email sent successfully to %s", recipient)
         return True
     except Exception as e:
-        logger.error(f"❌ Failed to send email to {recipient}: {str(e)}", exc_info=True)
+        logger.error("❌ Failed to send email to %s: %s", recipient, e, exc_info=True)
         return False
 
 
@@ -47,8 +55,41 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             "is_bachelor",
             "password",
         )
+        # Checked together in validate() with one query instead of one UniqueValidator query each
+        extra_kwargs = {field: {"validators": []} for field in UNIQUE_FIELDS}
+
+    def pending(self, email):
+        logger.warning("⚠️ Registration already pending for %s", email)
+        return serializers.ValidationError(
+            {"email": "A registration for this email is already pending. Check your inbox for the activation code."}
+        )
+
+    def check_unique(self, attrs):
+        """Reject an email with a pending registration (cache only), then taken values in one query.
+
+        The pending check only saves the query for repeated submits; validate() claims the email atomically.
+        """
+        if getKey(key=attrs["email"], namespace=REGISTRATION):
+            raise self.pending(attrs["email"])
+
+        values = {field: attrs.get(field) for field in UNIQUE_FIELDS if attrs.get(field)}
+        condition = Q()
+        for field, value in values.items():
+            condition |= Q(**{field: value})
+        errors = {}
+        for row in User.objects.filter(condition).values_list(*values):
+            for field, taken in zip(values, row):
+                if taken == values[field]:
+                    errors[field] = f"A user with this {field} already exists."
+        if errors:
+            raise serializers.ValidationError(errors)
 
     def validate(self, attrs):
+        # Blank values would collide on '' in the nullable unique columns
+        attrs["phone"] = attrs.get("phone") or None
+        attrs["passport_id"] = attrs.get("passport_id") or None
+        self.check_unique(attrs)
+
         activate_code = random.randint(100000, 999999)
 
         # Temporarily store user data in cache (not yet saved to DB)
@@ -57,23 +98,27 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             "last_name": attrs["last_name"],
             "email": attrs["email"],
             "phone": attrs["phone"],
-            "passport_id": attrs.get("passport_id"),
+            "passport_id": attrs["passport_id"],
             "is_bachelor": attrs.get("is_bachelor", False),
             "password": attrs["password"],
             "is_active": False,
         }
 
-        # Cache data for 15 minutes
+        # Cache data for 15 minutes. Only written if no registration is pending for the email,
+        # so of two concurrent requests only one claims it and sends a code
         try:
-            setKey(
+            claimed = addKey(
                 key=attrs["email"],
                 value={"user": user_data, "activate_code": activate_code},
-                timeout=900,
+                timeout=REGISTRATION_TIMEOUT,
+                namespace=REGISTRATION,
             )
-            logger.info(f"📦 Cached registration data for {attrs['email']}")
         except Exception as e:
-            logger.error(f"❌ Failed to cache data for {attrs['email']}: {e}")
+            logger.error("❌ Failed to cache data for %s: %s", attrs['email'], e)
             raise serializers.ValidationError({"error": "Failed to process registration. Please try again."})
+        if not claimed:
+            raise self.pending(attrs["email"])
+        logger.info("📦 Cached registration data for %s", attrs['email'])
 
         # Email setup
         subject = "Activate Your Account"
@@ -83,7 +128,7 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             )
             text_content = strip_tags(html_content)
         except Exception as e:
-            logger.error(f"❌ Failed to render email template: {e}")
+            logger.error("❌ Failed to render email template: %s", e)
             # Fallback to simple text email
             text_content = f"Your activation code is: {activate_code}"
             html_content = f"<p>Your activation code is: <strong>{activate_code}</strong></p>"
@@ -94,12 +139,39 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         email_sent = send_email_sync(subject, text_content, html_content, from_email, attrs["email"])
 
         if not email_sent:
-            logger.warning(f"⚠️ Email failed for {attrs['email']}, but activation code is: {activate_code}")
+            logger.warning("⚠️ Email failed for %s, but activation code is: %s", attrs['email'], activate_code)
             # Still allow registration to proceed, but log the issue
 
         return attrs
 
 
+# -------------------- BULK ENROLLMENT --------------------
+class EnrollmentCandidateSerializer(serializers.Serializer):
+    """One candidate of a bulk enrollment; uniqueness is checked for the whole batch by users.enrollment."""
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100)
+    email = serializers.EmailField(max_length=255)
+    phone = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    passport_id = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    is_bachelor = serializers.BooleanField(default=False)
+    password = serializers.CharField(max_length=150, required=False, allow_blank=True, write_only=True)
+
+    def validate(self, attrs):
+        attrs["email"] = User.objects.normalize_email(attrs["email"])
+        # Blank cells would collide on '' in the nullable unique columns
+        for field in ("phone", "passport_id"):
+            attrs[field] = attrs.get(field) or None
+        return attrs
+
+
+class EnrollmentSerializer(serializers.Serializer):
+    candidates = EnrollmentCandidateSerializer(many=True, allow_empty=False,
+                                               max_length=settings.ENROLLMENT_MAX_CANDIDATES)
+    test_date = serializers.IntegerField(required=False, allow_null=True,
+                                         help_text="Book every candidate on this session (id)")
+    send_invitations = serializers.BooleanField(default=True)
+
+
 # -------------------- ACTIVATION CODE CHECK --------------------
 class CheckActivationCodeSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -109,26 +181,26 @@ class CheckActivationCodeSerializer(serializers.Serializer):
         email = attrs.get("email")
         activate_code = attrs.get("activate_code")
 
-        cache_data = getKey(key=email)
+        cache_data = getKey(key=email, namespace=REGISTRATION)
         if not cache_data:
-            logger.warning(f"⚠️ No cached data found for {email}")
+            logger.warning("⚠️ No cached data found for %s", email)
             raise serializers.ValidationError({"error": "Activation data not found or expired."})
 
         saved_code = cache_data.get("activate_code")
         if str(saved_code) != str(activate_code):
-            logger.warning(f"⚠️ Invalid activation code for {email}")
+            logger.warning("⚠️ Invalid activation code for %s", email)
             raise serializers.ValidationError({"error": "Invalid activation code."})
 
-        logger.info(f"✅ Valid activation code for {email}")
+        logger.info("✅ Valid activation code for %s", email)
         return attrs
 
     def create(self, validated_data):
         email = validated_data["email"]
-        cache_data = getKey(key=email)
+        cache_data = getKey(key=email, namespace=REGISTRATION)
         user_data = cache_data.get("user")
 
         if not user_data:
-            logger.error(f"❌ User data missing for {email}")
+            logger.error("❌ User data missing for %s", email)
             raise serializers.ValidationError({"error": "User data missing or expired."})
 
         user_data["password"] = make_password(user_data["password"])
@@ -136,7 +208,7 @@ class CheckActivationCodeSerializer(serializers.Serializer):
         user.is_active = True
         user.save()
 
-        logger.info(f"✅ User created and activated: {email}")
+        logger.info("✅ User created and activated: %s", email)
         return user
 
 
@@ -168,6 +240,17 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
 
+class UserResultSerializer(serializers.Serializer):
+    """The candidate's results payload (see users.results); scores are absent until published."""
+    published = serializers.BooleanField()
+    listening_score = serializers.IntegerField(required=False, allow_null=True)
+    gvr_score = serializers.IntegerField(required=False, allow_null=True)
+    writing_score = serializers.IntegerField(required=False, allow_null=True)
+    total_score = serializers.IntegerField(required=False, allow_null=True)
+    cefr_level = serializers.CharField(required=False, allow_null=True)
+    decision = serializers.CharField(required=False, allow_null=True)
+
+
 # -------------------- USER MODEL SERIALIZER --------------------
 class UserModelSerializer(serializers.ModelSerializer):
     class Meta:
@@ -201,10 +284,11 @@ class SendVerificationCodeSerializer(serializers.Serializer):
                 key=email,
                 value={"activate_code": verification_code},
                 timeout=600,
+                namespace=VERIFICATION,
             )
-            logger.info(f"📦 Cached verification code for {email}")
+            logger.info("📦 Cached verification code for %s", email)
         except Exception as e:
-            logger.error(f"❌ Failed to cache verification code: {e}")
+            logger.error("❌ Failed to cache verification code: %s", e)
             raise serializers.ValidationError({"error": "Failed to generate verification code."})
 
         subject = "Your Verification Code"
@@ -215,7 +299,7 @@ class SendVerificationCodeSerializer(serializers.Serializer):
             )
             text_content = strip_tags(html_content)
         except Exception as e:
-            logger.error(f"❌ Failed to render template: {e}")
+            logger.error("❌ Failed to render template: %s", e)
             text_content = f"Your verification code is: {verification_code}"
             html_content = f"<p>Your verification code is: <strong>{verification_code}</strong></p>"
 
@@ -224,9 +308,9 @@ class SendVerificationCodeSerializer(serializers.Serializer):
         email_sent = send_email_sync(subject, text_content, html_content, from_email, email)
 
         if email_sent:
-            logger.info(f"✅ Verification email sent to {email}")
+            logger.info("✅ Verification email sent to %s", email)
         else:
-            logger.error(f"❌ Email send failed for {email}. Code: {verification_code}")
+            logger.error("❌ Email send failed for %s. Code: %s", email, verification_code)
 
         return {"email": email, "status": "Verification code sent"}
 
@@ -242,20 +326,20 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
         try:
             user = User.objects.get(email=email)
         except User.DoesNotExist:
-            logger.warning(f"⚠️ Login attempt with non-existent email: {email}")
+            logger.warning("⚠️ Login attempt with non-existent email: %s", email)
             raise serializers.ValidationError({'email': 'User with this email does not exist.'})
 
         if not user.check_password(password):
-            logger.warning(f"⚠️ Invalid password attempt for: {email}")
+            logger.warning("⚠️ Invalid password attempt for: %s", email)
             raise serializers.ValidationError({'password': 'Incorrect password.'})
 
         if not user.is_active:
-            logger.warning(f"⚠️ Login attempt for inactive account: {email}")
+            logger.warning("⚠️ Login attempt for inactive account: %s", email)
             raise serializers.ValidationError({'error': 'Account is not activated yet.'})
 
         refresh = RefreshToken.for_user(user)
 
-        logger.info(f"✅ Successful login: {email}")
+        logger.info("✅ Successful login: %s", email)
 
         return {
             'refresh': str(refresh),
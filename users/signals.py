@@ -0,0 +1,6 @@
+"""Signals sent by the users app."""
+from django.dispatch import Signal
+
+# Sent by the users.models cache helpers with `result` ('hit', 'miss' or 'set')
+# and `count` keys; root.metrics counts them against the current request
+cache_accessed = Signal()
@@ -1,3 +1,487 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+from tablib import Dataset
+
+from app import jobs
+from app.models import TestDate, Booking, Job
+from app.services import publish_results
+from users import codec, enrollment, locks, models as cache_api
+from users.models import REGISTRATION, RESULTS, User, getKey
+from users.resources import UserResource
+from users.results import get_results, results_payload
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEAT_EVENTS_BACKEND='local')
+class ResultsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 6, 1), time=datetime.time(9, 0))
+        cls.user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345',
+                                            listening_score=61, total_score=182, cefr_level='B2', decision='Pass')
+        cls.other = User.objects.create_user('other@example.com', 'Vali', 'Aliyev', password='pass12345',
+                                             total_score=120, decision='Fail')
+        for user in (cls.user, cls.other):
+            Booking.objects.create(user=user, test_date=cls.test_date)
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_results_are_hidden_until_published(self):
+        response = self.client.get('/api/v1/users/results', **self.auth)
+        self.assertEqual(response.json(), {'published': False})
+
+    def test_publishing_warms_the_cohort_and_reads_skip_the_db(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(publish_results(TestDate.objects.filter(pk=self.test_date.pk)), 2)
+        self.assertEqual(getKey(self.other.pk, namespace=RESULTS)['decision'], 'Fail')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/users/results', **self.auth)
+        body = response.json()
+        self.assertTrue(body['published'])
+        self.assertEqual((body['total_score'], body['cefr_level'], body['decision']), (182, 'B2', 'Pass'))
+
+    def test_changing_results_invalidates_the_cache(self):
+        User.objects.filter(pk=self.user.pk).update(results_published=True)
+        self.assertEqual(get_results(self.user.pk)['decision'], 'Pass')
+
+        user = User.objects.get(pk=self.user.pk)
+        user.decision = 'Conditional Pass'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertIsNone(getKey(user.pk, namespace=RESULTS))
+        self.assertEqual(get_results(user.pk)['decision'], 'Conditional Pass')
+
+        # Unrelated saves keep the entry
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        self.assertIsNotNone(getKey(user.pk, namespace=RESULTS))
+
+    def test_an_entry_rebuilt_during_a_change_expires_soon(self):
+        User.objects.filter(pk=self.user.pk).update(results_published=True)
+        stale = results_payload
+
+        def read_then_change(values):
+            # The change commits and invalidates between this miss's read and its write
+            user = User.objects.get(pk=self.user.pk)
+            user.decision = 'Fail'
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+            return stale(values)
+
+        with override_settings(RESULTS_MISS_CACHE_TIMEOUT=0.2), \
+                mock.patch('users.results.results_payload', side_effect=read_then_change):
+            self.assertEqual(get_results(self.user.pk)['decision'], 'Pass')
+        time.sleep(0.3)
+        self.assertEqual(get_results(self.user.pk)['decision'], 'Fail')
+
+    def test_deactivated_users_lose_their_results(self):
+        self.assertEqual(self.client.get('/api/v1/users/results', **self.auth).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['is_active'])
+
+        self.assertEqual(self.client.get('/api/v1/users/results', **self.auth).status_code, 404)
+
+    def test_publishing_does_not_warm_inactive_users(self):
+        User.objects.filter(pk=self.other.pk).update(is_active=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(publish_results(TestDate.objects.filter(pk=self.test_date.pk)), 2)
+
+        self.assertIsNotNone(getKey(self.user.pk, namespace=RESULTS))
+        self.assertIsNone(getKey(self.other.pk, namespace=RESULTS))
+        self.assertIsNone(get_results(self.other.pk))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache_api._local_cache.clear()
+
+    def test_namespaces_keep_same_named_keys_apart(self):
+        cache_api.setKey('a@example.com', {'user': {}}, 60, namespace=cache_api.REGISTRATION)
+        cache_api.setKey('a@example.com', {'activate_code': '1'}, 60, namespace=cache_api.VERIFICATION)
+        self.assertIn('user', cache_api.getKey('a@example.com', namespace=cache_api.REGISTRATION))
+
+    def test_bumping_a_namespace_version_orphans_its_keys(self):
+        cache_api.setKey('a@example.com', 1, 60, namespace=cache_api.REGISTRATION)
+        versions = settings.CACHE_KEY_VERSIONS
+        with self.settings(CACHE_KEY_VERSIONS={**versions, 'registration': versions['registration'] + 1}):
+            self.assertIsNone(cache_api.getKey('a@example.com', namespace=cache_api.REGISTRATION))
+
+    def test_batch_operations(self):
+        cache_api.set_many({1: 'one', 2: 'two'}, 60, namespace='test')
+        self.assertEqual(cache_api.get_many([1, 2, 3], namespace='test'), {1: 'one', 2: 'two'})
+
+        cache_api.delete_many([1], namespace='test')
+        self.assertEqual(cache_api.get_many([1, 2], namespace='test'), {2: 'two'})
+        self.assertEqual(cache_api.get_and_delete(2, namespace='test'), 'two')
+        self.assertIsNone(cache_api.getKey(2, namespace='test'))
+
+        self.assertEqual([cache_api.incr('attempts', timeout=60) for _ in range(3)], [1, 2, 3])
+
+    def test_local_fallback_when_the_cache_is_down(self):
+        down = mock.patch.object(cache, 'set_many', side_effect=ConnectionError('down'))
+        with down, mock.patch.object(cache, 'get_many', side_effect=ConnectionError('down')):
+            cache_api.set_many({'a': 1, 'b': 2}, 60, namespace='test')
+            self.assertEqual(cache_api.get_many(['a', 'b'], namespace='test'), {'a': 1, 'b': 2})
+
+            cache_api.set_many({'c': 3}, 0.01, namespace='test')
+            time.sleep(0.02)
+            self.assertEqual(cache_api.get_many(['c'], namespace='test'), {})
+
+        with mock.patch.object(cache, 'add', side_effect=ConnectionError('down')):
+            self.assertEqual([cache_api.incr('hits', namespace='test') for _ in range(2)], [1, 2])
+
+    def test_local_fallback_stays_bounded(self):
+        down = mock.patch.object(cache, 'set', side_effect=ConnectionError('down'))
+        with down, mock.patch.object(cache_api, 'LOCAL_CACHE_MAX_ENTRIES', 10):
+            for i in range(5):
+                cache_api.setKey(f'expired{i}', i, 0.01, namespace='test')
+            time.sleep(0.02)
+            for i in range(5):
+                cache_api.setKey(f'live{i}', i, 60, namespace='test')
+            # Full: the expired entries go first
+            cache_api.setKey('live5', 5, 60, namespace='test')
+            self.assertEqual(len(cache_api._local_cache), 6)
+
+            for i in range(6, 20):
+                cache_api.setKey(f'live{i}', i, 60, namespace='test')
+            self.assertLessEqual(len(cache_api._local_cache), 10)
+            self.assertIn(cache_api._full_key('live19', 'test'), cache_api._local_cache)
+
+
+class CodecTests(TestCase):
+    payload = {'user': {'first_name': 'Ali', 'email': 'a@example.com', 'is_bachelor': True}, 'activate_code': 123456}
+
+    def test_round_trip_with_short_names(self):
+        data = codec.encode(self.payload)
+        self.assertTrue(data.startswith(b'J{"u":{"f":"Ali"'))
+        self.assertEqual(codec.decode(data), self.payload)
+
+    def test_compresses_from_the_threshold(self):
+        self.assertTrue(codec.encode(self.payload, compress_min_bytes=10).startswith(b'j'))
+        self.assertEqual(codec.decode(codec.encode(self.payload, compress_min_bytes=10)), self.payload)
+        self.assertTrue(codec.encode(self.payload, compress_min_bytes=10_000).startswith(b'J'))
+
+    def test_rejects_keys_that_look_like_short_names(self):
+        with self.assertRaises(ValueError):
+            codec.encode({'u': 1})
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_codec_namespaces_are_stored_encoded(self):
+        cache.clear()
+        cache_api.setKey('a@example.com', self.payload, 60, namespace=cache_api.REGISTRATION)
+        stored = cache.get('registration:a@example.com', version=2)
+        self.assertIsInstance(stored, bytes)
+        self.assertEqual(cache_api.getKey('a@example.com', namespace=cache_api.REGISTRATION), self.payload)
+
+
+class ExpiringFileLockBackend(locks.FileLockBackend):
+    """A file lock that renews like the redis backend; `renewals` says what each renewal reports."""
+    expires = True
+    renewals = []
+
+    def renew(self, held, ttl):
+        self.renewals.append(ttl)
+        return len(self.renewals) < 2
+
+
+class LockTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(CACHES=LOCMEM_CACHES, LOCK_BACKEND='file', LOCK_DIR=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_second_run_is_refused_until_release(self):
+        with locks.lock('import') as held:
+            self.assertIsNone(held.token)
+            with self.assertRaises(locks.LockNotAcquired):
+                locks.lock('import').acquire()
+            # Other names are independent
+            with locks.lock('import/other'):
+                pass
+        with locks.lock('import'):
+            pass
+
+    def test_blocking_acquire_gives_up_after_timeout(self):
+        with locks.lock('import'):
+            started = time.monotonic()
+            with self.assertRaises(locks.LockNotAcquired):
+                locks.lock('import', blocking=True, timeout=0.2).acquire()
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_decorator_takes_the_lock_per_call(self):
+        @locks.lock('import')
+        def job():
+            with self.assertRaises(locks.LockNotAcquired):
+                locks.lock('import').acquire()
+            return 'done'
+
+        self.assertEqual(job(), 'done')
+        self.assertEqual(job(), 'done')
+
+    def test_expiring_locks_are_renewed_and_report_loss(self):
+        ExpiringFileLockBackend.renewals = []
+        with mock.patch.dict(locks.BACKENDS, {'expiring': ExpiringFileLockBackend}):
+            with locks.lock('import', ttl=0.06, backend='expiring') as held:
+                deadline = time.monotonic() + 2
+                while not held.lost and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        self.assertTrue(held.lost)
+        self.assertEqual(ExpiringFileLockBackend.renewals, [0.06, 0.06])
+
+    def test_job_fails_while_another_run_holds_the_lock(self):
+        user = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        job = jobs.submit('assign-proctor', user_ids=[user.pk], proctor='Karimov')
+
+        with locks.lock('assign-proctor'):
+            jobs.run(*jobs.claim(1, 'test'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('already running', job.error)
+        self.assertIsNone(User.objects.get(pk=user.pk).proctor)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEAT_EVENTS_BACKEND='local')
+class UserImportTests(TestCase):
+    headers = ('email', 'first_name', 'last_name', 'phone', 'passport_id', 'total_score', 'decision')
+
+    def dataset(self, rows):
+        return Dataset(*rows, headers=self.headers)
+
+    def import_rows(self, rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = UserResource().import_data(self.dataset(rows))
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        return dict(result.totals)
+
+    def candidates(self, n, start=0):
+        return [(f'c{i}@example.com', 'Ali', 'Valiyev', '', f'AA{i:07d}', 150, 'Pass') for i in range(start, start + n)]
+
+    def test_new_users_are_bulk_created(self):
+        with CaptureQueriesContext(connection) as small:
+            self.import_rows(self.candidates(5))
+        # So the second import queues its own analytics refresh instead of joining the first one's
+        Job.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.import_rows(self.candidates(30, start=5))
+
+        # One prefetch per lookup and one INSERT, whatever the row count
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(User.objects.count(), 35)
+        user = User.objects.get(email='c0@example.com')
+        self.assertIsNone(user.phone)
+        self.assertFalse(user.has_usable_password())
+
+    def test_updates_match_email_then_passport_and_skip_unchanged_rows(self):
+        self.import_rows(self.candidates(3))
+        user = User.objects.get(email='c1@example.com')
+        User.objects.filter(pk=user.pk).update(results_published=True)
+        self.assertEqual(get_results(user.pk)['decision'], 'Pass')
+
+        totals = self.import_rows([
+            ('c0@example.com', 'Ali', 'Valiyev', '', 'AA0000000', 150, 'Pass'),
+            ('c1@example.com', 'Ali', 'Valiyev', '', 'AA0000001', 120, 'Fail'),
+            ('renamed@example.com', 'Ali', 'Valiyev', '', 'AA0000002', 150, 'Pass'),
+        ])
+
+        self.assertEqual((totals['new'], totals['update'], totals['skip']), (0, 2, 1))
+        self.assertEqual(User.objects.get(passport_id='AA0000002').email, 'renamed@example.com')
+        # bulk_update sends no post_save; the resource drops the cached results itself
+        self.assertIsNone(getKey(user.pk, namespace=RESULTS))
+        self.assertEqual(get_results(user.pk)['decision'], 'Fail')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEAT_EVENTS_BACKEND='local',
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ENROLLMENT_PROCESSES=1,
+                   LOCK_BACKEND='file')
+class EnrollmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff@example.com', 'Staff', 'User', password='pass12345', is_staff=True)
+        cls.test_date = TestDate.objects.create(date=datetime.date(2030, 6, 1), time=datetime.time(9, 0), max_spots=3)
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.staff)}'}
+
+    def candidates(self, n):
+        return [{'first_name': 'Ali', 'last_name': 'Valiyev', 'email': f'c{i}@example.com', 'phone': '',
+                 'passport_id': f'AA{i:07d}'} for i in range(n)]
+
+    def post(self, payload, **auth):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/v1/users/bulk-register', payload, content_type='application/json', **auth)
+
+    def run_jobs(self):
+        for job_id in jobs.claim(10, 'test'):
+            self.assertEqual(jobs.run(job_id), Job.DONE)
+
+    def test_staff_only(self):
+        student = User.objects.create_user('student@example.com', 'Ali', 'Valiyev', password='pass12345')
+        response = self.post({'candidates': self.candidates(1)},
+                             HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(student)}')
+        self.assertEqual(response.status_code, 403)
+
+    def test_enrolls_books_and_invites_the_batch(self):
+        candidates = self.candidates(3)
+        candidates[0]['password'] = 'school-pass-1'
+        response = self.post({'candidates': candidates, 'test_date': self.test_date.pk}, **self.auth)
+
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertEqual(response.json()['booked'], 3)
+        users = {user.email: user for user in User.objects.filter(email__startswith='c')}
+        self.assertTrue(users['c0@example.com'].check_password('school-pass-1'))
+        self.assertFalse(users['c1@example.com'].has_usable_password())
+        self.assertTrue(all(user.is_active and user.phone is None for user in users.values()))
+        self.assertEqual(Booking.objects.filter(test_date=self.test_date).count(), 3)
+        self.assertEqual(self.test_date.stats.booked, 3)
+
+        # The request only queued the invitations
+        self.assertEqual(mail.outbox, [])
+        job = Job.objects.get(pk=response.json()['invitations_job'])
+        self.assertEqual((job.name, job.created_by), ('enrollment-invitations', self.staff))
+        # Another school's batch doesn't wait for these invitations
+        enrollment.enroll([{'first_name': 'Vali', 'last_name': 'Aliyev', 'email': 'other@example.com'}])
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.progress, job.total, job.result), (3, 3, {'sent': 3}))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted([*users, 'other@example.com']))
+        self.assertIn('Forgot password', mail.outbox[1].body)
+
+    def test_conflicts_reject_the_whole_batch_with_per_row_errors(self):
+        User.objects.create_user('taken@example.com', 'Vali', 'Aliyev', passport_id='AA0000002')
+        candidates = self.candidates(4)
+        candidates[3]['email'] = 'c0@example.com'
+        for i, candidate in enumerate(candidates):
+            candidate['phone'] = f'+99890{i:07d}'
+
+        # One IN query per unique field, whatever the batch size
+        with self.assertNumQueries(3):
+            errors = enrollment.find_conflicts(candidates)
+        self.assertEqual(errors[2], {'passport_id': ['A user with this passport_id already exists.']})
+        self.assertEqual(errors[3], {'email': ['Same email as row 1.']})
+
+        response = self.post({'candidates': candidates}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['candidates'][3], {'email': ['Same email as row 1.']})
+        self.assertFalse(User.objects.filter(email__startswith='c').exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_a_full_session_rejects_the_batch(self):
+        response = self.post({'candidates': self.candidates(4), 'test_date': self.test_date.pk}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('test_date', response.json())
+        self.assertFalse(User.objects.filter(email__startswith='c').exists())
+
+    def test_passwords_are_hashed_in_a_kept_process_pool(self):
+        self.addCleanup(enrollment._pools.clear)
+        with mock.patch.object(enrollment, 'POOL_MIN_PASSWORDS', 2):
+            hashed = enrollment.hash_passwords(['first-pass', 'second-pass'], processes=2)
+            pool = enrollment._pools[2]
+            self.addCleanup(pool.shutdown)
+            hashed += enrollment.hash_passwords(['third-pass', 'fourth-pass'], processes=2)
+
+        self.assertIs(enrollment._pools[2], pool)
+        for password, encoded in zip(('first-pass', 'second-pass', 'third-pass', 'fourth-pass'), hashed):
+            self.assertTrue(check_password(password, encoded))
+
+    def test_command_enrolls_a_sheet(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("first_name,last_name,email,phone,passport_id\n"
+                    "Ali,Valiyev,c0@example.com,+998901234567,AA0000000\n"
+                    "Vali,Aliyev,c1@example.com,,\n")
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('enroll_candidates', f.name, '--test-date', str(self.test_date.pk), stdout=out)
+
+        self.assertIn('Enrolled 2 candidates', out.getvalue())
+        self.assertIn('invitations queued', out.getvalue())
+        self.assertEqual(User.objects.get(email='c0@example.com').phone, '+998901234567')
+        self.run_jobs()
+        self.assertEqual(len(mail.outbox), 2)
+        with self.assertRaisesMessage(CommandError, 'row 1: email: A user with this email already exists.'):
+            call_command('enroll_candidates', f.name, stdout=out)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RegistrationTests(TestCase):
+    payload = {'first_name': 'Ali', 'last_name': 'Valiyev', 'email': 'new@example.com', 'phone': '+998901234567',
+               'passport_id': 'AA1234567', 'password': 'pass12345'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.existing = User.objects.create_user('taken@example.com', 'Vali', 'Aliyev', phone='+998907654321',
+                                                passport_id='AB7654321')
+
+    def setUp(self):
+        cache.clear()
+
+    def register(self, **fields):
+        return self.client.post('/api/v1/users/register', {**self.payload, **fields})
+
+    def test_an_activation_code_works_once(self):
+        self.register()
+        code = getKey('new@example.com', namespace=REGISTRATION)['activate_code']
+        activate = {'email': 'new@example.com', 'activate_code': code}
+
+        self.assertEqual(self.client.post('/api/v1/users/register-activate-code', activate).status_code, 200)
+        self.assertTrue(User.objects.get(email='new@example.com').is_active)
+        self.assertIsNone(getKey('new@example.com', namespace=REGISTRATION))
+        self.assertEqual(self.client.post('/api/v1/users/register-activate-code', activate).status_code, 400)
+
+    def test_uniqueness_is_checked_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.register()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_conflicts_are_reported_per_field(self):
+        with self.assertNumQueries(1):
+            response = self.register(email='other@example.com', phone='+998907654321', passport_id='AB7654321')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'phone', 'passport_id'})
+        self.assertEqual(mail.outbox, [])
+
+    def test_pending_registration_is_rejected_without_the_database(self):
+        self.register()
+        with self.assertNumQueries(0):
+            response = self.register(phone='+998901111111')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pending', response.json()['email'][0])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_only_one_of_two_concurrent_registrations_sends_a_code(self):
+        # Both pass the pending check before either has written the entry
+        with mock.patch('users.serializers.getKey', return_value=None):
+            first = self.register()
+            second = self.register(phone='+998901111111')
+
+        self.assertEqual((first.status_code, second.status_code), (201, 400))
+        self.assertIn('pending', second.json()['email'][0])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(getKey('new@example.com', namespace=REGISTRATION)['user']['phone'], self.payload['phone'])
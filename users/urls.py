@@ -2,16 +2,19 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 from users.views import (UserRegisterView, CheckActivationCodeGenericAPIView, ResetPasswordView,
-                         ResetPasswordConfirmView, UserUpdateView, SendVerificationCodeAPIView, EmailTokenObtainPairView)
+                         ResetPasswordConfirmView, UserUpdateView, SendVerificationCodeAPIView, EmailTokenObtainPairView,
+                         UserResultsView, BulkEnrollmentView)
 
 urlpatterns = [
     path('register', UserRegisterView.as_view()),
+    path('bulk-register', BulkEnrollmentView.as_view(), name='bulk-register'),
     path('register-activate-code', CheckActivationCodeGenericAPIView.as_view()),
     path('reset-password', ResetPasswordView.as_view()),
     path('reset-password-confirm', ResetPasswordConfirmView.as_view()),
     path('login', EmailTokenObtainPairView.as_view()),
     # path('login-refresh', TokenRefreshView.as_view()),
     path('profile', UserUpdateView.as_view(), name='user-update'),
+    path('results', UserResultsView.as_view(), name='user-results'),
     path("send-verification-code", SendVerificationCodeAPIView.as_view(), name="send-verification-code"),
     # path("check-verification-code", CheckActivationCodePayAPIView.as_view(), name="check-activation-code"),
 ]
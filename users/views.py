@@ -8,21 +8,28 @@ from rest_framework import status
 from rest_framework.generics import CreateAPIView, GenericAPIView
 from rest_framework.generics import RetrieveUpdateDestroyAPIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from root import settings
-from users.models import User, getKey
+from root import metrics, settings
+from root.database import retry_on_db_lock
+from users.enrollment import enroll
+from users.models import REGISTRATION, User, get_and_delete, setKey
+from users.results import get_results
 from users.serializers import (
+    REGISTRATION_TIMEOUT,
     ResetPasswordSerializer,
     ResetPasswordConfirmSerializer,
     UserSerializer,
     SendVerificationCodeSerializer,
     EmailTokenObtainPairSerializer,
+    EnrollmentSerializer,
     UserRegisterSerializer,
     CheckActivationCodeSerializer,
+    UserResultSerializer,
 )
 
 # Initialize logger
@@ -35,14 +42,32 @@ def send_email_with_logging(subject, text_content, html_content, from_email, rec
     try:
         msg = EmailMultiAlternatives(subject, text_content, from_email, [recipient])
         msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
-        logger.info(f"✅ Email sent successfully to {recipient}")
+        with metrics.track_smtp():
+            msg.send(fail_silently=False)
+        logger.info("✅ Email sent successfully to %s", recipient)
         return True
     except Exception as e:
-        logger.error(f"❌ Failed to send email to {recipient}: {str(e)}", exc_info=True)
+        logger.error("❌ Failed to send email to %s: %s", recipient, e, exc_info=True)
         return False
 
 
+# ---------- Helper: Activated user in one transaction, retried if SQLite is locked ----------
+@retry_on_db_lock
+def create_active_user(user_data):
+    user_obj = User.objects.create_user(
+        email=user_data["email"],
+        first_name=user_data["first_name"],
+        last_name=user_data["last_name"],
+        passport_id=user_data.get("passport_id"),
+        phone=user_data.get("phone"),
+        is_bachelor=user_data.get("is_bachelor", False),
+        password=user_data["password"],
+    )
+    user_obj.is_active = True
+    user_obj.save()
+    return user_obj
+
+
 # -------------------- REGISTER VIEW --------------------
 class UserRegisterView(GenericAPIView):
     serializer_class = UserRegisterSerializer
@@ -55,7 +80,7 @@ class UserRegisterView(GenericAPIView):
         response_data = dict(serializer.validated_data)
         response_data.pop("password", None)
 
-        logger.info(f"📧 Registration initiated for {response_data.get('email')}")
+        logger.info("📧 Registration initiated for %s", response_data.get('email'))
 
         return Response(
             {"detail": "Activation email sent successfully.", "data": response_data},
@@ -63,6 +88,36 @@ class UserRegisterView(GenericAPIView):
         )
 
 
+# -------------------- BULK ENROLLMENT VIEW --------------------
+class BulkEnrollmentView(GenericAPIView):
+    """Staff-only: create a partner school's candidates as active users in one go (see users.enrollment).
+
+    The batch is all or nothing: any invalid or already registered
+    candidate rejects it with per-row errors. Candidates are optionally booked
+    on `test_date`; their invitations are queued as a background job.
+    """
+    serializer_class = EnrollmentSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        users, job = enroll(data["candidates"], data.get("test_date"), data["send_invitations"],
+                            enrolled_by=request.user)
+
+        return Response(
+            {
+                "detail": f"{len(users)} candidates enrolled.",
+                "booked": len(users) if data.get("test_date") is not None else 0,
+                "users": [{"id": user.pk, "email": user.email} for user in users],
+                "invitations_job": job.pk if job is not None else None,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
 # -------------------- ACTIVATION CODE CHECK VIEW --------------------
 class CheckActivationCodeGenericAPIView(GenericAPIView):
     """Verify activation code and create active user."""
@@ -75,35 +130,30 @@ class CheckActivationCodeGenericAPIView(GenericAPIView):
         validated = serializer.validated_data
         email = validated["email"]
 
-        cache_data = getKey(key=email)
+        # The serializer checked the code; taking the entry in one step spends it,
+        # so of two concurrent (or replayed) requests only one finds it
+        cache_data = get_and_delete(email, namespace=REGISTRATION)
         if not cache_data:
-            logger.warning(f"⚠️ Activation data expired for {email}")
+            logger.warning("⚠️ Activation data expired for %s", email)
             return Response({"error": "Activation data expired."}, status=status.HTTP_400_BAD_REQUEST)
 
         activate_code = cache_data.get("activate_code")
         user_data = cache_data.get("user")
 
         if str(activate_code) != str(validated["activate_code"]):
-            logger.warning(f"⚠️ Invalid activation code for {email}")
+            # Replaced since the serializer read it; that registration stays pending
+            setKey(email, cache_data, REGISTRATION_TIMEOUT, namespace=REGISTRATION)
+            logger.warning("⚠️ Invalid activation code for %s", email)
             return Response({"error": "Invalid activation code."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Create user
         try:
-            user_obj = User.objects.create_user(
-                email=user_data["email"],
-                first_name=user_data["first_name"],
-                last_name=user_data["last_name"],
-                passport_id=user_data.get("passport_id"),
-                phone=user_data.get("phone"),
-                is_bachelor=user_data.get("is_bachelor", False),
-                password=user_data["password"],
-            )
-            user_obj.is_active = True
-            user_obj.save()
-
-            logger.info(f"✅ User activated successfully: {email}")
+            user_obj = create_active_user(user_data)
+            logger.info("✅ User activated successfully: %s", email)
         except Exception as e:
-            logger.error(f"❌ Failed to create user {email}: {e}")
+            logger.error("❌ Failed to create user %s: %s", email, e)
+            # Nothing was created, so the registration can be activated again
+            setKey(email, cache_data, REGISTRATION_TIMEOUT, namespace=REGISTRATION)
             return Response({"error": "Failed to activate account."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # Issue JWT tokens
@@ -130,7 +180,7 @@ class ResetPasswordView(CreateAPIView):
             try:
                 user = User.objects.get(email=email)
             except User.DoesNotExist:
-                logger.warning(f"⚠️ Password reset attempted for non-existent email: {email}")
+                logger.warning("⚠️ Password reset attempted for non-existent email: %s", email)
                 return Response({"detail": "User not found with this email."}, status=status.HTTP_400_BAD_REQUEST)
 
             activation_code = str(random.randint(100000, 999999))
@@ -139,7 +189,7 @@ class ResetPasswordView(CreateAPIView):
             user.set_password(activation_code)
             user.save()
 
-            logger.info(f"🔐 Password reset initiated for {email}")
+            logger.info("🔐 Password reset initiated for %s", email)
 
             # Send email with activation code
             subject = "Password Reset Confirmation"
@@ -147,7 +197,7 @@ class ResetPasswordView(CreateAPIView):
                 html_content = render_to_string('forget_password.html', {'activation_code': activation_code})
                 text_content = strip_tags(html_content)
             except Exception as e:
-                logger.error(f"❌ Template rendering failed: {e}")
+                logger.error("❌ Template rendering failed: %s", e)
                 text_content = f"Your password reset code is: {activation_code}"
                 html_content = f"<p>Your password reset code is: <strong>{activation_code}</strong></p>"
 
@@ -156,7 +206,7 @@ class ResetPasswordView(CreateAPIView):
             email_sent = send_email_with_logging(subject, text_content, html_content, from_email, email)
 
             if not email_sent:
-                logger.error(f"❌ Password reset email failed for {email}. Code: {activation_code}")
+                logger.error("❌ Password reset email failed for %s. Code: %s", email, activation_code)
                 # Still return success to user for security reasons, but log the code
 
             return Response({"detail": "Password reset code sent to your email."}, status=status.HTTP_200_OK)
@@ -179,21 +229,21 @@ class ResetPasswordConfirmView(CreateAPIView):
             try:
                 user = User.objects.get(email=email)
             except User.DoesNotExist:
-                logger.warning(f"⚠️ Password reset confirm for non-existent email: {email}")
+                logger.warning("⚠️ Password reset confirm for non-existent email: %s", email)
                 return Response({"detail": "User not found with this email."}, status=status.HTTP_400_BAD_REQUEST)
 
             if user.check_password(activation_code):
                 if new_password == confirm_password:
                     user.set_password(new_password)
                     user.save()
-                    logger.info(f"✅ Password reset successfully for {email}")
+                    logger.info("✅ Password reset successfully for %s", email)
                     return Response({"detail": "Password reset successfully."}, status=status.HTTP_200_OK)
                 else:
-                    logger.warning(f"⚠️ Password mismatch for {email}")
+                    logger.warning("⚠️ Password mismatch for %s", email)
                     return Response({"detail": "New password and confirm password do not match."},
                                     status=status.HTTP_400_BAD_REQUEST)
             else:
-                logger.warning(f"⚠️ Invalid reset code for {email}")
+                logger.warning("⚠️ Invalid reset code for %s", email)
                 return Response({"detail": "Invalid activation code."}, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -216,6 +266,25 @@ class UserUpdateView(RetrieveUpdateDestroyAPIView):
         return self.request.user
 
 
+class UserResultsView(GenericAPIView):
+    """The requesting candidate's scores, CEFR level and decision, once published.
+
+    Authenticated from the token claims alone and served from the per-user
+    results cache, so a results-day reload usually touches no table at all.
+    The token of a deactivated user stays valid until it expires, but
+    deactivation drops their cached results and the DB lookup skips inactive users.
+    """
+    serializer_class = UserResultSerializer
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        payload = get_results(request.user.id)
+        if payload is None:
+            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(payload)
+
+
 class SendVerificationCodeAPIView(CreateAPIView):
     serializer_class = SendVerificationCodeSerializer
 
@@ -226,7 +295,7 @@ class SendVerificationCodeAPIView(CreateAPIView):
             try:
                 user = User.objects.get(email=email)
             except User.DoesNotExist:
-                logger.warning(f"⚠️ Verification code requested for non-existent email: {email}")
+                logger.warning("⚠️ Verification code requested for non-existent email: %s", email)
                 return Response({"detail": "User not found with this email."}, status=status.HTTP_400_BAD_REQUEST)
 
             activation_code = str(random.randint(100000, 999999))
@@ -237,7 +306,7 @@ class SendVerificationCodeAPIView(CreateAPIView):
                 html_content = render_to_string('activation.html', {'activation_code': activation_code})
                 text_content = strip_tags(html_content)
             except Exception as e:
-                logger.error(f"❌ Template rendering failed: {e}")
+                logger.error("❌ Template rendering failed: %s", e)
                 text_content = f"Your activation code is: {activation_code}"
                 html_content = f"<p>Your activation code is: <strong>{activation_code}</strong></p>"
 
@@ -246,10 +315,10 @@ class SendVerificationCodeAPIView(CreateAPIView):
             email_sent = send_email_with_logging(subject, text_content, html_content, from_email, email)
 
             if email_sent:
-                logger.info(f"✅ Verification code sent to {email}")
+                logger.info("✅ Verification code sent to %s", email)
                 return Response({"detail": "Activation code sent to your email."}, status=status.HTTP_200_OK)
             else:
-                logger.error(f"❌ Failed to send verification code to {email}. Code: {activation_code}")
+                logger.error("❌ Failed to send verification code to %s. Code: %s", email, activation_code)
                 return Response({"detail": "Failed to send email. Please try again."},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         else: